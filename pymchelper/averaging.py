@@ -17,6 +17,7 @@ Such approach results in a significant reduction of memory usage and is more num
 This module contains several classes for aggregating data from multiple files:
 - Aggregator: base class for all other aggregators
 - WeightedStatsAggregator: for calculating weighted (using weights which not necessarily sums up 1) mean and variance
+- NanWeightedStatsAggregator: as above, but excluding NaN values, for each bin separately
 - ConcatenatingAggregator: for concatenating data
 - SumAggregator: for calculating sum instead of variance
 - NoAggregator: for cases when no aggregation is required
@@ -26,6 +27,13 @@ The `data` property returns the result of the aggregation: mean, sum or concaten
 The `error` property returns the spread of data for WeightedStatsAggregator, and `None` for other aggregators.
 
 The `update` method is used to update the state of the aggregator with new data from the file.
+The `merge` method combines the state of two aggregators, each fed with a different part of the files,
+into the state of an aggregator fed with all of them (first the files of `self`, then those of `other`).
+This way parts of the file list can be aggregated in parallel (i.e. by a pool of processes, see `fromfilelist`).
+Floating point arrays are accumulated at least in double precision, so data read in reduced precision
+(i.e. `float32`, see `dtype` option of `fromfilelist`) does not lose accuracy during aggregation.
+Sums of very many values (i.e. COUNT scorers of thousands of files) and total weights may be accumulated
+with compensated summation (see `compensated` option of the aggregators and `_compensated_add`).
 
 For details on how this method is applied to average binary output of the MC codes,
 see `fromfilelist` method from `input_output.py` module.
@@ -33,11 +41,96 @@ see `fromfilelist` method from `input_output.py` module.
 
 from dataclasses import dataclass, field
 import logging
+import tempfile
 from typing import Union, Optional
 import numpy as np
 from numpy.typing import ArrayLike
 
 
+def _accumulator(value: Union[float, ArrayLike], spill_dir: Optional[str] = None) -> Union[float, ArrayLike]:
+    """
+    Copy of `value` to be used as an accumulator, floating point arrays are promoted at least to double precision.
+    With `spill_dir` given, arrays are copied to disk-backed arrays (see `_disk_array`).
+
+    >>> _accumulator(np.ones(2, dtype=np.float32)).dtype
+    dtype('float64')
+    >>> _accumulator(2)
+    2
+    """
+    if not isinstance(value, np.ndarray):
+        return value
+    dtype = value.dtype
+    if np.issubdtype(dtype, np.floating):
+        dtype = np.promote_types(dtype, np.float64)
+    if spill_dir is not None and value.size > 0:
+        accumulator = _disk_array(spill_dir, value.shape, dtype)
+        np.copyto(accumulator, value)  # converted in buffered chunks, without a full-size temporary
+        return accumulator
+    if dtype != value.dtype:
+        return value.astype(dtype)
+    return value.copy()
+
+
+def _full(shape: tuple, fill_value: float, dtype: np.dtype, spill_dir: Optional[str] = None) -> np.ndarray:
+    """Array filled with `fill_value`, disk-backed (see `_disk_array`) if `spill_dir` is given."""
+    if spill_dir is not None and np.prod(shape) > 0:
+        array = _disk_array(spill_dir, shape, dtype)
+        array.fill(fill_value)
+        return array
+    return np.full(shape, fill_value, dtype=dtype)
+
+
+def _disk_array(spill_dir: str, shape: tuple, dtype: np.dtype) -> np.memmap:
+    """
+    Zero-initialised array stored in an anonymous temporary file in `spill_dir` (out-of-core accumulator).
+    The file is removed by the operating system once the array (memory mapping) is no longer used.
+    Pages of the array are written back to the file by the kernel, so they don't take memory permanently.
+    """
+    with tempfile.TemporaryFile(dir=spill_dir, prefix='pymchelper_') as f:
+        return np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+
+def _compensated_add(total: Union[float, ArrayLike], compensation: Union[float, ArrayLike],
+                     value: Union[float, ArrayLike]) -> tuple:
+    """
+    Add `value` to `total`, accumulating the rounding error in `compensation` (compensated summation).
+    The rounding error of each addition is calculated exactly with Knuth's branch-free TwoSum algorithm
+    (as in Neumaier's variant of Kahan summation, correct also when `value` is larger than `total`),
+    so the operations are vectorised for arrays. The sum is then renormalised: returned `total` is
+    the sum of all values rounded to the floating point type, `compensation` holds the remaining part of it.
+    Returns the new (total, compensation) pair, arrays passed as `compensation` are updated in place.
+
+    >>> total, compensation = 1e16, 0.
+    >>> for _ in range(10):
+    ...     total, compensation = _compensated_add(total, compensation, 1.)
+    >>> total, sum([1e16] + [1.] * 10)
+    (1.000000000000001e+16, 1e+16)
+    """
+    new_total = total + value
+    # TwoSum: new_total + error == total + value exactly
+    value_part = new_total - total
+    compensation += (total - (new_total - value_part)) + (value - value_part)
+    # renormalisation (FastTwoSum), total absorbs the compensation as far as it is representable
+    total = new_total + compensation
+    compensation -= total - new_total
+    return total, compensation
+
+
+def _weight(weight: float) -> float:
+    """Weight as a Python number, so integer weights (i.e. numpy number of primaries) are summed exactly."""
+    return weight.item() if isinstance(weight, np.generic) else weight
+
+
+# arrays are updated in blocks of this number of elements (2 x 512 KiB scratch buffers for double precision)
+_block_size = 64 * 1024
+
+
+def _in_place_update_possible(data: Union[float, ArrayLike], value: Union[float, ArrayLike]) -> bool:
+    """True if `data` accumulator is a contiguous floating point array of the same shape as the `value` array."""
+    return (isinstance(data, np.ndarray) and data.ndim > 0 and np.issubdtype(data.dtype, np.floating)
+            and data.flags.c_contiguous and isinstance(value, np.ndarray) and value.shape == data.shape)
+
+
 @dataclass
 class Aggregator:
     """
@@ -46,15 +139,31 @@ class Aggregator:
     The `error` function returns the spread of data, can be implemented in derived classes. It's a function,
     not a property as different type of error can be calculated (standard deviation, standard error, etc.).
     Type of errors may be then passed in optional keyword arguments `**kwargs`.
+
+    With `spill_dir` set, aggregators keep their state (i.e. mean and variance accumulators) in disk-backed arrays
+    in that directory, instead of the memory (out-of-core aggregation), see `fromfilelist`.
+
+    With `compensated=True` sums (of `SumAggregator`) and total weights (of `WeightedStatsAggregator`)
+    are accumulated with compensated summation, so their rounding error does not grow with the number
+    of updates (see `_compensated_add`), at the cost of a few more operations per update.
     """
 
     data: Union[float, ArrayLike] = float('nan')
     _updated: bool = field(default=False, repr=False, init=False)
+    spill_dir: Optional[str] = field(default=None, kw_only=True)
+    compensated: bool = field(default=False, kw_only=True)
 
     def update(self, value: Union[float, ArrayLike], **kwargs):
         """Update the state of the aggregator with new data."""
         raise NotImplementedError(f"Update function not implemented for {self.__class__.__name__}")
 
+    def merge(self, other: 'Aggregator') -> 'Aggregator':
+        """
+        Update the state of the aggregator with the state of `other` aggregator of the same type,
+        as if all the data passed to `other` was passed to `update` of this one. Returns self.
+        """
+        raise NotImplementedError(f"Merge function not implemented for {self.__class__.__name__}")
+
     def error(self, **kwargs):
         """Default implementation of error function, returns None."""
         logging.debug("Error calculation not implemented for %s", self.__class__.__name__)
@@ -101,6 +210,11 @@ class WeightedStatsAggregator(Aggregator):
     _accumulator_S: Union[float, ArrayLike] = field(default=float('nan'), repr=False, init=False)
     _total_weight_squared: float = field(default=0., repr=False, init=False)
     total_weight: float = 0
+    # rounding errors of the total weights, with compensated summation
+    _total_weight_compensation: float = field(default=0., repr=False, init=False)
+    _total_weight_squared_compensation: float = field(default=0., repr=False, init=False)
+    # scratch buffers of the in-place update, see `_update_in_place`
+    _scratch: Optional[np.ndarray] = field(default=None, repr=False, init=False, compare=False)
 
     def update(self, value: Union[float, ArrayLike], weight: float = 1.0, **kwargs):
         """
@@ -110,27 +224,124 @@ class WeightedStatsAggregator(Aggregator):
         """
         if weight < 0:
             raise ValueError("Weight must be non-negative")
+        weight = _weight(weight)
 
-        # first pass initialization
+        # first pass initialization, arrays are accumulated at least in double precision
+        # (multiplied by 0 in place, not to allocate a temporary, non-finite values are kept as NaN)
         if not self.updated:
-            self.data = value * 0
-            self._accumulator_S = value * 0
+            self.data = _accumulator(value, self.spill_dir)
+            self.data *= 0
+            self._accumulator_S = _accumulator(self.data, self.spill_dir)
 
         # W_n = W_{n-1} + w_n
-        self.total_weight += weight
-        self._total_weight_squared += weight**2
+        self._add_weights(weight, weight**2)
 
-        mean_old = self.data
-        # mu_n = (1 - w_n / W_n) * mu_{n-1} + (w_n / W_n) * x_n
-        # or in other words:
-        # mu_n - mu_{n-1} = (w_n / W_n) * (x_n - mu_{n-1})
-        self.data += (weight / self.total_weight) * (value - mean_old)
+        if _in_place_update_possible(self.data, value):
+            self._update_in_place(np.asarray(value), weight)
+        else:
+            # x_n - mu_{n-1}, calculated before the mean is updated in place
+            # (for arrays `self.data` is modified in place, so we cannot keep a reference to the old mean)
+            delta_old = value - self.data
+            # mu_n = (1 - w_n / W_n) * mu_{n-1} + (w_n / W_n) * x_n
+            # or in other words:
+            # mu_n - mu_{n-1} = (w_n / W_n) * (x_n - mu_{n-1})
+            self.data += (weight / self.total_weight) * delta_old
 
-        self._accumulator_S += weight * (value - self.data) * (value - mean_old)
+            self._accumulator_S += weight * (value - self.data) * delta_old
 
         self._updated = True
         logging.debug("Updated aggregator with value %s and weight %s", value, weight)
 
+    def merge(self, other: 'WeightedStatsAggregator') -> 'WeightedStatsAggregator':
+        """
+        Combine weighted mean and variance of two partial aggregations, see eq. (22) in [2]
+        (Chan et al. pairwise update, extended to weights):
+
+            W = W_A + W_B
+            mu = mu_A + (W_B / W) * (mu_B - mu_A)
+            S = S_A + S_B + (W_A * W_B / W) * (mu_B - mu_A)^2
+
+        >>> a, b, c = WeightedStatsAggregator(), WeightedStatsAggregator(), WeightedStatsAggregator()
+        >>> for value, weight in ((1., 1.), (2., 3.)):
+        ...     a.update(value, weight)
+        ...     c.update(value, weight)
+        >>> for value, weight in ((4., 2.), (8., 2.)):
+        ...     b.update(value, weight)
+        ...     c.update(value, weight)
+        >>> a.merge(b) is a
+        True
+        >>> bool(np.isclose(a.mean, c.mean)), bool(np.isclose(a.variance_sample, c.variance_sample))
+        (True, True)
+        """
+        if not other.updated:
+            return self
+        if not self.updated:
+            self.data = _accumulator(other.data, self.spill_dir)
+            self._accumulator_S = _accumulator(other._accumulator_S, self.spill_dir)
+            self._copy_weights(other)
+            self._updated = True
+            return self
+
+        total_weight = self.total_weight + other.total_weight
+        delta = other.data - self.data
+        if total_weight > 0:
+            self._accumulator_S += other._accumulator_S + (self.total_weight * other.total_weight /
+                                                           total_weight) * delta * delta
+            self.data += (other.total_weight / total_weight) * delta
+        else:
+            self._accumulator_S += other._accumulator_S
+        self._add_weights(other.total_weight, other._total_weight_squared)
+        if self.compensated:
+            self._add_weights(other._total_weight_compensation, other._total_weight_squared_compensation)
+        return self
+
+    def _copy_weights(self, other: 'WeightedStatsAggregator') -> None:
+        """Take the total weights (and their rounding errors) of `other`."""
+        self.total_weight = other.total_weight
+        self._total_weight_squared = other._total_weight_squared
+        self._total_weight_compensation = other._total_weight_compensation
+        self._total_weight_squared_compensation = other._total_weight_squared_compensation
+
+    def _add_weights(self, weight: float, weight_squared: float) -> None:
+        """Add to the total weight and to the sum of squared weights, with compensated summation if requested."""
+        if self.compensated:
+            self.total_weight, self._total_weight_compensation = _compensated_add(
+                self.total_weight, self._total_weight_compensation, weight)
+            self._total_weight_squared, self._total_weight_squared_compensation = _compensated_add(
+                self._total_weight_squared, self._total_weight_squared_compensation, weight_squared)
+        else:
+            self.total_weight += weight
+            self._total_weight_squared += weight_squared
+
+    def _update_in_place(self, value: np.ndarray, weight: float) -> None:
+        """
+        Array version of the update above, evaluating the same expressions in the same order (so the results
+        are identical), but without full-size temporaries: the arrays are processed in blocks of `_block_size`
+        elements, using two scratch buffers of that size, which stay in the CPU cache.
+        This way the memory needed by the update is only the mean and the S accumulator (not ~6 page sizes),
+        and each block of the data is read from the main memory once.
+        """
+        scale = weight / self.total_weight
+        if self._scratch is None:
+            self._scratch = np.empty((2, min(_block_size, self.data.size)), dtype=self.data.dtype)
+        data = self.data.reshape(-1)
+        accumulator_S = self._accumulator_S.reshape(-1)
+        value = value.reshape(-1)
+        for start in range(0, data.size, _block_size):
+            block = slice(start, start + _block_size)
+            size = min(_block_size, data.size - start)
+            delta_old, term = self._scratch[0, :size], self._scratch[1, :size]
+            # delta_old = x_n - mu_{n-1}
+            np.subtract(value[block], data[block], out=delta_old)
+            # mu_n = mu_{n-1} + (w_n / W_n) * delta_old
+            np.multiply(scale, delta_old, out=term)
+            data[block] += term
+            # S_n = S_{n-1} + w_n * (x_n - mu_n) * delta_old
+            np.subtract(value[block], data[block], out=term)
+            np.multiply(weight, term, out=term)
+            term *= delta_old
+            accumulator_S[block] += term
+
     @property
     def mean(self) -> Union[float, ArrayLike]:
         """Weighted mean of the sample"""
@@ -176,6 +387,46 @@ class WeightedStatsAggregator(Aggregator):
         """
         return self.stddev * np.sqrt(self._total_weight_squared) / self.total_weight
 
+    @property
+    def total_weight_squared(self) -> float:
+        """Sum of squared weights of all updates"""
+        return self._total_weight_squared
+
+    @classmethod
+    def from_error(cls, mean: ArrayLike, error: ArrayLike, error_type: str, total_weight: float,
+                   total_weight_squared: float, **kwargs) -> 'WeightedStatsAggregator':
+        """
+        Aggregator in the state of the aggregation which gave the `mean` and the `error` (of `error_type`,
+        `stddev` or `stderr`, see `error`) with the given total weight and sum of squared weights.
+        The S accumulator is calculated back from the error, so merging the aggregator (see `merge`)
+        with others gives the same mean and variance as the aggregation of all the data (up to rounding),
+        i.e. when files with averaged results (see `SHBinaryWriter`) are averaged again.
+        Other keyword arguments (`spill_dir`, `compensated`) are passed to the constructor.
+
+        >>> a = WeightedStatsAggregator()
+        >>> for value, weight in ((1., 1.), (2., 3.), (4., 2.)):
+        ...     a.update(value, weight)
+        >>> b = WeightedStatsAggregator.from_error(a.mean, a.error(error_type='stderr'), 'stderr', a.total_weight,
+        ...                                        a.total_weight_squared)
+        >>> bool(np.isclose(b.mean, a.mean)), bool(np.isclose(b.variance_sample, a.variance_sample))
+        (True, True)
+        """
+        aggregator = cls(**kwargs)
+        aggregator.data = _accumulator(np.asarray(mean), aggregator.spill_dir)
+        # updated in place, so disk-backed accumulators are not copied to memory
+        accumulator_S = _accumulator(np.asarray(error), aggregator.spill_dir)
+        if error_type == 'stderr':
+            # stderr = stddev * sqrt(sum w_i^2) / sum w_i
+            accumulator_S *= total_weight / np.sqrt(total_weight_squared)
+        # S = stddev^2 * (W - sum w_i^2 / W), see `variance_sample`
+        np.square(accumulator_S, out=accumulator_S)
+        accumulator_S *= total_weight - total_weight_squared / total_weight
+        aggregator._accumulator_S = accumulator_S
+        aggregator.total_weight = _weight(total_weight)
+        aggregator._total_weight_squared = _weight(total_weight_squared)
+        aggregator._updated = True
+        return aggregator
+
     def error(self, **kwargs) -> Optional[Union[float, ArrayLike]]:
         """
         Error calculation function, can be used to calculate standard deviation or standard error.
@@ -183,41 +434,332 @@ class WeightedStatsAggregator(Aggregator):
         For other values or if the keyword argument is not present, None is returned.
         """
         logging.debug("Calculating error with kwargs: %s", kwargs)
-        if 'error_type' in kwargs:
-            if kwargs['error_type'] == 'stddev':
-                return self.stddev
-            if kwargs['error_type'] == 'stderr':
-                return self.stderr
-        return None
+        if kwargs.get('error_type') not in ('stddev', 'stderr'):
+            return None
+        if isinstance(self._accumulator_S, np.memmap):
+            return self._error_out_of_core(kwargs['error_type'])
+        if kwargs['error_type'] == 'stddev':
+            return self.stddev
+        return self.stderr
+
+    def _error_out_of_core(self, error_type: str) -> np.memmap:
+        """
+        Error of disk-backed accumulators, calculated block by block into a disk-backed array
+        (with the same formulas as `stddev` and `stderr`, so the results are identical).
+        """
+        if self.total_weight <= 0:
+            raise ValueError("Total weight must be positive")
+        error = _disk_array(self.spill_dir, self._accumulator_S.shape, self._accumulator_S.dtype)
+        error_1d = error.reshape(-1)
+        for start in range(0, error_1d.size, _block_size):
+            block = slice(start, start + _block_size)
+            error_1d[block] = np.sqrt(self._variance_sample_of(block))
+            if error_type == 'stderr':
+                error_1d[block] *= np.sqrt(self._total_weight_squared)
+                error_1d[block] /= self.total_weight
+        return error
+
+    def _variance_sample_of(self, block: slice) -> np.ndarray:
+        """`variance_sample` of the `block` of bins (of the flattened arrays)."""
+        return self._accumulator_S.reshape(-1)[block] / (self.total_weight -
+                                                         (self._total_weight_squared / self.total_weight))
+
+
+@dataclass
+class NanWeightedStatsAggregator(WeightedStatsAggregator):
+    """
+    Weighted mean and variance as calculated by `WeightedStatsAggregator`, but with NaN values excluded,
+    separately for each bin: the mean and the S accumulator of a bin are updated only with its valid values,
+    and the total weight and sum of squared weights of its valid values are kept per bin.
+    Bins without any valid value have NaN mean. This way the data is aggregated in a single pass,
+    with memory usage independent of the number of updates (see `fromfilelist` with `nan=True`).
+
+    The standard error is calculated with the total weights of all updates, also of those with NaN values
+    (for equal weights: standard deviation of the valid values divided by square root of the number of updates).
+
+    >>> aggregator = NanWeightedStatsAggregator()
+    >>> for value in ([1., np.nan, np.nan], [3., 5., np.nan]):
+    ...     aggregator.update(np.array(value))
+    >>> aggregator.mean
+    array([ 2.,  5., nan])
+    >>> aggregator.error(error_type='stddev')
+    array([1.41421356,        nan,        nan])
+    """
+
+    _valid_weight: Union[float, ArrayLike] = field(default=float('nan'), repr=False, init=False)
+    _valid_weight_squared: Union[float, ArrayLike] = field(default=float('nan'), repr=False, init=False)
+
+    def update(self, value: Union[float, ArrayLike], weight: float = 1.0, **kwargs):
+        """Update the state of the aggregator with new data, NaN values are skipped."""
+        if weight < 0:
+            raise ValueError("Weight must be non-negative")
+        weight = _weight(weight)
+        value = np.asarray(value)
+
+        # first pass initialization, bins are NaN until their first valid value
+        if not self.updated:
+            dtype = np.promote_types(value.dtype, np.float64)
+            self.data = _full(value.shape, np.nan, dtype, self.spill_dir)
+            self._accumulator_S = _full(value.shape, 0, dtype, self.spill_dir)
+            self._valid_weight = _full(value.shape, 0, np.float64, self.spill_dir)
+            self._valid_weight_squared = _full(value.shape, 0, np.float64, self.spill_dir)
+
+        self._add_weights(weight, weight**2)
+
+        # same formulas as in `WeightedStatsAggregator.update`, with the per-bin weights of valid values,
+        # evaluated in blocks, so the temporaries are small
+        data, accumulator_S = self.data.reshape(-1), self._accumulator_S.reshape(-1)
+        valid_weight, valid_weight_squared = self._valid_weight.reshape(-1), self._valid_weight_squared.reshape(-1)
+        value = value.reshape(-1)
+        for start in range(0, data.size, _block_size):
+            block = slice(start, start + _block_size)
+            value_block, mean, S = value[block], data[block], accumulator_S[block]
+            W, W2 = valid_weight[block], valid_weight_squared[block]
+            valid = ~np.isnan(value_block)
+            first = valid & (W == 0)
+            rest = valid & ~first
+            W[valid] += weight
+            W2[valid] += weight**2
+            # mu_1 = x_1
+            mean[first] = value_block[first]
+            # mu_n = mu_{n-1} + (w_n / W_n) * (x_n - mu_{n-1})
+            delta_old = value_block[rest] - mean[rest]
+            mean[rest] += (weight / W[rest]) * delta_old
+            # S_n = S_{n-1} + w_n * (x_n - mu_n) * (x_n - mu_{n-1})
+            S[rest] += weight * (value_block[rest] - mean[rest]) * delta_old
+
+        self._updated = True
+        logging.debug("Updated NaN-aware aggregator with value %s and weight %s", value, weight)
+
+    def merge(self, other: 'NanWeightedStatsAggregator') -> 'NanWeightedStatsAggregator':
+        """
+        Combine the states of two partial aggregations, for each bin as in `WeightedStatsAggregator.merge`
+        (with the weights of valid values of the bin).
+
+        >>> a, b, c = NanWeightedStatsAggregator(), NanWeightedStatsAggregator(), NanWeightedStatsAggregator()
+        >>> for aggregator, value in ((a, [1., np.nan]), (a, [2., np.nan]), (b, [4., 5.]), (b, [np.nan, 8.])):
+        ...     aggregator.update(np.array(value))
+        ...     c.update(np.array(value))
+        >>> a.merge(b) is a
+        True
+        >>> bool(np.allclose(a.mean, c.mean)), bool(np.allclose(a.variance_sample, c.variance_sample))
+        (True, True)
+        """
+        if not other.updated:
+            return self
+        if not self.updated:
+            for name in ('data', '_accumulator_S', '_valid_weight', '_valid_weight_squared'):
+                setattr(self, name, _accumulator(getattr(other, name), self.spill_dir))
+            self._copy_weights(other)
+            self._updated = True
+            return self
+
+        data, accumulator_S = self.data.reshape(-1), self._accumulator_S.reshape(-1)
+        valid_weight, valid_weight_squared = self._valid_weight.reshape(-1), self._valid_weight_squared.reshape(-1)
+        other_data, other_S = other.data.reshape(-1), other._accumulator_S.reshape(-1)
+        other_weight, other_weight_squared = other._valid_weight.reshape(-1), other._valid_weight_squared.reshape(-1)
+        for start in range(0, data.size, _block_size):
+            block = slice(start, start + _block_size)
+            mean, S, W = data[block], accumulator_S[block], valid_weight[block]
+            other_mean, other_S_block, other_W = other_data[block], other_S[block], other_weight[block]
+            only_other = (W == 0) & (other_W > 0)
+            mean[only_other] = other_mean[only_other]
+            S[only_other] = other_S_block[only_other]
+            both = (W > 0) & (other_W > 0)
+            total_weight = W[both] + other_W[both]
+            delta = other_mean[both] - mean[both]
+            S[both] += other_S_block[both] + (W[both] * other_W[both] / total_weight) * delta * delta
+            mean[both] += (other_W[both] / total_weight) * delta
+            W += other_W
+            valid_weight_squared[block] += other_weight_squared[block]
+        self._add_weights(other.total_weight, other._total_weight_squared)
+        if self.compensated:
+            self._add_weights(other._total_weight_compensation, other._total_weight_squared_compensation)
+        return self
+
+    @property
+    def variance_population(self) -> Union[float, ArrayLike]:
+        """Biased estimate of the variance, NaN for bins without valid values"""
+        if not self.updated:
+            raise ValueError("No data to calculate variance")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._accumulator_S / self._valid_weight
+
+    @property
+    def variance_sample(self) -> Union[float, ArrayLike]:
+        """Unbiased estimate of the variance, NaN for bins with less than two valid values"""
+        if not self.updated:
+            raise ValueError("No data to calculate variance")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._accumulator_S / (self._valid_weight - (self._valid_weight_squared / self._valid_weight))
+
+    def _variance_sample_of(self, block: slice) -> np.ndarray:
+        W, W2 = self._valid_weight.reshape(-1)[block], self._valid_weight_squared.reshape(-1)[block]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._accumulator_S.reshape(-1)[block] / (W - (W2 / W))
 
 
 @dataclass
 class ConcatenatingAggregator(Aggregator):
-    """Class for concatenating numpy arrays"""
+    """
+    Class for concatenating numpy arrays (i.e. phase space data of many files).
+
+    Arrays passed to `update` are collected and concatenated only once, on first access to `data`
+    (concatenating on each update would copy all the data collected so far, O(N^2) copies for N files,
+    and would briefly keep two copies of it in memory).
+
+    With `spill_dir` set, the arrays are not kept in memory, instead they are appended to an anonymous temporary file
+    in that directory (removed when no longer used), `data` is then a read-only memory-mapped view of the file.
+    This way memory usage stays bounded (i.e. when concatenated data is written by `MCPLWriter`, which writes it
+    in chunks), regardless of the number of files. Spilled data is stored in the type of the first array.
+    Aggregators sent to other processes (see `merge`) take the data with them, in memory.
+
+    >>> aggregator = ConcatenatingAggregator()
+    >>> for value in (np.arange(2.), np.arange(3.)):
+    ...     aggregator.update(value)
+    >>> aggregator.data
+    array([0., 1., 0., 1., 2.])
+    """
+
+    @property
+    def updated(self) -> bool:
+        # checked without concatenating the data
+        return self._updated
+
+    @property
+    def data(self) -> Union[float, ArrayLike]:
+        """Concatenated data, NaN if there was no update yet."""
+        if self._spill_file is not None:
+            if self._spilled_view is None:
+                self._spill_file.flush()
+                if self._spilled_size == 0:
+                    self._spilled_view = np.empty(0, dtype=self._spilled_dtype)
+                else:
+                    self._spilled_view = np.memmap(self._spill_file,
+                                                   dtype=self._spilled_dtype,
+                                                   mode='r',
+                                                   shape=(self._spilled_size, ))
+            return self._spilled_view
+        if not self._chunks:
+            return float('nan')
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    @data.setter
+    def data(self, value: Union[float, ArrayLike]) -> None:
+        # NaN is the initial value set by the constructor, meaning no data
+        self._chunks = [] if isinstance(value, float) and np.isnan(value) else [value]
+        self._spill_file = None
+        self._spilled_view = None
 
     def update(self, value: Union[float, ArrayLike], **kwargs):
         """Update the state of the aggregator with new data."""
-        if not self.updated:
-            self.data = value
+        if self.spill_dir is None:
+            self._chunks.append(value)
         else:
-            self.data = np.concatenate((self.data, value))
+            if self._spill_file is None:
+                self._start_spill(np.asarray(value).dtype)
+            np.ascontiguousarray(value, dtype=self._spilled_dtype).tofile(self._spill_file)
+            self._spilled_size += np.size(value)
+            self._spilled_view = None
         self._updated = True
 
+    def _start_spill(self, dtype: np.dtype) -> None:
+        """Open the spill file and move the data collected so far (i.e. after unpickling) into it."""
+        chunks, self._chunks = self._chunks, []
+        self._spill_file = tempfile.TemporaryFile(dir=self.spill_dir, prefix='pymchelper_concat_')
+        self._spilled_dtype = np.result_type(dtype, *chunks)
+        self._spilled_size = 0
+        for chunk in chunks:
+            self.update(chunk)
+
+    def __getstate__(self) -> dict:
+        # open spill file can't be pickled, its data is sent instead (and spilled again on next update)
+        state = dict(self.__dict__)
+        if self._spill_file is not None:
+            state.update(_chunks=[np.array(self.data)], _spill_file=None, _spilled_view=None)
+        return state
+
+    def merge(self, other: 'ConcatenatingAggregator') -> 'ConcatenatingAggregator':
+        """Append the data concatenated by `other` to the data of this aggregator."""
+        if other.updated:
+            self.update(other.data)
+        return self
+
 
 @dataclass
 class SumAggregator(Aggregator):
-    """Class for calculating sum of a sequence of numbers."""
+    """
+    Class for calculating sum of a sequence of numbers.
+
+    With `compensated=True` floating point sums are accumulated with compensated summation
+    (see `_compensated_add`), arrays are updated in blocks, so the temporaries are small.
+
+    >>> plain, compensated = SumAggregator(), SumAggregator(compensated=True)
+    >>> for value in [1.] + [1e-16] * 10:
+    ...     plain.update(value)
+    ...     compensated.update(value)
+    >>> plain.data, compensated.data
+    (1.0, 1.000000000000001)
+    """
+
+    # rounding error of the sum, with compensated summation
+    _compensation: Union[float, ArrayLike] = field(default=0., repr=False, init=False)
+    # scratch buffers of the in-place compensated update, see `_compensated_add_in_place`
+    _scratch: Optional[np.ndarray] = field(default=None, repr=False, init=False, compare=False)
 
     def update(self, value: Union[float, ArrayLike], **kwargs):
         """Update the state of the aggregator with new data."""
-        # first value added
+        # first value added, arrays are copied as the sum is accumulated in place
+        # and the input may be a read-only (i.e. memory-mapped) array
         if not self.updated:
-            self.data = value
+            self.data = _accumulator(value, self.spill_dir)
+            if self.compensated and isinstance(self.data, np.ndarray):
+                self._compensation = _full(self.data.shape, 0, self.data.dtype, self.spill_dir)
         # subsequent values added
-        else:
+        elif not self.compensated or not np.issubdtype(np.result_type(self.data), np.floating):
             self.data += value
+        elif _in_place_update_possible(self.data, value):
+            self._compensated_add_in_place(value)
+        else:
+            self.data, self._compensation = _compensated_add(self.data, self._compensation, value)
         self._updated = True
 
+    def _compensated_add_in_place(self, value: np.ndarray) -> None:
+        """
+        Array version of `_compensated_add`, evaluating the same operations (so the results are identical),
+        in blocks of `_block_size` elements, with three scratch buffers of that size instead of temporaries.
+        """
+        if self._scratch is None:
+            self._scratch = np.empty((3, min(_block_size, self.data.size)), dtype=self.data.dtype)
+        data, compensation, value = self.data.reshape(-1), self._compensation.reshape(-1), value.reshape(-1)
+        for start in range(0, data.size, _block_size):
+            block = slice(start, start + _block_size)
+            size = min(_block_size, data.size - start)
+            new_total, value_part, error = self._scratch[0, :size], self._scratch[1, :size], self._scratch[2, :size]
+            total, block_compensation, block_value = data[block], compensation[block], value[block]
+            np.add(total, block_value, out=new_total)
+            # TwoSum: error = (total - (new_total - value_part)) + (value - value_part)
+            np.subtract(new_total, total, out=value_part)
+            np.subtract(new_total, value_part, out=error)
+            np.subtract(total, error, out=error)
+            np.subtract(block_value, value_part, out=value_part)
+            error += value_part
+            block_compensation += error
+            # renormalisation: total = new_total + compensation, compensation -= total - new_total
+            np.add(new_total, block_compensation, out=total)
+            np.subtract(total, new_total, out=new_total)
+            block_compensation -= new_total
+
+    def merge(self, other: 'SumAggregator') -> 'SumAggregator':
+        """Add the sum calculated by `other` to the sum of this aggregator."""
+        if other.updated:
+            self.update(other.data)
+            if self.compensated and other.compensated:
+                self.update(other._compensation)
+        return self
+
 
 @dataclass
 class NoAggregator(Aggregator):
@@ -233,3 +775,9 @@ class NoAggregator(Aggregator):
             logging.debug("Setting data to %s", value)
             self.data = value
         self._updated = True
+
+    def merge(self, other: 'NoAggregator') -> 'NoAggregator':
+        """Keep the data of this aggregator, or take the data of `other` if this one was not updated."""
+        if other.updated:
+            self.update(other.data)
+        return self
@@ -102,6 +102,36 @@ class MeshAxis(namedtuple('MeshAxis', 'n min_val max_val name unit binning')):
         else:
             return None
 
+    def subaxis(self, start: int, stop: int) -> 'MeshAxis':
+        """
+        Axis consisting of bins from `start` (inclusive) to `stop` (exclusive) of this axis.
+
+        >>> x = MeshAxis(n=10, min_val=0.0, max_val=10.0, name="X", unit="cm", binning=MeshAxis.BinningType.linear)
+        >>> x.subaxis(2, 5)
+        MeshAxis(n=3, min_val=2.0, max_val=5.0, name='X', unit='cm', binning=<BinningType.linear: 0>)
+
+        For logarithmic binning bin edges are spaced geometrically:
+        >>> x = MeshAxis(n=3, min_val=1.0, max_val=64.0, name="X", unit="cm", binning=MeshAxis.BinningType.logarithmic)
+        >>> x.subaxis(1, 2).data
+        array([8.])
+        """
+        if not 0 <= start < stop <= self.n:
+            raise ValueError("Invalid bin range [{:d}, {:d}) for axis with {:d} bins".format(start, stop, self.n))
+        if self.binning == self.BinningType.logarithmic:
+            q = (self.max_val / self.min_val)**(1.0 / self.n)
+            min_val = self.min_val * q**start
+            max_val = self.min_val * q**stop
+        else:
+            bin_width = (self.max_val - self.min_val) / self.n
+            min_val = self.min_val + start * bin_width
+            max_val = self.min_val + stop * bin_width
+        # keep original edges exact, if they are part of the selected range
+        if start == 0:
+            min_val = self.min_val
+        if stop == self.n:
+            max_val = self.max_val
+        return self._replace(n=stop - start, min_val=min_val, max_val=max_val)
+
 
 class AxisId(IntEnum):
     x = 0
@@ -0,0 +1,226 @@
+"""
+Persistent on-disk cache of parsed (and merged) estimators.
+
+Reading (and averaging) of the same, immutable simulation outputs is often repeated, i.e. by notebooks
+or reruns of `convertmc`. With a cache directory given (see `cache_dir` option of `fromfile`, `fromfilelist`
+and `--cache-dir` option of `convertmc`), the resulting estimator is saved in the cache and later reads
+of the same files (with the same options) load it back instead of parsing the files again.
+
+Cache entries are keyed by the path, size and modification time of all input files, version of pymchelper
+and the reading options which affect the result (i.e. page selection, error type, dtype).
+Each entry is a directory holding the estimator and page metadata as JSON document (`estimator.json`,
+with the same encoding as the partial aggregates, see `pymchelper.partial`) and page data and errors saved
+as `.npy` files. Nothing is unpickled when loading, so the cache directory may be shared with other users.
+On load the data is memory-mapped (read-only, as with `mmap=True`), so loading takes almost no time
+regardless of the data size.
+
+Cache size is limited, least recently used entries are removed once the total size exceeds the limit.
+Entries are written to a temporary directory first and then renamed, so concurrent processes
+never see partially written entries. Entries removed by other processes in the meantime are skipped.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import pymchelper
+from pymchelper.estimator import Estimator
+from pymchelper.partial import _decode, _encode, _metadata_from_state, _metadata_state
+from pymchelper.readers.archive import split_archive_path
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.readers.sources import InputSource, is_path
+
+logger = logging.getLogger(__name__)
+
+default_max_size = 4 * 1024**3  # 4 GiB
+
+_metadata_filename = 'estimator.json'
+
+format_version = 1
+
+
+def _source_key(source: InputSource) -> Optional[tuple]:
+    """Absolute path, size and modification time of the file, None for sources other than files."""
+    if not is_path(source):
+        return None
+    archive, member = split_archive_path(source)
+    try:
+        stat = os.stat(archive or source)
+    except OSError:
+        return None
+    return os.path.abspath(archive or source), member, stat.st_size, stat.st_mtime_ns
+
+
+def _option_key(value: Any) -> Any:
+    """
+    Canonical (stable between runs) representation of an option value, raises TypeError if there is none.
+
+    >>> _option_key(PageSelection(index={2, 0}, box=(slice(0, 10), )))
+    (None, None, [0, 2], ((0, 10),))
+    >>> _option_key(np.float32)
+    '<f4'
+    """
+    if isinstance(value, PageSelection):
+        if value.predicate is not None:
+            raise TypeError("Page selection with a predicate cannot be cached")
+        return (None if value.dettyp is None else sorted(int(dettyp) for dettyp in value.dettyp),
+                None if value.name is None else sorted(value.name),
+                None if value.index is None else sorted(value.index),
+                None if value.box is None else tuple((s.start, s.stop) for s in value.box))
+    if isinstance(value, type) and issubclass(value, np.generic):
+        return np.dtype(value).str
+    if isinstance(value, np.dtype):
+        return value.str
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError("Option value {!r} cannot be cached".format(value))
+
+
+def metadata_state(estimator: Estimator) -> Dict[str, Any]:
+    """
+    JSON representation of the estimator without page data and errors, see `metadata_from_state`.
+    TypeError is raised if the estimator holds attributes which cannot be saved.
+    """
+    return {
+        'format': format_version,
+        'number_of_primaries': _encode(estimator.number_of_primaries),
+        'file_counter': _encode(estimator.file_counter),
+        'file_corename': _encode(estimator.file_corename),
+        'estimator': _metadata_state(estimator),
+    }
+
+
+def metadata_from_state(state: Dict[str, Any]) -> Estimator:
+    """Estimator with pages (without data) rebuilt from the metadata saved by `metadata_state`."""
+    if state.get('format') != format_version:
+        raise ValueError("Unsupported format {} of cache entry".format(state.get('format')))
+    estimator = _metadata_from_state(state['estimator'])
+    estimator.number_of_primaries = _decode(state['number_of_primaries'])
+    estimator.file_counter = _decode(state['file_counter'])
+    estimator.file_corename = _decode(state['file_corename'])
+    return estimator
+
+
+class EstimatorCache:
+    """
+    Cache of estimators in the `directory`, holding at most `max_size` bytes.
+
+    >>> import tempfile
+    >>> cache = EstimatorCache(tempfile.mkdtemp())
+    >>> cache.key([b'not a file'], {}) is None
+    True
+    """
+
+    def __init__(self, directory: str, max_size: int = default_max_size) -> None:
+        self.directory: str = directory
+        self.max_size: int = max_size
+
+    def key(self, sources: List[InputSource], options: Dict[str, Any]) -> Optional[str]:
+        """Cache key of the estimator read from `sources` with `options`, None if it cannot be cached."""
+        source_keys = [_source_key(source) for source in sources]
+        if any(source_key is None for source_key in source_keys):
+            logger.debug("Not caching data read from other sources than files")
+            return None
+        try:
+            option_keys = sorted((name, _option_key(value)) for name, value in options.items())
+        except TypeError as e:
+            logger.debug("Not caching: %s", e)
+            return None
+        description = repr((pymchelper.__version__, source_keys, option_keys))
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def load(self, key: str) -> Optional[Estimator]:
+        """Estimator saved under `key`, with memory-mapped page data, or None if there is no such entry."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(os.path.join(entry_path, _metadata_filename), encoding='utf-8') as f:
+                estimator = metadata_from_state(json.load(f))
+            for page_no, page in enumerate(estimator.pages):
+                page.data_raw = np.load(os.path.join(entry_path, f'data_{page_no}.npy'), mmap_mode='r')
+                error_path = os.path.join(entry_path, f'error_{page_no}.npy')
+                if os.path.exists(error_path):
+                    page.error_raw = np.load(error_path, mmap_mode='r')
+            os.utime(entry_path)  # mark as recently used
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # missing entry, removed by other process in the meantime, or not written by this version
+            logger.debug("Cache miss for %s: %s", key, e)
+            return None
+        logger.info("Loaded estimator from cache %s", entry_path)
+        return estimator
+
+    def store(self, key: str, estimator: Estimator) -> bool:
+        """Save the estimator under `key` and remove the least recently used entries if the cache is too large."""
+        entry_path = self._entry_path(key)
+        try:
+            metadata = json.dumps(metadata_state(estimator))
+        except TypeError as e:
+            logger.debug("Estimator not saved in cache: %s", e)
+            return False
+        # unique per process and thread, as the same estimator may be stored concurrently
+        tmp_path = '{:s}.{:d}.{:d}.tmp'.format(entry_path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(tmp_path)
+            for page_no, page in enumerate(estimator.pages):
+                np.save(os.path.join(tmp_path, f'data_{page_no}.npy'), np.asarray(page.data_raw), allow_pickle=False)
+                if page.error_raw is not None:
+                    np.save(os.path.join(tmp_path, f'error_{page_no}.npy'), np.asarray(page.error_raw),
+                            allow_pickle=False)
+            with open(os.path.join(tmp_path, _metadata_filename), 'w', encoding='utf-8') as f:
+                f.write(metadata)
+            os.rename(tmp_path, entry_path)
+        except OSError as e:
+            # i.e. entry already saved by other process, or no space left on the device
+            logger.debug("Estimator not saved in cache %s: %s", entry_path, e)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+        logger.info("Saved estimator in cache %s", entry_path)
+        self.evict(keep=key)
+        return True
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove least recently used entries (other than `keep`) until the cache fits in `max_size`."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    if entry.is_dir():
+                        entries.append((entry.stat().st_mtime_ns, _directory_size(entry.path), entry.name))
+                except OSError:
+                    # entry removed (or renamed) by other process in the meantime
+                    continue
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if name == keep:
+                continue
+            logger.info("Removing least recently used cache entry %s", name)
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            total_size -= size
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _directory_size(path: str) -> int:
+    """Total size of files in the directory `path`, files removed while scanning are skipped."""
+    size = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_file():
+                    size += entry.stat().st_size
+            except OSError:
+                continue
+    return size
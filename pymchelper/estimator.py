@@ -131,6 +131,9 @@ def average_with_nan(estimator_list: List[Estimator],
                      error_estimate: ErrorEstimate = ErrorEstimate.stderr) -> Optional[Estimator]:
     """
     Calculate average estimator object, excluding malformed data (NaN) from averaging.
+    Mean and spread are calculated in double precision, also for data stored as `float32`.
+    All estimators are needed at once, `fromfilelist` with `nan=True` calculates the same in a single pass
+    over the files (see `pymchelper.averaging.NanWeightedStatsAggregator`).
     :param estimator_list:
     :param error_estimate:
     :return:
@@ -141,7 +144,9 @@ def average_with_nan(estimator_list: List[Estimator],
     result = copy.deepcopy(estimator_list[0])
     result.number_of_primaries = sum(estimator.number_of_primaries for estimator in estimator_list)
     for page_no, page in enumerate(result.pages):
-        page.data_raw = np.nanmean([estimator.pages[page_no].data_raw for estimator in estimator_list], axis=0)
+        page.data_raw = np.nanmean([estimator.pages[page_no].data_raw for estimator in estimator_list],
+                                   axis=0,
+                                   dtype=np.float64)
     result.file_counter = len(estimator_list)
     if result.file_counter > 1 and error_estimate != ErrorEstimate.none:
         # s = stddev = sqrt(1/(n-1)sum(x-<x>)**2)
@@ -149,6 +154,7 @@ def average_with_nan(estimator_list: List[Estimator],
         for page_no, page in enumerate(result.pages):
             page.error_raw = np.nanstd([estimator.pages[page_no].data_raw for estimator in estimator_list],
                                        axis=0,
+                                       dtype=np.float64,
                                        ddof=1)
 
         # if user requested standard error then we calculate it as:
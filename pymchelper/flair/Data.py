@@ -62,6 +62,7 @@ import struct
 import pymchelper.flair.common.fortran as fortran
 import pymchelper.flair.common.bmath as bmath
 from pymchelper.flair.common.log import say
+from pymchelper.readers.compressed import open_input
 
 __author__ = "Vasilis Vlachoudis"
 __email__ = "Vasilis.Vlachoudis@cern.ch"
@@ -118,7 +119,7 @@ class Usrxxx:
         """Read header information, and return the file handle"""
         self.reset()
         self.file = filename
-        f = open(self.file, "rb")
+        f = open_input(self.file)
 
         # Read header
         data = fortran.read(f)
@@ -163,7 +164,7 @@ class Usrxxx:
     # ----------------------------------------------------------------------
     def readData(self, det):
         """Read detector det data structure"""
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         fortran.skip(f)  # Skip header
         for _ in range(2 * det):
             fortran.skip(f)  # Detector Header & Data
@@ -179,7 +180,7 @@ class Usrxxx:
         """Read detector det statistical data"""
         if self.statpos < 0:
             return None
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         f.seek(self.statpos)
         for _ in range(det):
             fortran.skip(f)  # Detector Data
@@ -276,7 +277,7 @@ class Resnuclei(Usrxxx):
     # ----------------------------------------------------------------------
     def readData(self, n):
         """Read detector det data structure"""
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         fortran.skip(f)
         if self.evol:
             fortran.skip(f)
@@ -304,7 +305,7 @@ class Resnuclei(Usrxxx):
         """Read detector det statistical data"""
         if self.statpos < 0:
             return None
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         f.seek(self.statpos)
 
         f.seek(self.statpos)
@@ -431,7 +432,7 @@ class Usrbdx(Usrxxx):
     # ----------------------------------------------------------------------
     def readData(self, n):
         """Read detector n data structure"""
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         fortran.skip(f)
         for i in range(n):
             fortran.skip(f)  # Detector Header
@@ -453,7 +454,7 @@ class Usrbdx(Usrxxx):
         """Read detector n statistical data"""
         if self.statpos < 0:
             return None
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         f.seek(self.statpos)
         for i in range(n):
             for j in range(7):
@@ -562,7 +563,7 @@ class UsrTrack(Usrxxx):
     # ----------------------------------------------------------------------
     def readData(self, n):
         """Read detector n data structure"""
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         fortran.skip(f)
         for i in range(n):
             fortran.skip(f)  # Detector Header
@@ -584,7 +585,7 @@ class UsrTrack(Usrxxx):
         """Read detector n statistical data"""
         if self.statpos < 0:
             return None
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         f.seek(self.statpos)
         for i in range(n):
             fortran.skip(f)  # Detector Data
@@ -687,7 +688,7 @@ class Usrbin(Usrxxx):
     # ----------------------------------------------------------------------
     def readData(self, n):
         """Read detector det data structure"""
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         fortran.skip(f)
         for _ in range(n):
             fortran.skip(f)  # Detector Header
@@ -704,7 +705,7 @@ class Usrbin(Usrxxx):
         """Read detector n statistical data"""
         if self.statpos < 0:
             return None
-        f = open(self.file, "rb")
+        f = open_input(self.file)
         f.seek(self.statpos)
         for _ in range(n):
             fortran.skip(f)  # Detector Data
@@ -759,7 +760,7 @@ class Mgdraw:
         self.reset()
         self.file = filename
         try:
-            self.hnd = open(self.file, "rb")
+            self.hnd = open_input(self.file)
         except IOError:
             self.hnd = None
         return self.hnd
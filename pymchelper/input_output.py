@@ -2,18 +2,31 @@ from enum import IntEnum
 import logging
 import gc
 import os
-from collections import defaultdict
-from glob import glob
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import groupby
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
 
-from pymchelper.averaging import (Aggregator, SumAggregator, WeightedStatsAggregator, ConcatenatingAggregator,
-                                  NoAggregator)
-from pymchelper.estimator import ErrorEstimate, Estimator, average_with_nan
+import numpy as np
+from numpy.typing import DTypeLike
+
+from pymchelper.averaging import (Aggregator, SumAggregator, WeightedStatsAggregator, NanWeightedStatsAggregator,
+                                  ConcatenatingAggregator, NoAggregator)
+from pymchelper.cache import EstimatorCache
+from pymchelper.estimator import ErrorEstimate, Estimator
+from pymchelper import partial as partial_aggregate
+from pymchelper.readers.archive import expand_pattern
 from pymchelper.readers.topas import TopasReaderFactory
-from pymchelper.readers.fluka import FlukaReader, FlukaReaderFactory
-from pymchelper.readers.shieldhit.general import SHReaderFactory
+from pymchelper.readers.fluka import FlukaReader
+from pymchelper.readers.shieldhit.layout import LayoutReader
 from pymchelper.readers.shieldhit.reader_base import SHReader
+from pymchelper.readers.shieldhit.reader_bdo2019 import SHFollowerBDO2019
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.readers.sniffer import sniff_reader
+from pymchelper.readers.sources import InputSource, input_source
 from pymchelper.writers.common import Converters
 
 logger = logging.getLogger(__name__)
@@ -40,25 +53,40 @@ class AggregationType(IntEnum):
     Concatenation = 4
 
 
-def guess_reader(filename: str) -> Optional[object]:
+def guess_reader(filename: InputSource,
+                 mmap: bool = False,
+                 lazy: bool = False,
+                 selection: Optional[PageSelection] = None,
+                 index_file: bool = False,
+                 read_chunks: int = 1) -> Optional[object]:
     """
     Guess a reader based on file contents or extensions.
-    In some cases (i.e. binary SHIELD-HIT12A files) access to file contents is needed.
-    :param filename:
+    Only the first bytes of the file are read, reader class is cached for files on disk,
+    see `pymchelper.readers.sniffer`.
+    :param filename: path, binary file-like object or buffer (file-like objects which cannot seek are read at once)
+    :param mmap: if True, SHIELD-HIT12A readers memory-map data blocks instead of reading them
+    :param lazy: if True, SHIELD-HIT12A and Fluka readers read only metadata, page data is read on first access
+    :param selection: pages (and sub-mesh) to be read by SHIELD-HIT12A readers, by default all pages are read
+    :param index_file: if True, SHIELD-HIT12A BDO readers use (and create) the `.idx` token index sidecar
+    :param read_chunks: number of chunks in which SHIELD-HIT12A and Fluka readers read large data blocks in parallel
     :return: Instantiated reader object
     """
     reader = None
-    fluka_reader = FlukaReaderFactory(filename).get_reader()
-    if fluka_reader:
-        reader = fluka_reader(filename)
+    filename = input_source(filename)
+    reader_cls = sniff_reader(filename)
+    if reader_cls is None:
+        pass
+    elif issubclass(reader_cls, FlukaReader):
+        reader = reader_cls(filename, lazy=lazy, read_chunks=read_chunks)
+    elif issubclass(reader_cls, SHReader):
+        reader = reader_cls(filename,
+                            mmap=mmap,
+                            lazy=lazy,
+                            selection=selection,
+                            index_file=index_file,
+                            read_chunks=read_chunks)
     else:
-        sh_reader = SHReaderFactory(filename).get_reader()
-        if sh_reader:
-            reader = sh_reader(filename)
-        else:
-            topas_reader = TopasReaderFactory(filename).get_reader()
-            if topas_reader:
-                reader = topas_reader(filename)
+        reader = reader_cls(filename)
     return reader
 
 
@@ -69,13 +97,22 @@ def guess_corename(filename: str) -> Optional[str]:
     :param filename:
     :return: the corename of the file (i.e. the basename without the running number for averaging)
     """
+    if partial_aggregate.is_partial_aggregate(filename):
+        return partial_aggregate.corename(filename)
     corename = FlukaReader(filename).corename
     if corename is None:
         corename = SHReader(filename).corename
     return corename
 
 
-def fromfile(filename: str) -> Optional[Estimator]:
+def fromfile(filename: InputSource,
+             mmap: bool = False,
+             lazy: bool = False,
+             selection: Optional[PageSelection] = None,
+             index_file: bool = False,
+             dtype: Optional[DTypeLike] = None,
+             cache_dir: Optional[str] = None,
+             read_chunks: int = 1) -> Optional[Estimator]:
     """
     Read estimator data from a binary file `filename`
     Note that for the in some cases the data are post-processes (i.e. normalized) after reading.
@@ -83,122 +120,574 @@ def fromfile(filename: str) -> Optional[Estimator]:
     which are normalized by the number of primaries after by the Reader responsible for parsing binary files.
     This way dose and fluence (and other similar quantities) are saved in Estimator as "per primary" values.
     Fluka on the other hand saves dose and fluence as "per primary" values, so no normalization is needed.
-    """
 
-    reader = guess_reader(filename)
+    Compressed files (`.gz`, `.xz`, `.bz2` or `.zst`, i.e. `dose_0001.bdo.gz` or `run_fort.21.gz`) are
+    decompressed while being read, no temporary files are created (see `pymchelper.readers.compressed`).
+    The same holds for members of tar or zip archives, given as `<archive>::<member>`,
+    i.e. `results.tar::run_1/dose_0001.bdo` (see `pymchelper.readers.archive`).
+
+    Instead of a filename a binary file-like object (i.e. `sys.stdin.buffer`) or a buffer (`bytes`, `memoryview`)
+    can be given, see `pymchelper.readers.sources`. File type is then recognized only by the file contents.
+
+    With `mmap=True` data blocks of SHIELD-HIT12A files are not read into memory, `Page.data_raw` is then
+    a read-only `np.memmap` view of the file (copied only when the data needs to be normalised).
+    Compressed files and archive members cannot be memory-mapped, their data blocks are always read.
+
+    With `lazy=True` the estimator, its axes and all page metadata are built from the file headers alone,
+    data of each page is read from the file on first access to `Page.data_raw` (or `Page.data`).
+    This is useful when only metadata (i.e. `number_of_primaries`, `dettyp` or axis shapes) is needed.
+
+    With `selection` only pages matching the selection are read from SHIELD-HIT12A files,
+    optionally cut to a box of bins, i.e. to read only first 10 bins along Z axis of dose pages:
+
+        selection = PageSelection(dettyp={SHDetType.dose}, box=(slice(None), slice(None), slice(10)))
+        fromfile("dose.bdo", selection=selection)
+
+    Data of not selected pages (and bins outside the box) is not read from the file at all.
+
+    With `index_file=True` offsets of all tokens of a BDO file are saved on first read in the `<filename>.idx`
+    sidecar (keyed by file size and modification time). Subsequent reads of the same file take the offsets
+    from the sidecar, instead of walking the whole token stream.
+
+    With `dtype` page data and errors are stored in the given type, i.e. `dtype=np.float32` halves the memory
+    taken by the pages (and the size of HDF, sparse and JSON output files). Data is converted after being read
+    and normalised, for lazy pages when it is loaded. Single precision keeps about 7 significant digits,
+    so relative differences up to ~6e-8 with respect to the default (`float64`) data are expected.
+    Values smaller than ~1e-38 in magnitude are flushed to zero, values above ~3e38 become infinite.
+
+    With `cache_dir` the estimator is saved in the on-disk cache in this directory and loaded from there
+    on next reads of the same, unchanged file with the same options (see `pymchelper.cache`).
+    Page data loaded from the cache is memory-mapped (read-only). Lazy reads are served from the cache,
+    but their results are not saved in it, as that would require reading all the data.
+
+    With `read_chunks` > 1 large data blocks (several GB 3D meshes) of SHIELD-HIT12A and Fluka USRBIN files
+    are read in that many chunks by a pool of threads, with `os.pread` directly into the page data array
+    (see `pymchelper.readers.compressed.pread_array`). A single read call keeps just one request in flight,
+    parallel file systems (Lustre, GPFS) and NVMe drives deliver much higher throughput with many of them.
+    Data blocks smaller than 8 MiB, compressed files and archive members are read as usual.
+    """
+    cache = EstimatorCache(cache_dir) if cache_dir is not None else None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key([filename], {'selection': selection, 'dtype': _dtype_key(dtype)})
+    if cache_key is not None:
+        estimator = cache.load(cache_key)
+        if estimator is not None:
+            return estimator
+
+    reader = guess_reader(filename,
+                          mmap=mmap,
+                          lazy=lazy,
+                          selection=selection,
+                          index_file=index_file,
+                          read_chunks=read_chunks)
     if reader is None:
         raise Exception("File format not compatible", filename)
     estimator = Estimator()
     estimator.file_counter = 1
     if not reader.read(estimator):  # some problems occurred during read
         logger.error("Error reading file %s", filename)
-        estimator = None
+        return None
+    _set_dtype(estimator, dtype)
+    if cache_key is not None and not lazy:
+        cache.store(cache_key, estimator)
     return estimator
 
 
-def fromfilelist(input_file_list: Union[List[str], str],
+def _dtype_key(dtype: Optional[DTypeLike]) -> Optional[str]:
+    """Canonical name of the dtype (i.e. the same for `np.float32` and `'float32'`), used in cache keys."""
+    return None if dtype is None else np.dtype(dtype).str
+
+
+def _set_dtype(estimator: Estimator, dtype: Optional[DTypeLike]) -> None:
+    """Store data and errors of all pages as `dtype`, no-op if `dtype` is None."""
+    if dtype is not None:
+        for page in estimator.pages:
+            page.set_dtype(dtype)
+
+
+def _fromfile_with_layout(filename: InputSource,
+                          layout_reader: LayoutReader,
+                          dtype: Optional[DTypeLike] = None,
+                          **read_options) -> Optional[Estimator]:
+    """Read the file using the layout of the first file of the list, files not matching it are read by `fromfile`."""
+    estimator = layout_reader.read(filename)
+    if estimator is None:
+        return fromfile(filename, dtype=dtype, **read_options)
+    # files with averaged results store the number of averaged files
+    estimator.file_counter = estimator.file_counter or 1
+    _set_dtype(estimator, dtype)
+    return estimator
+
+
+def fromfilelist(input_file_list: Union[List[InputSource], InputSource],
                  error: ErrorEstimate = ErrorEstimate.stderr,
-                 nan: bool = False) -> Optional[Estimator]:
+                 nan: bool = False,
+                 mmap: bool = False,
+                 selection: Optional[PageSelection] = None,
+                 index_file: bool = False,
+                 workers: int = 1,
+                 dtype: Optional[DTypeLike] = None,
+                 reuse_layout: bool = False,
+                 cache_dir: Optional[str] = None,
+                 read_chunks: int = 1,
+                 processes: int = 1,
+                 spill_dir: Optional[str] = None,
+                 compensated: bool = False) -> Optional[Estimator]:
     """
     Reads all files from a given list using `fromfile` method, and returns a list of averaged estimators.
 
+    With `workers` > 1 the files are read by a pool of threads, while the main thread aggregates the data
+    in the order of the list. At most `workers` estimators are kept in memory at once.
+
+    With `processes` > 1 the list is split into that many contiguous parts, each read and aggregated
+    by a separate process (each with `workers` threads). The partial results are then merged pairwise
+    (see `Aggregator.merge`), so parsing of many files scales with the number of CPU cores.
+    Results agree with the sequential aggregation up to floating point rounding. Tracing hooks
+    (see `pymchelper.readers.tracing`) don't see the reads done by other processes.
+
+    With `nan=True` all pages are averaged with NaN values excluded, separately for each bin
+    (see `NanWeightedStatsAggregator`), and all files have equal weights (as in `average_with_nan`).
+    The standard deviation is calculated from the valid values of each bin, the standard error divides it
+    by the square root of the number of files. Data is aggregated while the files are read,
+    so memory usage doesn't grow with the number of files.
+
+    With `spill_dir` the aggregation is done out-of-core: the state of the aggregators (means and variance
+    accumulators, sums, concatenated phase space data) lives in anonymous temporary files in this directory
+    (i.e. on a local scratch disk) instead of the memory, and is updated block by block (see `Aggregator`).
+    Input files are then memory-mapped (as with `mmap=True`), so data of each file is also read block by block
+    (except pages which need to be normalised after reading, these are read into memory).
+    Page data and errors of the result are memory-mapped from the temporary files, which are removed once
+    the result is no longer used. Writers read such pages as they are written, i.e. `MCPLWriter` writes
+    the particles in chunks, so memory usage stays bounded regardless of the mesh size and the number of files.
+    Conversion to `dtype` (if given) reads the result into memory.
+
+    The list may contain partial aggregate files (`<corename>.agg.npz`, i.e. saved by `mergetodir` on each node
+    of a cluster), also mixed with the outputs. Their aggregator states are merged with the aggregation
+    of the outputs (see `pymchelper.partial`), so mean and errors are the same as if all the outputs contributing
+    to them were read here. Partial aggregates keep the type of their aggregators, so those saved with `nan=True`
+    (see `mergetodir`) are merged with NaN values excluded. All the partial aggregates and outputs need to be
+    aggregated with the same `nan` option, otherwise ValueError is raised.
+
+    BDO files with averaged results written by `SHBinaryWriter` store their errors and the state of the averaging,
+    their means and errors are merged with the aggregation of other files (see `_update_aggregators`),
+    so the errors of the result take into account the spread of the files averaged there.
+
+    With `compensated=True` sums (i.e. of COUNT scorers) and total weights are accumulated with compensated
+    summation (see `Aggregator`), so their rounding error stays at the level of a single addition,
+    instead of growing with the number of files. This makes sums of thousands of files reproducible
+    to the last digits (i.e. in regression comparisons), at the cost of slightly slower aggregation of sums.
+
+    With `dtype` (i.e. `np.float32`) data of each file is stored in the given type, while the aggregation
+    (mean, variance, sum) is still accumulated in double precision. Only the final data and errors
+    are converted back to `dtype`.
+
+    With `reuse_layout=True` the first file of the list is fully parsed and its layout (offsets of data blocks
+    and of runtime tokens, such as number of primaries) is recorded. Each next BDO2019 file with the same
+    structure is read at once and only its data blocks and runtime tokens are decoded, skipping format recognition
+    and the token walk (see `pymchelper.readers.shieldhit.layout`). This speeds up reading of many small files.
+    Files which differ in structure are read by the regular readers. The `mmap`, `index_file` and `read_chunks`
+    options apply only to the files read by the regular readers.
+
+    With `cache_dir` the merged estimator is saved in the on-disk cache and loaded from there on next reads
+    of the same list of unchanged files with the same options, see `fromfile` and `pymchelper.cache`.
+
     :param input_file_list: list of files to be read
     :param error: error estimation, see class ErrorEstimate class in pymchelper.estimator
     :param nan: if True, NaN (not a number) are excluded when averaging data.
+    :param mmap: if True, data blocks are memory-mapped instead of being read, see `fromfile`
+    :param selection: pages (and sub-mesh) to be read from each file, see `fromfile`
+    :param index_file: if True, token index sidecars of BDO files are used (and created), see `fromfile`
+    :param workers: number of threads reading the files
+    :param dtype: type of page data and errors, see `fromfile`
+    :param reuse_layout: if True, files with the same structure as the first file are read using its layout
+    :param cache_dir: directory of the on-disk cache of estimators, None not to use the cache
+    :param read_chunks: number of chunks in which large data blocks are read in parallel, see `fromfile`
+    :param processes: number of processes aggregating parts of the list
+    :param spill_dir: directory of temporary files holding the aggregated data, None to keep it in memory
+    :param compensated: if True, sums and total weights are accumulated with compensated summation
     :return: list of estimators
     """
     if not isinstance(input_file_list, list):  # probably a string instead of list
         input_file_list = [input_file_list]
 
-    if nan:
-        estimator_list = [fromfile(filename) for filename in input_file_list]
-        result = average_with_nan(estimator_list, error)
-    elif len(input_file_list) == 1:
-        result = fromfile(input_file_list[0])
+    cache = EstimatorCache(cache_dir) if cache_dir is not None else None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(input_file_list, {
+            'error': error,
+            'nan': nan,
+            'selection': selection,
+            'dtype': _dtype_key(dtype),
+            'compensated': compensated,
+        })
+    if cache_key is not None:
+        result = cache.load(cache_key)
+        if result is not None:
+            return result
+
+    # out-of-core aggregation reads the data block by block, as the aggregators process it
+    mmap = mmap or spill_dir is not None
+    with_partial_aggregates = any(partial_aggregate.is_partial_aggregate(source) for source in input_file_list)
+
+    if len(input_file_list) == 1 and not with_partial_aggregates and not nan:
+        result = fromfile(input_file_list[0],
+                          mmap=mmap,
+                          selection=selection,
+                          index_file=index_file,
+                          dtype=dtype,
+                          read_chunks=read_chunks)
         if not result:
             return None
     else:
-        result = fromfile(input_file_list[0])
-        if not result:
+        read_options = dict(workers=workers,
+                            reuse_layout=reuse_layout,
+                            mmap=mmap,
+                            selection=selection,
+                            index_file=index_file,
+                            dtype=dtype,
+                            read_chunks=read_chunks,
+                            spill_dir=spill_dir,
+                            compensated=compensated,
+                            nan=nan)
+        aggregation = _aggregate_sources(input_file_list, processes=processes, **read_options)
+        if aggregation is None:
             return None
-
-        # _aggregator_mapping maps SHIELD-HIT12A normalization types (integers) to pymchelper aggregators
-        # using enums for clarity. AveragingCumulative (e.g., dose) and AveragingPerPrimary (e.g., LET)
-        # both utilize WeightedStatsAggregator. SHIELD-HIT12A stores "cumulative-like" data (e.g., dose,
-        # fluence) in BDO format as quantities for all particles. pymchelper normalizes this upon reading
-        # a BDO file by the number of primaries, making the `estimator` object data pre-normalized. Hence,
-        # aggregation for "cumulative-like" and "per-primary" data is handled uniformly in this mapping.
-        _aggregator_mapping: Dict[AggregationType, Aggregator] = {
-            AggregationType.NoAggregation: NoAggregator,
-            AggregationType.Sum: SumAggregator,
-            AggregationType.AveragingCumulative: WeightedStatsAggregator,
-            AggregationType.AveragingPerPrimary: WeightedStatsAggregator,
-            AggregationType.Concatenation: ConcatenatingAggregator
-        }
-
-        # create aggregators for each page and fill them with data from first file
-        page_aggregators = []
-        for page in result.pages:
-
-            # if no normalization attribute present (Fluka?) we can assume it is a cumulative-like quantity
-            current_page_normalisation = getattr(page, 'page_normalized', AggregationType.AveragingCumulative.value)
-
-            # guess the aggregator based on the normalisation type
-            aggregator = _aggregator_mapping.get(current_page_normalisation, WeightedStatsAggregator)()
-            logger.debug("Selected aggregator %s for page %s", aggregator, page.name)
-
-            # feed the aggregator with data from the first file
-            aggregator.update(value=page.data_raw, weight=result.number_of_primaries)
-            page_aggregators.append(aggregator)
-
-        # process all other files, if there are any
-        for filename in input_file_list[1:]:
-            current_estimator = fromfile(filename)
-            for current_page, aggregator in zip(current_estimator.pages, page_aggregators):
-                aggregator.update(value=current_page.data_raw, weight=current_estimator.number_of_primaries)
-
-            # force garbage collection if the estimator is too large
-            estimator_size_mbytes = sum(page.data_raw.nbytes for page in current_estimator.pages) / 1024 / 1024
-            gc_threshold_mbytes = 100
-            if estimator_size_mbytes > gc_threshold_mbytes:
-                logger.info("Large estimator (%.1f MB) detected, performing garbage collection", estimator_size_mbytes)
-                gc.collect()
-            result.number_of_primaries += current_estimator.number_of_primaries
+        result, page_aggregators = aggregation
+        if nan and len(input_file_list) == 1 and not with_partial_aggregates:
+            error = ErrorEstimate.none  # no spread of a single value
 
         # extract data from aggregators and fill then into the result
+        result.error_type = error
         for page, aggregator in zip(result.pages, page_aggregators):
             logger.debug("Extracting data from aggregator %s for page %s", aggregator, page.name)
             page.data_raw = aggregator.data
             page.error_raw = aggregator.error(error_type=error.name)
+            if type(aggregator) is WeightedStatsAggregator:
+                # the same for all averaged pages, weights are the numbers of primaries, see `SHBinaryWriter`
+                result.number_of_primaries_squared = aggregator.total_weight_squared
+
+    _set_dtype(result, dtype)  # aggregated data is kept in double precision
 
-    result.file_counter = len(input_file_list)
     core_names_dict = group_input_files(input_file_list)
     if len(core_names_dict) == 1:
         result.file_corename = list(core_names_dict)[0]
 
+    if cache_key is not None:
+        cache.store(cache_key, result)
     return result
 
 
+# maps SHIELD-HIT12A normalization types (integers) to pymchelper aggregators using enums for clarity.
+# AveragingCumulative (e.g., dose) and AveragingPerPrimary (e.g., LET) both utilize WeightedStatsAggregator.
+# SHIELD-HIT12A stores "cumulative-like" data (e.g., dose, fluence) in BDO format as quantities for all particles.
+# pymchelper normalizes this upon reading a BDO file by the number of primaries, making the `estimator` object data
+# pre-normalized. Hence, aggregation for "cumulative-like" and "per-primary" data is handled uniformly in this mapping.
+_aggregator_mapping: Dict[AggregationType, Type[Aggregator]] = {
+    AggregationType.NoAggregation: NoAggregator,
+    AggregationType.Sum: SumAggregator,
+    AggregationType.AveragingCumulative: WeightedStatsAggregator,
+    AggregationType.AveragingPerPrimary: WeightedStatsAggregator,
+    AggregationType.Concatenation: ConcatenatingAggregator
+}
+
+
+def _layout_read(filenames: List[InputSource], reuse_layout: bool,
+                 selection: Optional[PageSelection]) -> Optional[Callable[..., Optional[Estimator]]]:
+    """Function reading the files using the layout of the first one (see `fromfilelist`), None for `fromfile`."""
+    if reuse_layout and len(filenames) > 1:
+        return partial(_fromfile_with_layout, layout_reader=LayoutReader(selection=selection))
+    return None
+
+
+def _aggregate_files(filenames: List[InputSource],
+                     workers: int = 1,
+                     reuse_layout: bool = False,
+                     selection: Optional[PageSelection] = None,
+                     spill_dir: Optional[str] = None,
+                     compensated: bool = False,
+                     nan: bool = False,
+                     **read_options) -> Optional[Tuple[Estimator, List[Aggregator]]]:
+    """
+    Read the files (see `_read_files`) and feed the page aggregators with their data, in the order of the files.
+    Returns the estimator read from the first file (with the total number of primaries of all files)
+    and the aggregators of its pages, or None if the first file could not be read.
+    Aggregators keep their state in temporary files in `spill_dir`, if given, and accumulate sums and weights
+    with compensated summation if `compensated` (see `Aggregator`).
+    With `nan=True` all pages are averaged by `NanWeightedStatsAggregator`, with equal weights of all files.
+    """
+    estimators = _read_files(filenames,
+                             workers=workers,
+                             read=_layout_read(filenames, reuse_layout, selection),
+                             selection=selection,
+                             **read_options)
+    result = next(estimators)
+    if not result:
+        return None
+
+    # create aggregators for each page and fill them with data from first file
+    page_aggregators = []
+    for page in result.pages:
+
+        # if no normalization attribute present (Fluka?) we can assume it is a cumulative-like quantity
+        current_page_normalisation = getattr(page, 'page_normalized', AggregationType.AveragingCumulative.value)
+
+        # guess the aggregator based on the normalisation type
+        if nan:
+            aggregator_cls = NanWeightedStatsAggregator
+        else:
+            aggregator_cls = _aggregator_mapping.get(current_page_normalisation, WeightedStatsAggregator)
+        aggregator = aggregator_cls(spill_dir=spill_dir, compensated=compensated)
+        logger.debug("Selected aggregator %s for page %s", aggregator, page.name)
+
+        page_aggregators.append(aggregator)
+
+    # feed the aggregators with data from the first file
+    _update_aggregators(page_aggregators, result, nan)
+
+    # process all other files, if there are any
+    for current_estimator in estimators:
+        _update_aggregators(page_aggregators, current_estimator, nan)
+
+        # force garbage collection if the estimator is too large
+        estimator_size_mbytes = sum(page.data_raw.nbytes for page in current_estimator.pages) / 1024 / 1024
+        gc_threshold_mbytes = 100
+        if estimator_size_mbytes > gc_threshold_mbytes:
+            logger.info("Large estimator (%.1f MB) detected, performing garbage collection", estimator_size_mbytes)
+            gc.collect()
+        result.number_of_primaries += current_estimator.number_of_primaries
+        result.file_counter += current_estimator.file_counter
+
+    return result, page_aggregators
+
+
+def _update_aggregators(page_aggregators: List[Aggregator], estimator: Estimator, nan: bool) -> None:
+    """
+    Update the page aggregators with the pages of the estimator, weighted by its number of primaries
+    (all with the same weight if `nan`). Pages with results averaged earlier, stored with their errors
+    (see `SHBinaryWriter`), are merged with the aggregators in the state calculated back from their errors
+    (see `WeightedStatsAggregator.from_error`), so the spread of the files averaged there is kept.
+    If that is not possible (state of the averaging not stored, NaN values excluded), such pages are aggregated
+    as results of a single file, with a warning.
+    """
+    number_of_primaries_squared = getattr(estimator, 'number_of_primaries_squared', None)
+    error_type = ErrorEstimate(estimator.error_type)
+    spread_lost = False
+    for page, aggregator in zip(estimator.pages, page_aggregators):
+        if page.error_raw is not None and isinstance(aggregator, WeightedStatsAggregator):
+            if (type(aggregator) is WeightedStatsAggregator and number_of_primaries_squared is not None
+                    and error_type != ErrorEstimate.none):
+                aggregator.merge(
+                    WeightedStatsAggregator.from_error(page.data_raw,
+                                                       page.error_raw,
+                                                       error_type.name,
+                                                       estimator.number_of_primaries,
+                                                       number_of_primaries_squared,
+                                                       spill_dir=aggregator.spill_dir))
+                continue
+            spread_lost = True
+        aggregator.update(value=page.data_raw, weight=1.0 if nan else estimator.number_of_primaries)
+    if spread_lost:
+        logger.warning("Results averaged from %d files are aggregated as results of a single file, "
+                       "their spread is not taken into account", estimator.file_counter)
+
+
+def _aggregate_part(filenames: List[InputSource], **read_options) -> Optional[Tuple[Estimator, List[Aggregator]]]:
+    """
+    Aggregate part of the file list in a worker process, see `_aggregate_in_processes`.
+    Page data of the returned estimator is dropped, the data is taken from the aggregators anyway,
+    so it doesn't need to be sent back to the main process.
+    """
+    aggregation = _aggregate_files(filenames, **read_options)
+    if aggregation is not None:
+        for page in aggregation[0].pages:
+            page.data_raw = np.empty(0)
+            page.error_raw = None
+    return aggregation
+
+
+def _merge_aggregations(first: Tuple[Estimator, List[Aggregator]],
+                        second: Tuple[Estimator, List[Aggregator]]) -> Tuple[Estimator, List[Aggregator]]:
+    """Merge aggregation of the files following the files of the `first` one into it."""
+    result, page_aggregators = first
+    estimator, other_aggregators = second
+    for aggregator, other in zip(page_aggregators, other_aggregators):
+        if type(aggregator) is not type(other):
+            # i.e. partial aggregates saved with and without NaN values excluded
+            raise ValueError("Cannot merge {} with {}, all the files need to be aggregated with the same `nan` "
+                             "option".format(type(other).__name__, type(aggregator).__name__))
+        aggregator.merge(other)
+    result.number_of_primaries += estimator.number_of_primaries
+    result.file_counter += estimator.file_counter
+    return first
+
+
+def _aggregate_in_processes(filenames: List[InputSource], processes: int,
+                            **read_options) -> Optional[Tuple[Estimator, List[Aggregator]]]:
+    """
+    Split the file list into `processes` contiguous parts aggregated by a pool of processes (map),
+    then merge the partial aggregations pairwise, in a binary tree (reduce). Neighbouring parts are merged,
+    so the result doesn't depend on the order of completion (i.e. concatenated data is in the order of the files).
+    """
+    part_size = -(-len(filenames) // processes)
+    parts = [filenames[start:start + part_size] for start in range(0, len(filenames), part_size)]
+    with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+        aggregations = list(executor.map(partial(_aggregate_part, **read_options), parts))
+    if any(aggregation is None for aggregation in aggregations):
+        return None
+    while len(aggregations) > 1:
+        aggregations = [
+            _merge_aggregations(*pair) if len(pair) == 2 else pair[0]
+            for pair in (aggregations[start:start + 2] for start in range(0, len(aggregations), 2))
+        ]
+    return aggregations[0]
+
+
+def _aggregate_sources(filenames: List[InputSource],
+                       processes: int = 1,
+                       **read_options) -> Optional[Tuple[Estimator, List[Aggregator]]]:
+    """
+    Aggregate the list of outputs and partial aggregate files (see `pymchelper.partial`), in the order of the list.
+    Each run of consecutive outputs is aggregated by `_aggregate_files` (or by `processes` processes),
+    partial aggregates are loaded, and all of them are merged one after another.
+    Returns None if any of the outputs could not be read.
+    """
+    aggregation = None
+    for is_partial, sources in groupby(filenames, key=partial_aggregate.is_partial_aggregate):
+        sources = list(sources)
+        if is_partial:
+            # loaded one by one, so only one of them is kept in memory besides the result
+            parts = (partial_aggregate.load(path, spill_dir=read_options.get('spill_dir')) for path in sources)
+        elif processes > 1:
+            parts = [_aggregate_in_processes(sources, processes, **read_options)]
+        else:
+            parts = [_aggregate_files(sources, **read_options)]
+        for part in parts:
+            if part is None:
+                return None
+            aggregation = part if aggregation is None else _merge_aggregations(aggregation, part)
+    return aggregation
+
+
+def _read_files(filenames: List[str],
+                workers: int = 1,
+                read: Optional[Callable[..., Optional[Estimator]]] = None,
+                **read_options) -> Iterator[Optional[Estimator]]:
+    """
+    Reads files using `read` function (by default `fromfile`, with `read_options` passed to it),
+    yielding estimators in the order of `filenames`.
+
+    With `workers` > 1 next files are read by a pool of threads, while the consumer processes the current estimator.
+    Reading of a new file starts only when the consumer is done with the previous one,
+    thus at most `workers` estimators are kept in memory at once.
+    Most of the reading time is spent in numpy I/O calls, which release the GIL, so threads are enough here.
+    """
+    if read is None:
+        read = fromfile
+    if workers <= 1:
+        for filename in filenames:
+            yield read(filename, **read_options)
+        return
+
+    filenames_iter = iter(filenames)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(read, filename, **read_options)
+                        for _, filename in zip(range(workers), filenames_iter))
+        while pending:
+            yield pending.popleft().result()
+            next_filename = next(filenames_iter, None)
+            if next_filename is not None:
+                pending.append(executor.submit(read, next_filename, **read_options))
+
+
+def follow(filename: str,
+           interval: float = 1.0,
+           timeout: Optional[float] = None,
+           mmap: bool = False,
+           lazy: bool = False,
+           selection: Optional[PageSelection] = None) -> Iterator[Estimator]:
+    """
+    Follow a SHIELD-HIT12A BDO (2019 format) file which is still being written, i.e. by a running simulation.
+
+    The file is polled every `interval` seconds, each time new pages are completed in the file a new estimator
+    holding all complete pages is yielded. Only the tokens appended since the last poll are read,
+    an incomplete token at the end of the file is read in one of next polls, once it is completely written.
+    Iteration ends after `timeout` seconds without new pages (by default it never ends).
+
+    :param filename: path to the BDO file, it doesn't need to exist yet
+    :param interval: time between polls (in seconds)
+    :param timeout: time without new pages (in seconds) after which iteration ends, None to follow forever
+    :param mmap: if True, data blocks are memory-mapped instead of being read, see `fromfile`
+    :param lazy: if True, data of pages is read on first access, see `fromfile`
+    :param selection: pages (and sub-mesh) to be read, see `fromfile`
+    """
+    reader = SHFollowerBDO2019(filename, mmap=mmap, lazy=lazy, selection=selection)
+    idle_since = time.monotonic()
+    while True:
+        if reader.poll():
+            idle_since = time.monotonic()
+            estimator = Estimator()
+            estimator.file_counter = 1
+            reader.read(estimator)
+            yield estimator
+        elif timeout is not None and time.monotonic() - idle_since >= timeout:
+            return
+        else:
+            time.sleep(interval)
+
+
 def frompattern(pattern: str,
                 error: ErrorEstimate = ErrorEstimate.stderr,
-                nan: bool = True) -> List[Optional[Estimator]]:
+                nan: bool = True,
+                workers: int = 1,
+                dtype: Optional[DTypeLike] = None,
+                reuse_layout: bool = False,
+                cache_dir: Optional[str] = None,
+                read_chunks: int = 1,
+                processes: int = 1,
+                spill_dir: Optional[str] = None,
+                compensated: bool = False) -> List[Optional[Estimator]]:
     """
     Reads all files matching pattern, e.g.: 'foobar_*.bdo', and returns a list of averaged estimators.
+    Pattern may also select members of tar or zip archives, e.g.: 'results.tar::run_*/foobar_*.bdo',
+    which are read directly from the archives (see `pymchelper.readers.archive`).
 
     :param pattern: pattern to be matched for reading.
     :param error: error estimation, see class ErrorEstimate class in pymchelper.estimator
     :param nan: if True, NaN (not a number) are excluded when averaging data.
+    :param workers: number of threads reading the files, see `fromfilelist`
+    :param dtype: type of page data and errors, see `fromfile`
+    :param reuse_layout: if True, files with the same structure are read using the layout of the first file
+        of each group, see `fromfilelist`
+    :param cache_dir: directory of the on-disk cache of estimators, see `fromfilelist`
+    :param read_chunks: number of chunks in which large data blocks are read in parallel, see `fromfile`
+    :param processes: number of processes aggregating parts of each group of files, see `fromfilelist`
+    :param spill_dir: directory of temporary files holding the aggregated data, see `fromfilelist`
+    :param compensated: if True, sums and total weights are accumulated with compensated summation,
+        see `fromfilelist`
     :return: a list of estimators, or an empty list if no files were found.
     """
 
     try:
-        list_of_matching_files = sorted(glob(pattern))
+        list_of_matching_files = expand_pattern(pattern)
     except TypeError as e:  # noqa: F841
         list_of_matching_files = pattern
 
     core_names_dict = group_input_files(list_of_matching_files)
 
-    result = [fromfilelist(filelist, error, nan) for _, filelist in core_names_dict.items()]
+    result = [
+        fromfilelist(filelist,
+                     error,
+                     nan,
+                     workers=workers,
+                     dtype=dtype,
+                     reuse_layout=reuse_layout,
+                     cache_dir=cache_dir,
+                     read_chunks=read_chunks,
+                     processes=processes,
+                     spill_dir=spill_dir,
+                     compensated=compensated) for _, filelist in core_names_dict.items()
+    ]
 
     return result
 
@@ -223,16 +712,45 @@ def convertfromlist(filelist: List[str],
                     outputdir: Optional[str],
                     converter_name: str,
                     options: dict,
-                    outputfile: Optional[str] = None) -> Optional[int]:
+                    outputfile: Optional[str] = None,
+                    index_file: bool = False,
+                    workers: int = 1,
+                    dtype: Optional[DTypeLike] = None,
+                    reuse_layout: bool = False,
+                    cache_dir: Optional[str] = None,
+                    read_chunks: int = 1,
+                    processes: int = 1,
+                    spill_dir: Optional[str] = None,
+                    compensated: bool = False) -> Optional[int]:
     """Convert a list of input files into a single output using a chosen converter.
 
     - Reads and optionally averages inputs (`nan` controls NaN handling).
+    - Uses token index sidecars of BDO files if `index_file` is set, see `fromfile`.
+    - Reads the files using `workers` threads, see `fromfilelist`.
+    - Stores page data and errors as `dtype` (i.e. `float32`), see `fromfile`.
+    - Reads files with the same structure using the layout of the first one if `reuse_layout`, see `fromfilelist`.
+    - Loads (and saves) the estimator from the on-disk cache in `cache_dir`, if given, see `fromfilelist`.
+    - Reads large data blocks in `read_chunks` parallel chunks, see `fromfile`.
+    - Aggregates parts of the list in `processes` processes, see `fromfilelist`.
+    - Keeps the aggregated data in temporary files in `spill_dir`, if given, see `fromfilelist`.
+    - Accumulates sums and total weights with compensated summation if `compensated`, see `fromfilelist`.
     - Resolves output path (`outputfile` overrides, else uses `outputdir` or corename).
     - Writes via `converter_name` with `options`.
 
     Returns status code from the writer, or None if reading failed.
     """
-    estimator = fromfilelist(filelist, error, nan)
+    estimator = fromfilelist(filelist,
+                             error,
+                             nan,
+                             index_file=index_file,
+                             workers=workers,
+                             dtype=dtype,
+                             reuse_layout=reuse_layout,
+                             cache_dir=cache_dir,
+                             read_chunks=read_chunks,
+                             processes=processes,
+                             spill_dir=spill_dir,
+                             compensated=compensated)
     if not estimator:
         return None
     if outputfile is not None:
@@ -250,24 +768,96 @@ def convertfrompattern(pattern: str,
                        converter_name: str,
                        options: dict,
                        error: ErrorEstimate = ErrorEstimate.stderr,
-                       nan: bool = True) -> int:
+                       nan: bool = True,
+                       index_file: bool = False,
+                       workers: int = 1,
+                       dtype: Optional[DTypeLike] = None,
+                       reuse_layout: bool = False,
+                       cache_dir: Optional[str] = None,
+                       read_chunks: int = 1,
+                       processes: int = 1,
+                       spill_dir: Optional[str] = None,
+                       compensated: bool = False) -> int:
     """Convert all files matching a glob `pattern` using the chosen converter.
 
+    Pattern may also select members of tar or zip archives, i.e. `results.tar::run_*/dose*.bdo`,
+    see `pymchelper.readers.archive`.
+
     - Groups matching files by corename and processes each group via `convertfromlist`.
     - Supports NaN-aware averaging (`nan`) and error type selection (`error`).
 
     Returns the maximum status code across processed groups.
     """
-    list_of_matching_files = sorted(glob(pattern))
+    list_of_matching_files = expand_pattern(pattern)
 
     core_names_dict = group_input_files(list_of_matching_files)
 
     status = []
     for _, filelist in core_names_dict.items():
-        status.append(convertfromlist(filelist, error, nan, outputdir, converter_name, options))
+        status.append(convertfromlist(filelist, error, nan, outputdir, converter_name, options,
+                                      index_file=index_file, workers=workers, dtype=dtype,
+                                      reuse_layout=reuse_layout, cache_dir=cache_dir, read_chunks=read_chunks,
+                                      processes=processes, spill_dir=spill_dir, compensated=compensated))
     return max(status)
 
 
+def mergetodir(filelist: List[str],
+               outputdir: str,
+               index_file: bool = False,
+               workers: int = 1,
+               reuse_layout: bool = False,
+               read_chunks: int = 1,
+               processes: int = 1,
+               spill_dir: Optional[str] = None,
+               compensated: bool = False,
+               nan: bool = False) -> int:
+    """Merge outputs and partial aggregate files into partial aggregate files in `outputdir`, one per corename.
+
+    - Groups the files by corename and aggregates each group (outputs and partial aggregates, see `fromfilelist`).
+    - Merges the aggregation into the partial aggregate `<outputdir>/<corename>.agg.npz`, if it already exists,
+      otherwise creates it (and `outputdir`) (see `pymchelper.partial`). The target file itself is not merged again,
+      if it is on the list.
+    - Holds the lock of the target file while reading, merging and saving it, so many processes
+      (i.e. jobs running on different nodes) can merge their results into the same target.
+    - Reading and aggregation options (`index_file`, `workers`, `reuse_layout`, `read_chunks`, `processes`,
+      `spill_dir`, `compensated`, `nan`) are the same as of `fromfilelist`. With `nan=True` the NaN-aware
+      aggregators are saved, the target and all the merged partial aggregates need to be saved with the same option.
+
+    Returns 0 on success, 1 if any of the groups could not be read or merged.
+    """
+    os.makedirs(outputdir, exist_ok=True)
+    status = 0
+    for corename, sources in group_input_files(filelist).items():
+        path = partial_aggregate.aggregate_path(outputdir, corename)
+        sources = [source for source in sources if os.path.abspath(source) != os.path.abspath(path)]
+        if not sources:
+            continue
+        try:
+            aggregation = _aggregate_sources(sources,
+                                             processes=processes,
+                                             workers=workers,
+                                             reuse_layout=reuse_layout,
+                                             mmap=spill_dir is not None,
+                                             index_file=index_file,
+                                             read_chunks=read_chunks,
+                                             spill_dir=spill_dir,
+                                             compensated=compensated,
+                                             nan=nan)
+            if aggregation is None:
+                logger.error("Error reading files of %s", corename)
+                status = 1
+                continue
+            aggregation[0].file_corename = corename
+            with partial_aggregate.lock(path):
+                if os.path.exists(path):
+                    aggregation = _merge_aggregations(partial_aggregate.load(path, spill_dir=spill_dir), aggregation)
+                partial_aggregate.save(path, aggregation)
+        except ValueError as e:
+            logger.error("Error merging files of %s: %s", corename, e)
+            status = 1
+    return status
+
+
 def tofile(estimator: Estimator, filename: str, converter_name: str, options: dict) -> int:
     """
     Save a estimator data to a ``filename`` using converter defined by ``converter_name``
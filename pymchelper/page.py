@@ -1,6 +1,7 @@
-from typing import List, Optional, Tuple, TYPE_CHECKING
+from functools import partial
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
 import numpy as np
-from numpy.typing import NDArray
+from numpy.typing import DTypeLike, NDArray
 
 from pymchelper.axis import MeshAxis, AxisId
 from pymchelper.shieldhit.detector.detector_type import SHDetType
@@ -15,7 +16,9 @@ class Page:
 
         self.estimator: Optional['Estimator'] = estimator
 
-        self.data_raw: NDArray[np.floating] = np.array([float("NaN")])  # linear data storage
+        self._data_raw: NDArray[np.floating] = np.array([float("NaN")])  # linear data storage
+        # optional callable reading the data on first access to `data_raw` (lazy pages)
+        self._data_loader: Optional[Callable[[], NDArray[np.floating]]] = None
         self.error_raw: Optional[NDArray[np.floating]] = None  # linear data storage
 
         self.name: str = ""
@@ -39,6 +42,106 @@ class Page:
                                    unit="",
                                    binning=MeshAxis.BinningType.linear)
 
+    @property
+    def data_raw(self) -> NDArray[np.floating]:
+        """
+        Linear (1-D) data storage.
+
+        For lazy pages (see `set_data_loader`) the data is read from the file on first access.
+        """
+        self.load_data()
+        return self._data_raw
+
+    @data_raw.setter
+    def data_raw(self, value: NDArray[np.floating]) -> None:
+        self._data_raw = value
+        self._data_loader = None
+
+    @property
+    def data_loaded(self) -> bool:
+        """
+        False for lazy pages whose data was not yet read from the file.
+
+        >>> p = Page()
+        >>> p.set_data_loader(partial(np.arange, 3.))
+        >>> p.data_loaded
+        False
+        >>> p.data_raw
+        array([0., 1., 2.])
+        >>> p.data_loaded
+        True
+        """
+        return self._data_loader is None
+
+    def load_data(self) -> None:
+        """Read data of a lazy page now, no-op for pages which already hold the data."""
+        if self._data_loader is not None:
+            self._data_raw = self._data_loader()
+            self._data_loader = None
+
+    def set_data_loader(self, loader: Callable[[], NDArray[np.floating]]) -> None:
+        """
+        Make the page lazy: `loader` will be called on first access to `data_raw`.
+
+        Readers use it to build all the page metadata from the file headers alone and postpone
+        reading of (possibly large) data blocks until they are really needed.
+        The loader needs to be deep-copyable (i.e. `functools.partial` of a module-level function),
+        as pages are copied when added to an estimator.
+        """
+        self._data_loader = loader
+
+    def map_data(self, func: Callable[[NDArray[np.floating]], NDArray[np.floating]]) -> None:
+        """
+        Replace page data with `func(data_raw)`, for lazy pages the function is applied when the data is loaded.
+
+        >>> p = Page()
+        >>> p.set_data_loader(partial(np.arange, 3.))
+        >>> p.map_data(np.flip)
+        >>> p.data_loaded
+        False
+        >>> p.data_raw
+        array([2., 1., 0.])
+        """
+        if self._data_loader is not None:
+            self._data_loader = partial(_mapped, self._data_loader, func)
+        else:
+            self._data_raw = func(self._data_raw)
+
+    def transform_data(self, ufunc: np.ufunc, operand: float) -> None:
+        """
+        Apply in-place transformation `data_raw = ufunc(data_raw, operand)`, i.e. normalisation.
+
+        For lazy pages the transformation is postponed until the data is loaded.
+        Read-only data (i.e. memory-mapped file) is copied into memory before being modified (copy-on-write).
+
+        >>> p = Page()
+        >>> p.set_data_loader(partial(np.arange, 3.))
+        >>> p.transform_data(np.divide, 2.)
+        >>> p.data_loaded
+        False
+        >>> p.data_raw
+        array([0. , 0.5, 1. ])
+        """
+        self.map_data(partial(_transformed, ufunc=ufunc, operand=operand))
+
+    def set_dtype(self, dtype: DTypeLike) -> None:
+        """
+        Store page data and errors as `dtype`, i.e. `np.float32` to halve the memory they take.
+
+        For lazy pages the data is converted when loaded. Memory-mapped data is read into memory while converted.
+
+        >>> p = Page()
+        >>> p.set_data_loader(partial(np.arange, 3.))
+        >>> p.set_dtype(np.float32)
+        >>> p.data_loaded
+        False
+        >>> p.data_raw.dtype
+        dtype('float32')
+        """
+        self.map_data(partial(_as_dtype, dtype=dtype))
+        if self.error_raw is not None:
+            self.error_raw = _as_dtype(self.error_raw, dtype)
+
     def axis(self, axis_id: int) -> Optional[MeshAxis]:
         """
         TODO
@@ -180,3 +283,23 @@ class Page:
         constant_axes_id = [i for i in plotting_order if self.axis(i).n == 1]
         plotting_order = variable_axes_id + constant_axes_id
         return self.axis(plotting_order[id])
+
+
+def _mapped(loader: Callable[[], NDArray[np.floating]],
+            func: Callable[[NDArray[np.floating]], NDArray[np.floating]]) -> NDArray[np.floating]:
+    """Load the data using `loader` and apply `func` to it."""
+    return func(loader())
+
+
+def _transformed(data: NDArray[np.floating], ufunc: np.ufunc, operand: float) -> NDArray[np.floating]:
+    """Apply in-place transformation to the data, read-only data is copied first."""
+    if not isinstance(data, np.ndarray):
+        return ufunc(data, operand)
+    if not data.flags.writeable:
+        data = np.array(data)
+    return ufunc(data, operand, out=data)
+
+
+def _as_dtype(data: NDArray[np.floating], dtype: DTypeLike) -> NDArray[np.floating]:
+    """Data converted to `dtype`, data which already has this type is returned as it is."""
+    return np.asarray(data).astype(dtype, copy=False)
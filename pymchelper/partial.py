@@ -0,0 +1,285 @@
+"""
+Persisted partial aggregates, for hierarchical merging of outputs of large (HPC) simulations.
+
+Thousands of output files produced on many nodes need not be collected and read in one place.
+Instead, each node reduces its own files to a partial aggregate (one file per detector, see `convertmc merge`),
+and the partial aggregates are then merged centrally, possibly in several levels of a tree.
+Partial aggregate holds the complete state of the page aggregators (see `pymchelper.averaging`):
+the weighted mean and the S (sum of squared deviations) accumulator, total weight and sum of squared weights
+of averaged pages, sums, concatenated phase space data. Merging of such states (see `Aggregator.merge`)
+gives the same mean and variance as if all the outputs were aggregated in one go, so errors (standard deviation
+or standard error) of the final result are calculated only once, from the merged state.
+
+Partial aggregate file (`<corename>.agg.npz`) is a numpy `.npz` archive:
+
+- `state`: JSON document with the format version, number of primaries, number of aggregated files, corename,
+  estimator and page metadata (axes as name, unit, min, max, number of bins and binning, and all other
+  attributes set by the readers, i.e. names, units, normalisation), and for each page the aggregator type
+  and its scalar fields (i.e. total weight),
+- `<page number>.<field>`: arrays of the aggregator fields (i.e. `0.data`, `0._accumulator_S`).
+
+The archive holds only JSON text and numeric arrays, it is read without unpickling (no code is run when loading
+files copied from other nodes), and doesn't depend on the layout of the in-memory classes.
+The metadata is rebuilt into `Estimator` and `Page` objects when loaded.
+
+Files are written to a temporary file first and then renamed, so readers never see partially written files.
+Processes merging into the same file (i.e. a shared target on a parallel file system) serialise
+their read-merge-write cycles with the `lock`.
+
+Partial aggregate files are accepted wherever lists of output files are (`fromfilelist`, `frompattern`,
+`convertmc --many`), also mixed with the raw outputs, and are merged with their aggregation.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+from dataclasses import fields
+from enum import IntEnum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from pymchelper.averaging import (Aggregator, ConcatenatingAggregator, NanWeightedStatsAggregator, NoAggregator,
+                                  SumAggregator, WeightedStatsAggregator, _accumulator)
+from pymchelper.axis import MeshAxis
+from pymchelper.estimator import ErrorEstimate, Estimator
+from pymchelper.page import Page
+from pymchelper.readers.sources import InputSource, is_path
+from pymchelper.shieldhit.detector.detector_type import SHDetType
+from pymchelper.shieldhit.detector.estimator_type import SHGeoType
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+suffix = '.agg.npz'
+
+format_version = 2
+
+_aggregator_classes = {
+    cls.__name__: cls
+    for cls in (WeightedStatsAggregator, NanWeightedStatsAggregator, SumAggregator, ConcatenatingAggregator,
+                NoAggregator)
+}
+
+# enumerations used in estimator and page metadata
+_enum_classes = {cls.__name__: cls for cls in (ErrorEstimate, SHGeoType, SHDetType, MeshAxis.BinningType)}
+
+# estimator attributes stored at the top level of the state, page attributes holding the data
+_estimator_state_attributes = ('number_of_primaries', 'file_counter', 'file_corename', 'pages')
+_page_data_attributes = ('estimator', '_data_raw', '_data_loader', 'error_raw')
+
+
+def is_partial_aggregate(source: InputSource) -> bool:
+    """
+    True if `source` is a partial aggregate file (recognized by its suffix).
+
+    >>> is_partial_aggregate('node_03/dose.agg.npz'), is_partial_aggregate('dose_0001.bdo')
+    (True, False)
+    """
+    return is_path(source) and str(source).endswith(suffix)
+
+
+def aggregate_path(directory: str, corename: str) -> str:
+    """Path of the partial aggregate of the detector with `corename` in `directory`."""
+    return os.path.join(directory, corename + suffix)
+
+
+def _aggregator_state(aggregator: Aggregator) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Scalar and array fields of the aggregator (scratch buffers and settings such as `spill_dir` are skipped)."""
+    scalars, arrays = {}, {}
+    for aggregator_field in fields(aggregator):
+        if not aggregator_field.compare or aggregator_field.name == 'spill_dir':
+            continue
+        value = getattr(aggregator, aggregator_field.name)
+        if isinstance(value, np.ndarray):
+            arrays[aggregator_field.name] = value
+        else:
+            scalars[aggregator_field.name] = value.item() if isinstance(value, np.generic) else value
+    return scalars, arrays
+
+
+def _encode(value: Any) -> Any:
+    """
+    JSON representation of the estimator (or page) attribute, see `_decode`.
+    Values of types not known to the readers are not stored, TypeError is raised.
+
+    >>> _encode(MeshAxis(n=2, min_val=0.0, max_val=1.0, name="X", unit="cm", binning=MeshAxis.BinningType.linear))
+    {'axis': [2, 0.0, 1.0, 'X', 'cm', {'enum': 'BinningType', 'value': 0}]}
+    >>> _encode(np.array([1, 2])), _encode(b'FLUKA')
+    ({'array': [1, 2], 'dtype': '<i8'}, {'bytes': 'FLUKA'})
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, MeshAxis):
+        return {'axis': [_encode(axis_field) for axis_field in value]}
+    if isinstance(value, IntEnum):
+        if type(value).__name__ not in _enum_classes:
+            raise TypeError("Enumeration {!r} cannot be saved in partial aggregate".format(value))
+        return {'enum': type(value).__name__, 'value': int(value)}
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'biufUS':
+        return {'array': _encode(value.tolist()), 'dtype': value.dtype.str}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, bytes):
+        return {'bytes': value.decode('latin-1')}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError("Value {!r} cannot be saved in partial aggregate".format(value))
+
+
+def _decode(value: Any) -> Any:
+    """
+    Estimator (or page) attribute from its JSON representation, see `_encode`.
+
+    >>> _decode(_encode(MeshAxis(n=2, min_val=0.0, max_val=1.0, name="X", unit="cm",
+    ...                          binning=MeshAxis.BinningType.logarithmic))).binning
+    <BinningType.logarithmic: 1>
+    """
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if 'axis' in value:
+        return MeshAxis(*_decode(value['axis']))
+    if 'enum' in value:
+        return _enum_classes[value['enum']](value['value'])
+    if 'array' in value:
+        return np.array(_decode(value['array']), dtype=value['dtype'])
+    if 'bytes' in value:
+        return value['bytes'].encode('latin-1')
+    raise ValueError("Unknown value {!r} in partial aggregate file".format(value))
+
+
+def _metadata_state(estimator: Estimator) -> Dict[str, Any]:
+    """Estimator and page metadata (all attributes but the page data), see `_metadata_from_state`."""
+    return {
+        'attributes': {
+            name: _encode(value)
+            for name, value in vars(estimator).items() if name not in _estimator_state_attributes
+        },
+        'pages': [{name: _encode(value)
+                   for name, value in vars(page).items() if name not in _page_data_attributes}
+                  for page in estimator.pages],
+    }
+
+
+def _metadata_from_state(state: Dict[str, Any]) -> Estimator:
+    """Estimator with pages (without data) rebuilt from the metadata saved by `_metadata_state`."""
+    estimator = Estimator()
+    for name, value in state['attributes'].items():
+        setattr(estimator, name, _decode(value))
+    pages = []
+    for page_state in state['pages']:
+        page = Page(estimator)
+        for name, value in page_state.items():
+            setattr(page, name, _decode(value))
+        page.data_raw = np.empty(0)
+        pages.append(page)
+    estimator.pages = tuple(pages)
+    return estimator
+
+
+def save(path: str, aggregation: Tuple[Estimator, List[Aggregator]]) -> None:
+    """Save the estimator (metadata) and the state of its page aggregators in the partial aggregate file `path`."""
+    estimator, page_aggregators = aggregation
+    state = {
+        'format': format_version,
+        'number_of_primaries': int(estimator.number_of_primaries),
+        'file_counter': int(estimator.file_counter),
+        'file_corename': estimator.file_corename,
+        'estimator': _metadata_state(estimator),
+        'pages': [],
+    }
+    arrays = {}
+    for page_no, aggregator in enumerate(page_aggregators):
+        scalars, aggregator_arrays = _aggregator_state(aggregator)
+        state['pages'].append({'aggregator': type(aggregator).__name__, 'fields': scalars})
+        arrays.update((f'{page_no}.{name}', value) for name, value in aggregator_arrays.items())
+    arrays['state'] = np.frombuffer(json.dumps(state).encode('utf-8'), dtype=np.uint8)
+
+    # unique per process and thread, renamed only when completely written
+    tmp_path = '{:s}.{:d}.{:d}.tmp'.format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    logger.info("Saved partial aggregate of %d files in %s", estimator.file_counter, path)
+
+
+def _load_state(archive) -> Dict[str, Any]:
+    state = json.loads(archive['state'].tobytes().decode('utf-8'))
+    if state.get('format') != format_version:
+        raise ValueError("Unsupported format {} of partial aggregate file".format(state.get('format')))
+    return state
+
+
+def load(path: str, spill_dir: Optional[str] = None) -> Tuple[Estimator, List[Aggregator]]:
+    """
+    Estimator (without page data) and page aggregators restored from the partial aggregate file `path`.
+    With `spill_dir` the aggregator arrays are moved to disk-backed arrays in that directory (see `Aggregator`).
+    """
+    with np.load(path, allow_pickle=False) as archive:
+        state = _load_state(archive)
+        estimator = _metadata_from_state(state['estimator'])
+        page_aggregators = []
+        for page_no, page_state in enumerate(state['pages']):
+            aggregator = _aggregator_classes[page_state['aggregator']](spill_dir=spill_dir)
+            values = dict(page_state['fields'])
+            prefix = f'{page_no}.'
+            values.update((name[len(prefix):], _accumulator(archive[name], spill_dir))
+                          for name in archive.files if name.startswith(prefix))
+            # data first, as setting it resets the state of some aggregators (see `ConcatenatingAggregator`)
+            aggregator.data = values.pop('data')
+            for name, value in values.items():
+                setattr(aggregator, name, value)
+            page_aggregators.append(aggregator)
+    estimator.number_of_primaries = state['number_of_primaries']
+    estimator.file_counter = state['file_counter']
+    estimator.file_corename = state['file_corename']
+    return estimator, page_aggregators
+
+
+def corename(path: str) -> Optional[str]:
+    """Corename of the detector aggregated in the partial aggregate file `path`, read from its state only."""
+    with np.load(path, allow_pickle=False) as archive:
+        return _load_state(archive)['file_corename']
+
+
+@contextlib.contextmanager
+def lock(path: str) -> Iterator[None]:
+    """
+    Exclusive lock of the partial aggregate file `path`, held by at most one process at a time.
+    The lock is taken on the `<path>.lock` file (left in place), not on the aggregate file itself,
+    as the aggregate file is replaced when saved. POSIX record locks (`fcntl.lockf`) are used,
+    which also work between nodes on NFS and parallel file systems (Lustre, GPFS) supporting them.
+    Locks are held by processes, threads of the same process are not excluded.
+    """
+    with open(path + '.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:  # blocking lock of msvcrt gives up after 10 seconds
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    logger.debug("Waiting for the lock of %s", path)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
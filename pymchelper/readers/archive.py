@@ -0,0 +1,132 @@
+"""
+Reading of input files stored as members of tar or zip archives, without extracting them to disk.
+
+A member of an archive is addressed as `<archive>::<member>`, i.e. `results.tar::run_1/dose_0001.bdo`.
+Such paths can be used everywhere a path to an input file is expected (`fromfile`, `fromfilelist`, ...),
+members are streamed from the archive while being read. Patterns may contain wildcards in both parts,
+i.e. `run_*.tar::*/dose*.bdo` matches all dose files in all `run_*.tar` archives (see `expand_pattern`).
+
+Members of uncompressed tar and zip archives are read directly at their offsets in the archive.
+Members of compressed tar archives (i.e. `.tar.gz`) are decompressed from the beginning of the archive
+each time they are opened, which is much slower.
+"""
+import io
+import logging
+import os
+import tarfile
+import zipfile
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from glob import glob
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+archive_separator = '::'
+
+
+def split_archive_path(path: str) -> Tuple[Optional[str], str]:
+    """
+    Split path to an archive member into archive path and member name.
+    Archive path is None for paths not pointing into an archive.
+
+    >>> split_archive_path("results.tar::run_1/dose_0001.bdo")
+    ('results.tar', 'run_1/dose_0001.bdo')
+    >>> split_archive_path("dose_0001.bdo")
+    (None, 'dose_0001.bdo')
+    """
+    archive, separator, member = str(path).partition(archive_separator)
+    if not separator:
+        return None, archive
+    return archive, member
+
+
+def is_archive_member(path: str) -> bool:
+    """True if `path` points to a member of an archive."""
+    return archive_separator in str(path)
+
+
+def member_name(path: str) -> str:
+    """
+    Name of the file pointed by `path`, without the archive and directory part (as `os.path.basename`).
+
+    >>> member_name("results.tar::run_1/dose_0001.bdo")
+    'dose_0001.bdo'
+    """
+    return os.path.basename(split_archive_path(path)[1])
+
+
+@lru_cache(maxsize=64)
+def _tar_members(archive: str, size: int, mtime_ns: int) -> Dict[str, tarfile.TarInfo]:
+    """
+    Regular file members of the tar archive, by name.
+    Listing a tar archive requires reading all member headers, so the listing is cached,
+    keyed by size and modification time of the archive.
+    """
+    with tarfile.open(archive, 'r:*') as tar:
+        return {member.name: member for member in tar.getmembers() if member.isfile()}
+
+
+def _members(archive: str) -> Union[Dict[str, tarfile.TarInfo], List[str]]:
+    """Regular file members of the tar (name to `TarInfo`) or zip (list of names) archive."""
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zip_file:
+            return [info.filename for info in zip_file.infolist() if not info.is_dir()]
+    stat = os.stat(archive)
+    return _tar_members(archive, stat.st_size, stat.st_mtime_ns)
+
+
+class ClosingReader(io.BufferedReader):
+    """
+    Buffered reader of `stream` which closes also `owner` (i.e. archive of the member being read)
+    together with the stream.
+    """
+
+    def __init__(self, stream: BinaryIO, owner) -> None:
+        super().__init__(stream)
+        self._owner = owner
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._owner.close()
+
+
+def open_member(path: str) -> BinaryIO:
+    """
+    Open member of an archive (`<archive>::<member>` path) for binary reading.
+    Raises `FileNotFoundError` if there is no such member in the archive.
+    """
+    archive, name = split_archive_path(path)
+    members = _members(archive)
+    if name not in members:
+        raise FileNotFoundError("No member {:s} in archive {:s}".format(name, archive))
+    if isinstance(members, dict):
+        archive_file = tarfile.open(archive, 'r:*')
+        member = archive_file.extractfile(members[name])
+    else:
+        archive_file = zipfile.ZipFile(archive)
+        member = archive_file.open(name)
+    return ClosingReader(member, archive_file)
+
+
+def expand_pattern(pattern: str) -> List[str]:
+    """
+    Sorted list of files matching `pattern`, as `glob`, but also members of archives for patterns containing
+    the `::` separator. Member part of the pattern is matched against full member names using `fnmatch`
+    rules (note that `*` matches also `/` there).
+    """
+    archive_pattern, member_pattern = split_archive_path(pattern)
+    if archive_pattern is None:
+        return sorted(glob(pattern))
+    result = []
+    for archive in sorted(glob(archive_pattern)):
+        try:
+            names = _members(archive)
+        except (OSError, tarfile.TarError) as e:
+            logger.error("Cannot list archive %s: %s", archive, e)
+            continue
+        result.extend(archive + archive_separator + name for name in sorted(names)
+                      if fnmatchcase(name, member_pattern))
+    return result
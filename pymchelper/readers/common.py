@@ -1,7 +1,11 @@
 from abc import abstractmethod
 import logging
+import time
 from typing import Optional, TYPE_CHECKING
 
+from pymchelper.readers import tracing
+from pymchelper.readers.sources import InputSource
+
 if TYPE_CHECKING:
     from pymchelper.estimator import Estimator
 
@@ -10,8 +14,9 @@ logger = logging.getLogger(__name__)
 
 class ReaderFactory(object):
 
-    def __init__(self, filename: str) -> None:
-        self.filename: str = filename
+    def __init__(self, filename: InputSource) -> None:
+        # path to a file (or archive member), or a file-like object or buffer, see `pymchelper.readers.sources`
+        self.filename: InputSource = filename
 
     @abstractmethod
     def get_reader(self):
@@ -20,15 +25,31 @@ class ReaderFactory(object):
 
 class Reader(object):
 
-    def __init__(self, filename: str) -> None:
-        self.filename: str = filename
+    # errors are calculated when averaging many files, errors set by the reader are discarded
+    # unless the reader keeps them (i.e. errors stored in files with averaged results)
+    keep_errors: bool = False
+
+    def __init__(self, filename: InputSource, lazy: bool = False, read_chunks: int = 1) -> None:
+        self.filename: InputSource = filename
+        # if True, readers which support it read only metadata, page data is read on first access
+        self.lazy: bool = lazy
+        # large data blocks of plain files are read by that many threads, see `pymchelper.readers.compressed`
+        self.read_chunks: int = read_chunks
 
     def read(self, estimator: 'Estimator') -> bool:
-        result = self.read_data(estimator)
+        if tracing.active:
+            start_time = time.perf_counter()
+            result = self.read_data(estimator)
+            tracing.emit(tracing.TraceEvent(kind='file',
+                                            source=tracing.trace_name(self.filename),
+                                            seconds=time.perf_counter() - start_time))
+        else:
+            result = self.read_data(estimator)
         if not result:
             return False
-        for page in estimator.pages:
-            page.error_raw = None
+        if not self.keep_errors:
+            for page in estimator.pages:
+                page.error_raw = None
         return True
 
     @abstractmethod
@@ -0,0 +1,256 @@
+"""
+Transparent reading of compressed input files (i.e. `.bdo.gz`, `.bdo.xz`, `.bdo.zst` or FLUKA `_fort.21.gz`).
+
+Compressed files are decompressed on the fly while being read, no temporary files are created.
+Decompressing streams support only forward seeking (backward seek restarts decompression from the beginning),
+which matches the way binary files are read by pymchelper readers: headers and data blocks are read in file order.
+Memory-mapping is not possible for compressed files, the data is always read into memory then.
+
+The same applies to members of tar and zip archives (`<archive>::<member>` paths, see `pymchelper.readers.archive`),
+which may also be compressed themselves (i.e. `results.tar::run_1/dose_0001.bdo.gz`),
+and to file-like objects and in-memory buffers (see `pymchelper.readers.sources`), for which the compression
+is recognized by the magic bytes at the beginning of the data.
+
+Large data blocks of plain files may be read in parallel (see `read_chunks` argument of `read_array`):
+the block is split into chunks read with `os.pread` by a pool of threads directly into the output array,
+which keeps more requests in flight on parallel file systems and NVMe drives than a single `np.fromfile` call.
+"""
+import bz2
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+import logging
+import lzma
+import os
+from typing import BinaryIO, Optional
+
+import numpy as np
+from numpy.typing import DTypeLike, NDArray
+
+from pymchelper.readers.archive import ClosingReader, is_archive_member, open_member
+from pymchelper.readers.sources import InputSource, is_path, open_source
+
+logger = logging.getLogger(__name__)
+
+# data is decompressed in chunks of this size (in bytes) directly into the output array
+_chunk_size = 16 * 1024 * 1024
+
+# data blocks are read in parallel chunks of at least this size (in bytes), smaller blocks are read at once
+parallel_chunk_min_size = 4 * 1024 * 1024
+
+# number of bytes at the beginning of the file, used to recognize its type (see `read_head`)
+head_size = 1024
+
+compression_suffixes = ('.gz', '.xz', '.bz2', '.zst')
+
+# magic bytes at the beginning of compressed data, used for sources without filename
+_compression_magic = {b'\x1f\x8b': '.gz', b'\xfd7zXZ\x00': '.xz', b'BZh': '.bz2', b'\x28\xb5\x2f\xfd': '.zst'}
+
+
+def compression_of(source: InputSource) -> Optional[str]:
+    """
+    Compression of the file (one of `compression_suffixes`) or None for uncompressed files.
+    Compression of files on disk is recognized by the filename suffix, of other sources by the magic bytes.
+
+    >>> compression_of("dose_0001.bdo.gz")
+    '.gz'
+    >>> compression_of("dose_0001.bdo") is None
+    True
+    >>> compression_of(gzip.compress(b'xSH12A'))
+    '.gz'
+    """
+    if not is_path(source):
+        with open_source(source) as f:
+            head = f.read(max(len(magic) for magic in _compression_magic))
+        return next((suffix for magic, suffix in _compression_magic.items() if head.startswith(magic)), None)
+    return _compression_suffix_of(source)
+
+
+def _compression_suffix_of(filename: str) -> Optional[str]:
+    """Compression suffix of the filename or None if there is none."""
+    for suffix in compression_suffixes:
+        if str(filename).endswith(suffix):
+            return suffix
+    return None
+
+
+def strip_compression_suffix(filename: str) -> str:
+    """
+    Filename without compression suffix, used to recognize the file type.
+
+    >>> strip_compression_suffix("dose_0001.bdo.xz")
+    'dose_0001.bdo'
+    >>> strip_compression_suffix("run_fort.21")
+    'run_fort.21'
+    """
+    suffix = _compression_suffix_of(filename)
+    if suffix is None:
+        return str(filename)
+    return str(filename)[:-len(suffix)]
+
+
+def is_plain_file(source: InputSource) -> bool:
+    """True for uncompressed files on disk, which can be memory-mapped or read with `np.fromfile`."""
+    return is_path(source) and compression_of(source) is None and not is_archive_member(source)
+
+
+def open_input(source: InputSource) -> BinaryIO:
+    """
+    Open (possibly compressed) file, archive member, file-like object or buffer for binary reading,
+    compressed data is decompressed while being read.
+    """
+    if is_path(source) and not is_archive_member(source):
+        return _open_decompressing(source, compression_of(source))
+    stream = open_member(source) if is_path(source) else open_source(source)
+    if compression_of(source) is None:
+        return stream
+    # compressed member (or buffer) is decompressed while being read from the underlying stream
+    return ClosingReader(_open_decompressing(stream, compression_of(source)), stream)
+
+
+def _open_decompressing(source, suffix: Optional[str]) -> BinaryIO:
+    """Open file (path or binary stream) `source` compressed as indicated by `suffix` (None for uncompressed)."""
+    if suffix == '.gz':
+        return gzip.open(source, 'rb')
+    if suffix == '.xz':
+        return lzma.open(source, 'rb')
+    if suffix == '.bz2':
+        return bz2.open(source, 'rb')
+    if suffix == '.zst':
+        return _open_zstd(source)
+    if suffix is None:
+        return open(source, 'rb')
+    raise ValueError("Unsupported compression: {}".format(suffix))
+
+
+def _open_zstd(source) -> BinaryIO:
+    """Open zstd compressed file, using standard library (Python >= 3.14) or `zstandard` package."""
+    try:
+        from compression import zstd
+        return zstd.open(source, 'rb')
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError as e:
+        logger.error("Reading zstd compressed files requires Python >= 3.14 or zstandard package "
+                     "(please install zstandard).")
+        raise e
+    return zstandard.open(source, 'rb')
+
+
+def read_head(source: InputSource, size: int = head_size) -> bytes:
+    """First `size` bytes of the (decompressed) file, or less if the file is shorter."""
+    with open_input(source) as f:
+        return f.read(size)
+
+
+def read_array(f: BinaryIO, dtype: DTypeLike, count: int, read_chunks: int = 1) -> NDArray:
+    """
+    Read `count` elements of `dtype` from the current position of binary stream `f`, as `np.fromfile` does.
+    Regular files are read with `np.fromfile`, other streams (i.e. decompressing ones) are read
+    in bounded-size chunks directly into the memory of the returned array.
+    With `read_chunks` > 1 large blocks of regular files are read by that many threads, see `pread_array`.
+    Less than `count` elements are returned if the end of stream is reached.
+    """
+    if isinstance(f, io.BufferedReader) and isinstance(f.raw, io.FileIO):
+        if read_chunks > 1 and _parallel_read_possible(dtype, count):
+            offset = f.tell()
+            array = pread_array(f.fileno(), dtype, count, offset, read_chunks)
+            f.seek(offset + array.nbytes)
+            return array
+        return np.fromfile(f, dtype=dtype, count=count)
+    dtype = np.dtype(dtype)
+    buffer = bytearray(dtype.itemsize * count)
+    view = memoryview(buffer)
+    nbytes = 0
+    while nbytes < len(buffer):
+        nread = f.readinto(view[nbytes:nbytes + _chunk_size])
+        if not nread:
+            break
+        nbytes += nread
+    view.release()
+    return np.frombuffer(buffer, dtype=dtype, count=nbytes // dtype.itemsize)
+
+
+def read_array_at(filename: InputSource,
+                  dtype: DTypeLike,
+                  count: int,
+                  offset: int = 0,
+                  read_chunks: int = 1) -> NDArray:
+    """Read `count` elements of `dtype` starting at `offset` (in bytes, of uncompressed data) of a possibly
+    compressed file, archive member or other source,
+    as `np.fromfile(filename, dtype=dtype, count=count, offset=offset)` does.
+    With `read_chunks` > 1 large blocks of plain files are read in parallel, see `pread_array`."""
+    if is_plain_file(filename):
+        if read_chunks > 1 and _parallel_read_possible(dtype, count):
+            with open(filename, 'rb') as f:
+                return pread_array(f.fileno(), dtype, count, offset, read_chunks)
+        return np.fromfile(filename, dtype=dtype, count=count, offset=offset)
+    with open_input(filename) as f:
+        f.seek(offset)
+        return read_array(f, dtype, count)
+
+
+def _parallel_read_possible(dtype: DTypeLike, count: int) -> bool:
+    """True if the block is large enough to be split into chunks and the platform has `os.pread`."""
+    return hasattr(os, 'pread') and np.dtype(dtype).itemsize * count >= 2 * parallel_chunk_min_size
+
+
+def pread_array(fd: int, dtype: DTypeLike, count: int, offset: int, read_chunks: int) -> NDArray:
+    """
+    Read `count` elements of `dtype` starting at `offset` of the open file descriptor `fd`,
+    in up to `read_chunks` chunks (of at least `parallel_chunk_min_size` bytes) read in parallel with `os.pread`
+    into a preallocated array. The kernel is advised (where `os.posix_fadvise` is available) that the block
+    is going to be read sequentially and soon, so it starts read-ahead of the whole block at once.
+    The file position of `fd` is not changed. Less than `count` elements are returned if the file is shorter.
+    """
+    dtype = np.dtype(dtype)
+    array = np.empty(count, dtype=dtype)
+    nbytes = array.nbytes
+    if nbytes == 0:
+        return array
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, offset, nbytes, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, offset, nbytes, os.POSIX_FADV_WILLNEED)
+
+    read_chunks = max(1, min(read_chunks, nbytes // parallel_chunk_min_size))
+    chunk_size = -(-nbytes // read_chunks)
+    view = memoryview(array.view(np.uint8))
+    starts = range(0, nbytes, chunk_size)
+
+    def read_chunk(start: int) -> int:
+        return _pread_into(fd, view[start:start + chunk_size], offset + start)
+
+    if read_chunks == 1:
+        nread = [read_chunk(0)]
+    else:
+        with ThreadPoolExecutor(max_workers=read_chunks) as executor:
+            nread = list(executor.map(read_chunk, starts))
+    view.release()
+
+    # on a short read (end of file) only the data up to the first incomplete chunk is valid
+    nbytes_read = 0
+    for start, chunk_nread in zip(starts, nread):
+        nbytes_read = start + chunk_nread
+        if chunk_nread < min(chunk_size, nbytes - start):
+            break
+    if nbytes_read < nbytes:
+        return array[:nbytes_read // dtype.itemsize].copy()
+    return array
+
+
+def _pread_into(fd: int, view: memoryview, offset: int) -> int:
+    """Fill `view` with the data at `offset` of `fd`, returns the number of bytes read (less at the end of file)."""
+    nbytes = 0
+    while nbytes < len(view):
+        if hasattr(os, 'preadv'):
+            nread = os.preadv(fd, [view[nbytes:]], offset + nbytes)
+        else:
+            data = os.pread(fd, len(view) - nbytes, offset + nbytes)
+            nread = len(data)
+            view[nbytes:nbytes + nread] = data
+        if not nread:
+            break
+        nbytes += nread
+    return nbytes
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from functools import partial
 import logging
+import struct
 from typing import Optional
 
 import numpy as np
@@ -8,10 +10,28 @@ from pymchelper.axis import AxisDescription, MeshAxis
 from pymchelper.flair.Input import Particle
 from pymchelper.page import Page
 from pymchelper.readers.common import ReaderFactory, Reader
+from pymchelper.readers.archive import member_name
+from pymchelper.readers.compressed import is_plain_file, read_array_at, strip_compression_suffix
+from pymchelper.readers.sources import source_name
 from pymchelper.flair.Data import Usrbin, UsrTrack, unpackArray, Usrbdx, Resnuclei, Usrxxx
+import pymchelper.flair.common.fortran as fortran
 
 logger = logging.getLogger(__name__)
 
+# sizes of the first Fortran record (file header) of USRxxx binary files accepted by `Usrxxx` reader
+_usrxxx_header_sizes = (116, 120, 124, 128)
+
+
+def is_fluka_header(head: bytes) -> bool:
+    """
+    Check if the file starting with `head` bytes (see `read_head`) is a FLUKA USRxxx binary file,
+    without parsing it with `Usrxxx`: the first Fortran record has to be a complete USRxxx file header.
+    """
+    if len(head) < 4:
+        return False
+    (size, ) = struct.unpack("=i", head[:4])
+    return size in _usrxxx_header_sizes and head[4 + size:8 + size] == head[:4]
+
 
 class FlukaReaderFactory(ReaderFactory):
     """
@@ -41,10 +61,21 @@ class FlukaReader(Reader):
         :return: corename part of output file or None in case filename doesn't follow Fluka naming pattern
         """
         core_name = None
-        if "_fort" in self.filename:
-            core_name = self.filename[-2:]
+        name = source_name(self.filename)
+        if "_fort" in member_name(name):
+            core_name = strip_compression_suffix(name)[-2:]
         return core_name
 
+    def _set_page_data(self, page: Page, usr_object: Usrxxx, det_no: int, rescaling_factor: float = 1.0) -> None:
+        """
+        Fill page with data of detector `det_no`, or only set up a data loader in lazy mode.
+        Detector headers (already parsed by `usr_object`) are enough to build all the page metadata.
+        """
+        if self.lazy:
+            page.set_data_loader(partial(_read_detector_data, usr_object, det_no, rescaling_factor, self.read_chunks))
+        else:
+            page.data_raw = _read_detector_data(usr_object, det_no, rescaling_factor, self.read_chunks)
+
     def parse_usrbin(self, estimator) -> Optional[Usrbin]:
         """
         USRBIN scores distribution of one of several quantities in a regular spatial
@@ -105,8 +136,7 @@ class FlukaReader(Reader):
 
                 # unpack detector data
                 # TODO cross-check if reshaping is needed
-                page.data_raw = np.array(unpackArray(usr_object.readData(det_no)))
-                page.data_raw *= rescaling_factor
+                self._set_page_data(page, usr_object, det_no, rescaling_factor)
 
                 estimator.add_page(page)
 
@@ -179,7 +209,7 @@ class FlukaReader(Reader):
 
                 # unpack detector data
                 # TODO cross-check if reshaping is needed
-                page.data_raw = np.array(unpackArray(usr_object.readData(det_no)))
+                self._set_page_data(page, usr_object, det_no)
 
                 estimator.add_page(page)
 
@@ -239,7 +269,7 @@ class FlukaReader(Reader):
 
                 # unpack detector data
                 # TODO cross-check if reshaping is needed
-                page.data_raw = np.array(unpackArray(usr_object.readData(det_no)))
+                self._set_page_data(page, usr_object, det_no)
 
                 estimator.add_page(page)
             return usr_object
@@ -260,7 +290,7 @@ class FlukaReader(Reader):
 
                 # unpack detector data
                 # TODO cross-check if reshaping is needed
-                page.data_raw = np.array(unpackArray(usr_object.readData(det_no)))
+                self._set_page_data(page, usr_object, det_no)
 
                 estimator.add_page(page)
             return usr_object
@@ -296,6 +326,38 @@ class FlukaReader(Reader):
         return True
 
 
+def _read_detector_data(usr_object: Usrxxx,
+                        det_no: int,
+                        rescaling_factor: float = 1.0,
+                        read_chunks: int = 1) -> np.ndarray:
+    """
+    Read and unpack data of detector `det_no` from Fluka binary file described by `usr_object`.
+    With `read_chunks` > 1 large USRBIN data records of plain files are read in parallel chunks
+    (see `pymchelper.readers.compressed.pread_array`), instead of being read and unpacked by `Usrbin.readData`.
+    """
+    if read_chunks > 1 and isinstance(usr_object, Usrbin) and is_plain_file(usr_object.file):
+        offset, size = _usrbin_data_record(usr_object.file, det_no)
+        data = read_array_at(usr_object.file, dtype='=f4', count=size // 4, offset=offset, read_chunks=read_chunks)
+        data = data.astype(np.float64)
+    else:
+        data = np.array(unpackArray(usr_object.readData(det_no)))
+    if rescaling_factor != 1.0:
+        data *= rescaling_factor
+    return data
+
+
+def _usrbin_data_record(filename: str, det_no: int) -> tuple[int, int]:
+    """Offset and size (in bytes) of the data record of detector `det_no` of USRBIN file, as read by `readData`."""
+    with open(filename, 'rb') as f:
+        fortran.skip(f)  # file header
+        for _ in range(det_no):
+            fortran.skip(f)  # detector header
+            fortran.skip(f)  # detector data
+        fortran.skip(f)  # detector header
+        (size, ) = struct.unpack("=i", f.read(4))
+        return f.tell(), size
+
+
 def get_particle_from_db(particle_id: int) -> Optional[Particle]:
     """Get particle from Flair database by its id"""
     try:
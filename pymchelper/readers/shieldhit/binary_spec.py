@@ -20,6 +20,11 @@ class SHBDOTagID(IntEnum):
     rt_nstat = 0xAA00  # number of actually simulated particles
     rt_time = 0xAA01  # [unsigned long int] optional runtime in seconds
     rt_timesim = 0xAA02  # optional simulation time in seconds, excluding initialization.
+    # [pymchelper] state of the averaging of results averaged from many files, written together with the error blocks.
+    # Not written by SH12A, only by pymchelper (see `SHBinaryWriter`), so such files can be averaged again
+    rt_file_counter = 0xAAF0  # [int] number of averaged files
+    rt_error_type = 0xAAF1  # [int] type of errors stored in the error blocks, see `ErrorEstimate`
+    rt_nstat_squared = 0xAAF2  # [double] sum of squares of the numbers of primaries of the averaged files
 
     # Group 0xCB00 - 0xCBFF : Beam configuration
     jpart0 = 0xCB00  # [int] primary particle ID, in SH12A JPART terminology (32768 = INVALID)
@@ -115,6 +120,9 @@ class SHBDOTagID(IntEnum):
     # /* page data */
     data_block = 0xDDBB  # /* data block, identical to SHBDO_DET_DATA */
     detector_unit = 0xDDBC  # /* ASCII string unit, including any differentials */
+    # [pymchelper] errors of the data block, same layout and normalisation as data block.
+    # Not written by SH12A, only by pymchelper for averaged results (see `SHBinaryWriter`)
+    data_error_block = 0xDDBD
 
     # /* Page differential data */
     page_diff_flag = 0xDDD0  # /* flags if 1 or 2 differential binning was set. 1 for set, -1 for set as log10. */
@@ -208,6 +216,9 @@ detector_name_from_bdotag: Dict[int, str] = {
     SHBDOTagID.user: 'user',
     SHBDOTagID.host: 'host',
     SHBDOTagID.rt_nstat: 'number_of_primaries',
+    SHBDOTagID.rt_file_counter: 'file_counter',
+    SHBDOTagID.rt_error_type: 'error_type',
+    SHBDOTagID.rt_nstat_squared: 'number_of_primaries_squared',
     SHBDOTagID.number_of_pages: 'page_count',
     SHBDOTagID.geo_unit_ids: 'geo_unit_ids',
     SHBDOTagID.geo_units: 'geo_units',
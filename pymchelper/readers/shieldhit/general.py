@@ -1,12 +1,17 @@
 from enum import IntEnum
+import io
 import logging
 import os
-from typing import TypeVar
+from typing import Optional, Type, TypeVar
 
 import numpy as np
 
 from pymchelper.readers.common import ReaderFactory
-from pymchelper.readers.shieldhit.reader_base import read_next_token
+from pymchelper.readers.compressed import head_size, is_plain_file, open_input, read_array, read_head, \
+    strip_compression_suffix
+from pymchelper.readers.sources import InputSource, is_path
+from pymchelper.readers.shieldhit.reader_base import SHReader, bdo_header_dtype, decode_payload, iter_bdo_tokens, \
+    log_token, payload_nbytes, scan_tokens
 from pymchelper.readers.shieldhit.reader_bdo2016 import SHReaderBDO2016
 from pymchelper.readers.shieldhit.reader_bdo2019 import SHReaderBDO2019
 from pymchelper.readers.shieldhit.reader_bin2010 import SHReaderBin2010
@@ -17,22 +22,34 @@ logger = logging.getLogger(__name__)
 # path-like type hint which supports both strings and Path objects
 PathLike = TypeVar("PathLike", str, bytes, os.PathLike)
 
+# first bytes of BDO2016 and BDO2019 files
+sh_bdo_magic_number = b'xSH12A'
+
+
+def _has_bdo_name(file_path: InputSource) -> bool:
+    """
+    BDO files on disk are recognized by the `.bdo` extension (possibly followed by a compression suffix),
+    other sources (file-like objects and buffers) only by their contents.
+    """
+    return not is_path(file_path) or strip_compression_suffix(file_path).endswith(".bdo")
+
 
 def file_has_sh_magic_number(file_path: PathLike) -> bool:
     """
     BDO binary files, introduced in 2016 (BDO2016 and BDO2019 formats) starts with 6 magic bytes xSH12A
+    Compressed files (i.e. `.bdo.gz`), archive members, file-like objects and buffers are supported,
+    see `pymchelper.readers.compressed`.
     :param file_path: Binary file filename
     :return: True if binary file starts with SH magic number
     """
-    sh_bdo_magic_number = b'xSH12A'
     has_bdo_magic_number = False
-    if not str(file_path).endswith(".bdo"):
+    if not _has_bdo_name(file_path):
         return False
-    if os.path.getsize(file_path) < 6:
+    if is_plain_file(file_path) and os.path.getsize(file_path) < 6:
         return False
-    with open(file_path, "rb") as f:
+    with open_input(file_path) as f:
         d1 = np.dtype([('magic', 'S6')])  # TODO add a check if file has less than 6 bytes or is empty
-        x = np.fromfile(f, dtype=d1, count=1)
+        x = read_array(f, dtype=d1, count=1)
         if x:
             # compare first 6 bytes with reference string
             has_bdo_magic_number = (sh_bdo_magic_number == x['magic'][0])
@@ -49,19 +66,19 @@ def extract_sh_ver(file_path: PathLike) -> str:
     """
 
     ver = ''
-    if not str(file_path).endswith(".bdo"):
+    if not _has_bdo_name(file_path):
         return ver
-    with open(file_path, "rb") as f:
+    with open_input(file_path) as f:
         d1 = np.dtype([('magic', 'S6'), ('end', 'S2'),
                        ('vstr', 'S16')])  # TODO add a check if file has less than 6 bytes or is empty
-        x = np.fromfile(f, dtype=d1, count=1)
+        x = read_array(f, dtype=d1, count=1)
         logger.debug("File %s, raw version info %s", file_path, str(x['vstr'][0]))
         try:
             ver = x['vstr'][0].decode('ASCII')
         except UnicodeDecodeError:
             ver = ''
 
-    logger.debug("File {:s}, SH12A version: {:s}".format(file_path, ver))
+    logger.debug("File %s, SH12A version: %s", file_path, ver)
     return ver
 
 
@@ -78,80 +95,86 @@ class SHFileFormatId(IntEnum):
 
 def read_token(file_path: PathLike, token_id):
     """
-    TODO
-    :param filename:
-    :param token_id:
-    :return:
+    Reads a single token from a BDO file.
+    Only token headers are read while looking for the token, all other payloads are skipped (see `iter_bdo_tokens`),
+    so the cost of this function doesn't depend on the size of the data blocks stored in the file.
+    :param file_path: Binary file filename
+    :param token_id: tag id of the token to be read
+    :return: decoded token payload (scalar, string or array) or None if token was not found
     """
-    if not str(file_path).endswith(".bdo"):
+    if not _has_bdo_name(file_path):
         return None
-    with open(file_path, "rb") as f:
+    for token in iter_bdo_tokens(file_path, tags=(token_id, )):
+        log_token(logger, token.tag_id, token.dtype, token.length, token.payload)
+        return token.payload
+    return None
 
-        # skip ASCII header
-        d1 = np.dtype([('magic', 'S6'), ('endiannes', 'S2'), ('vstr', 'S16')])
-        np.fromfile(f, dtype=d1, count=1)
 
-        # read tokens from rest of the file
-        while f:
-            token = read_next_token(f)
-            if token is None:
-                break
-            pl_id, _pl_type, _pl_len, _pl = token
-            if pl_id == token_id:
-
-                logger.debug("Read token {:s} (0x{:02x}) value {} type {:s} length {:d}".format(
-                    SHBDOTagID(pl_id).name, pl_id, _pl, _pl_type.decode('ASCII'), _pl_len))
-
-                pl = [None] * _pl_len
-
-                # decode all strings (currently there will never be more than one per token)
-                if 'S' in _pl_type.decode('ASCII'):
-                    for i, _j in enumerate(_pl):
-                        pl[i] = _pl[i].decode('ASCII').strip()
-                else:
-                    pl = _pl
-
-                if len(pl) == 1:
-                    pl = pl[0]
-
-                return pl
-        return None
+def _format_token_in_head(head: bytes) -> Optional[int]:
+    """
+    Value of the format token, if it is found among the tokens fully contained in `head`
+    (first bytes of a BDO file, as returned by `read_head`), None if there is no format token in the file.
+    Raises LookupError if the format token may be located after the `head`.
+    """
+    f = io.BytesIO(head)
+    f.seek(bdo_header_dtype.itemsize)
+    for pl_id, pl_type, pl_len, offset in scan_tokens(f):
+        if offset + payload_nbytes(pl_type, pl_len) > len(head):
+            break
+        if pl_id == SHBDOTagID.format:
+            return decode_payload(pl_type, np.frombuffer(head, dtype=pl_type, count=pl_len, offset=offset))
+    else:
+        if len(head) < head_size:
+            return None  # whole file was scanned
+    raise LookupError("Format token not found in the first {:d} bytes".format(len(head)))
+
+
+def reader_from_head(file_path: InputSource, head: bytes) -> Optional[Type[SHReader]]:
+    """
+    SHIELD-HIT12A reader class for the file `file_path` starting with `head` bytes (see `read_head`).
+    Usually `head` is enough to recognize the format, only if the format token is not found in `head`
+    the token stream of the file is scanned.
+    None is returned for BDO files with a format token other than BDO2016 or BDO2019.
+    """
+    # magic number was introduced together with first token-based BDO file format (BDO2016)
+    # presence of magic number means we could have BDO2016 or BDO2019 format
+    if not (_has_bdo_name(file_path) and head.startswith(sh_bdo_magic_number)):
+        # lack of magic number means we expect Fortran-style binary format (BIN2010)
+        return SHReaderBin2010
+
+    reader = SHReaderBDO2019
+
+    # format tag specifying binary standard was introduced in SH12A v0.7.4-dev on  07.06.2019 (commit 6eddf98)
+    try:
+        file_format = _format_token_in_head(head)
+    except LookupError:
+        file_format = read_token(file_path, SHBDOTagID.format)
+    if file_format:
+        logger.debug("File format: %s", file_format)
+        if file_format == SHFileFormatId.bdo2019:
+            reader = SHReaderBDO2019
+        elif file_format == SHFileFormatId.bdo2016:
+            reader = SHReaderBDO2016
+        else:
+            logger.warning("Unsupported format %s found in BDO file %s", file_format, file_path)
+            return None
+    else:
+        # in case format tag is missing we default to BDO2016 format
+        # this mean we cannot read BDO2019 files generated with SH12A built before 07.06.2019
+        logger.info("File format information missing (token)")
+        reader = SHReaderBDO2016
+    return reader
 
 
 class SHReaderFactory(ReaderFactory):
 
     def get_reader(self):
         """
-        Inspect binary file and return appropriate reader object
+        Inspect binary file and return appropriate reader object.
+        Only the first bytes of the file are read, see `reader_from_head`.
         :return:
         """
-        reader = None
-
-        # TODO add ZIP file unpacking
-
-        # magic number was introduced together with first token-based BDO file format (BDO2016)
-        # presence of magic number means we could have BDO2016 or BDO2019 format
-        if file_has_sh_magic_number(self.filename):
-            reader = SHReaderBDO2019
-
-            # format tag specifying binary standard was introduced in SH12A v0.7.4-dev on  07.06.2019 (commit 6eddf98)
-            file_format = read_token(self.filename, SHBDOTagID.format)
-            if file_format:
-                logger.debug("File format: {} {:s}".format(file_format, SHFileFormatId(file_format).name))
-                if file_format == SHFileFormatId.bdo2019:
-                    reader = SHReaderBDO2019
-                elif file_format == SHFileFormatId.bdo2016:
-                    reader = SHReaderBDO2016
-                else:
-                    print("What shall we do ?")
-            else:
-                # in case format tag is missing we default to BDO2016 format
-                # this mean we cannot read BDO2019 files generated with SH12A built before 07.06.2019
-                logger.info("File format information missing (token)")
-                reader = SHReaderBDO2016
-        else:
-            # lack of magic number means we expect Fortran-style binary format (BIN2010)
-            reader = SHReaderBin2010
+        reader = reader_from_head(self.filename, read_head(self.filename))
 
         # ver_short = extract_sh_ver(self.filename)
         # logger.info("Short version: {:s}".format(str(ver_short)))
@@ -0,0 +1,190 @@
+"""
+Layout reuse for many small BDO2019 files with identical structure.
+
+Parameter sweeps, zone scorers and parallel jobs produce thousands of small BDO files of the same estimator,
+which differ only in data blocks and a few runtime tokens (number of primaries, file date, RNG offset, ...).
+For such files most of the reading time goes to the format recognition, token walk and page construction.
+
+Here the first file is parsed once and its layout is recorded: offsets and dtypes of data blocks
+and of the runtime tokens, together with all other bytes of the file (headers of all tokens and payloads
+of the metadata tokens), which form a fingerprint of the structure. Other files are read at once,
+compared with the fingerprint and, if it matches, only the runtime tokens and data blocks are decoded,
+the estimator is a copy of the one built from the first file. Files with a different size or fingerprint
+are reported as not matching and need to be read by the regular reader.
+"""
+import copy
+from dataclasses import dataclass, field
+import logging
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from pymchelper.estimator import Estimator
+from pymchelper.readers import tracing
+from pymchelper.readers.compressed import open_input
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.reader_base import BDOToken, decode_payload, iter_bdo_tokens, payload_nbytes
+from pymchelper.readers.shieldhit.reader_bdo2019 import SHReaderBDO2019, _finalize_estimator, _normalise_pages, \
+    _process_token
+from pymchelper.readers.shieldhit.selection import PageSelection, apply_selection
+from pymchelper.readers.sniffer import sniff_reader
+from pymchelper.readers.sources import InputSource, is_buffer
+
+logger = logging.getLogger(__name__)
+
+# tokens which differ between files of the same estimator, they are read from each file
+# (all of them set estimator-level metadata), payloads of all other tokens need to be identical
+runtime_tags = frozenset({
+    SHBDOTagID.filedate,
+    SHBDOTagID.user,
+    SHBDOTagID.host,
+    SHBDOTagID.rt_nstat,
+    SHBDOTagID.rt_time,
+    SHBDOTagID.rt_timesim,
+    SHBDOTagID.rt_file_counter,
+    SHBDOTagID.rt_error_type,
+    SHBDOTagID.rt_nstat_squared,
+    SHBDOTagID.ioffset,
+    SHBDOTagID.filename_or_geotype,
+})
+
+
+@dataclass
+class BDOLayout:
+    """
+    Layout of a BDO2019 file: where its runtime tokens and data blocks are, and what all other bytes are.
+
+    `template` is the estimator read from the first file, before page selection and normalisation,
+    its pages hold no data. Estimators read using the layout share its metadata (i.e. axes), which is not modified.
+    """
+    size: int
+    template: Estimator
+    # (tag, dtype, length, offset) of the runtime tokens
+    runtime_tokens: Tuple[Tuple[int, bytes, int, int], ...]
+    # (page index, tag, dtype, length, offset) of the data blocks (and error blocks, if present)
+    data_blocks: Tuple[Tuple[int, int, bytes, int, int], ...]
+    # (start, stop, bytes) of the file parts which make the fingerprint (everything but the payloads above)
+    fingerprint: Tuple[Tuple[int, int, bytes], ...] = field(repr=False)
+
+    def matches(self, data: Union[bytes, memoryview]) -> bool:
+        """True if `data` (whole contents of a file) has the same structure as the file the layout was built from."""
+        if len(data) != self.size:
+            return False
+        data = memoryview(data)
+        return all(data[start:stop] == expected for start, stop, expected in self.fingerprint)
+
+
+def _read_all(source: InputSource) -> Union[bytes, memoryview]:
+    """Whole contents of a file (or other source), buffers are not copied."""
+    if is_buffer(source):
+        return memoryview(source).cast('B')
+    with open_input(source) as f:
+        return f.read()
+
+
+def build_layout(source: InputSource) -> Optional[BDOLayout]:
+    """Parse the file and record its layout, None for files which are not in the BDO2019 format."""
+    if sniff_reader(source) is not SHReaderBDO2019:
+        logger.debug("Layout of %s not recorded, it is not a BDO2019 file", source)
+        return None
+    data = _read_all(source)
+    template = Estimator()
+    runtime_tokens = []
+    data_blocks = []
+    variable_parts = []
+    for token in iter_bdo_tokens(memoryview(data), decode=False, name=tracing.trace_name(source)):
+        tag, pl_type, pl_len, _, offset = token
+        if tag in runtime_tags:
+            runtime_tokens.append((tag, pl_type, pl_len, offset))
+        elif tag in (SHBDOTagID.data_block, SHBDOTagID.data_error_block):
+            data_blocks.append((len(template.pages) - 1, tag, pl_type, pl_len, offset))
+        else:
+            _process_token(template, token)
+            continue
+        variable_parts.append((offset, offset + payload_nbytes(pl_type, pl_len)))
+    _finalize_estimator(template)
+    template.file_format = 'bdo2019'
+    template.data_order = 'F'
+
+    fingerprint = []
+    start = 0
+    for stop, next_start in variable_parts + [(len(data), len(data))]:
+        fingerprint.append((start, stop, bytes(data[start:stop])))
+        start = next_start
+    logger.debug("Recorded layout of %s: %d runtime tokens, %d data blocks", source, len(runtime_tokens),
+                 len(data_blocks))
+    return BDOLayout(size=len(data),
+                     template=template,
+                     runtime_tokens=tuple(runtime_tokens),
+                     data_blocks=tuple(data_blocks),
+                     fingerprint=tuple(fingerprint))
+
+
+def read_with_layout(layout: BDOLayout,
+                     source: InputSource,
+                     selection: Optional[PageSelection] = None) -> Optional[Estimator]:
+    """
+    Read the file using `layout`: only the runtime tokens and data blocks are decoded.
+    Page selection and normalisation are applied as by `SHReaderBDO2019`.
+    Returns None if the file does not match the layout.
+    """
+    data = _read_all(source)
+    if not layout.matches(data):
+        return None
+
+    estimator = copy.copy(layout.template)
+    estimator.pages = tuple(copy.copy(page) for page in layout.template.pages)
+    for page in estimator.pages:
+        page.estimator = estimator
+    for page_index, tag, pl_type, pl_len, offset in layout.data_blocks:
+        # read-only view of the file contents, copied only when modified (i.e. normalised)
+        payload = np.asarray(decode_payload(pl_type, np.frombuffer(data, dtype=pl_type.decode('ASCII'), count=pl_len,
+                                                                   offset=offset)))
+        if tag == SHBDOTagID.data_block:
+            estimator.pages[page_index].data_raw = payload
+        else:
+            estimator.pages[page_index].error_raw = payload
+    for tag, pl_type, pl_len, offset in layout.runtime_tokens:
+        payload = np.frombuffer(data, dtype=pl_type.decode('ASCII'), count=pl_len, offset=offset)
+        _process_token(estimator, BDOToken(tag, pl_type, pl_len, payload, offset))
+
+    if selection is not None:
+        apply_selection(estimator, selection)
+    _normalise_pages(estimator)
+    return estimator
+
+
+class LayoutReader:
+    """
+    Reads files using the layout of the first file read (see `BDOLayout`), used by `fromfilelist`.
+    Can be shared by many threads, the layout is recorded only once.
+    """
+
+    def __init__(self, selection: Optional[PageSelection] = None) -> None:
+        self.selection: Optional[PageSelection] = selection
+        self.layout: Optional[BDOLayout] = None
+        self._layout_recorded = False
+        self._lock = threading.Lock()
+
+    def read(self, source: InputSource) -> Optional[Estimator]:
+        """Estimator read from `source` using the layout, None if the file needs to be read by the regular reader."""
+        with self._lock:
+            if not self._layout_recorded:
+                self.layout = build_layout(source)
+                self._layout_recorded = True
+        if self.layout is None:
+            return None
+        if tracing.active:
+            start_time = time.perf_counter()
+            estimator = read_with_layout(self.layout, source, self.selection)
+            tracing.emit(tracing.TraceEvent(kind='file',
+                                            source=tracing.trace_name(source),
+                                            nbytes=self.layout.size,
+                                            seconds=time.perf_counter() - start_time))
+        else:
+            estimator = read_with_layout(self.layout, source, self.selection)
+        if estimator is None:
+            logger.info("Structure of %s differs from the recorded layout, reading it with the full parser", source)
+        return estimator
@@ -1,11 +1,22 @@
+from dataclasses import dataclass
 import logging
+import os
 from pathlib import Path
+import time
+from typing import Any, Container, Iterator, NamedTuple, Optional, Tuple
 
 import numpy as np
+from numpy.typing import NDArray
 
 from pymchelper.axis import MeshAxis
 from pymchelper.estimator import Estimator
 from pymchelper.readers.common import Reader
+from pymchelper.readers.archive import member_name
+from pymchelper.readers import tracing
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.compressed import is_plain_file, open_input, read_array, read_array_at, strip_compression_suffix
+from pymchelper.readers.sources import InputSource, source_name
+from pymchelper.readers.shieldhit.selection import PageSelection, apply_selection
 from pymchelper.shieldhit.detector.detector_type import SHDetType
 from pymchelper.shieldhit.detector.estimator_type import SHGeoType
 
@@ -15,8 +26,52 @@ logger = logging.getLogger(__name__)
 class SHReader(Reader):
     """
     Reads binary output files generated by SHIELD-HIT12A code.
+
+    With `mmap=True` the large data blocks are not copied into memory, instead `Page.data_raw`
+    holds a read-only `np.memmap` view of the file. Data is copied only if it needs to be modified
+    (i.e. normalised by the number of primaries), see `Page.transform_data`.
+    With `lazy=True` only the metadata is read, data blocks are read on first access to `Page.data_raw`.
+    With `selection` set only the selected pages (and bins) are read, see `PageSelection`.
+    With `index_file=True` token stream of BDO files is not walked, token offsets are taken from
+    the `.idx` sidecar file (created on first read), see `pymchelper.readers.shieldhit.token_index`.
+    With `read_chunks` > 1 large data blocks are read in that many chunks in parallel,
+    see `pymchelper.readers.compressed.pread_array`.
     """
 
+    def __init__(self,
+                 filename: InputSource,
+                 mmap: bool = False,
+                 lazy: bool = False,
+                 selection: Optional[PageSelection] = None,
+                 index_file: bool = False,
+                 read_chunks: int = 1) -> None:
+        super().__init__(filename, lazy=lazy, read_chunks=read_chunks)
+        self.mmap: bool = mmap
+        self.selection: Optional[PageSelection] = selection
+        self.index_file: bool = index_file
+
+    @property
+    def defer_data(self) -> bool:
+        """True if data blocks are read only after all page metadata is parsed (lazy mode or page selection)."""
+        return self.lazy or self.selection is not None
+
+    @property
+    def mmap_data(self) -> bool:
+        """True if data blocks are memory-mapped, also needed to read only a box of bins from the file."""
+        return self.mmap or (self.selection is not None and self.selection.box is not None)
+
+    def select_pages(self, estimator: Estimator) -> None:
+        """
+        Apply page selection (if set) to the estimator with all page metadata already read.
+        Unless in lazy mode, the data of selected pages is read here.
+        """
+        if self.selection is None:
+            return
+        apply_selection(estimator, self.selection)
+        if not self.lazy:
+            for page in estimator.pages:
+                page.load_data()
+
     def read_data(self, estimator: Estimator, nscale: float = 1.) -> bool:
         """
         TODO
@@ -32,7 +87,7 @@ class SHReader(Reader):
         """
         Extracts and returns the "corename" of the file, which is a base name stripped of
         any trailing 4-digit integers and underscores. This method is applicable to files
-        with extensions `.bdo` or `.bdox`.
+        with extensions `.bdo` or `.bdox` (possibly compressed, i.e. `.bdo.gz`, or stored in an archive).
 
         The expected file naming conventions are:
         - `corenameABCD.bdo` or `corename_ABCD.bdo` (where `ABCD` is a 4-digit integer)
@@ -43,7 +98,7 @@ class SHReader(Reader):
 
         :return: The corename of the file, or an empty string if the extension is invalid.
         """
-        file_path = Path(self.filename)
+        file_path = Path(strip_compression_suffix(member_name(source_name(self.filename))))
         if file_path.suffix not in {".bdo", ".bdox"}:
             return ""
 
@@ -192,33 +247,299 @@ def _get_detector_unit(detector_type, geotyp):
     return _detector_units.get(detector_type, ("(nil)", "(nil)"))
 
 
-def read_next_token(f):
+# BDO files start with a fixed-size header: magic bytes, endianness marker and a free-form version string
+bdo_header_dtype = np.dtype([('magic', 'S6'), ('end', 'S2'), ('vstr', 'S16')])
+
+# each token starts with a fixed-size header: tag id, payload numpy dtype string and payload number of elements
+bdo_token_header_dtype = np.dtype([('pl_id', '<u8'), ('pl_type', 'S8'), ('pl_len', '<u8')])
+
+
+class BDOToken(NamedTuple):
+    """
+    Single token of a BDO file, the first 4 fields can be unpacked as the tuple returned by `read_next_token`.
+    `payload` is a numpy array (raw payload, possibly memory-mapped), a decoded value (see `decode_payload`)
+    or a `PayloadLoader` if reading of the payload was skipped.
+    """
+    tag_id: int  # see SHBDOTagID
+    dtype: bytes  # numpy dtype string of the payload, i.e. b'<f8'
+    length: int  # number of payload elements
+    payload: Any
+    offset: int  # payload offset in bytes, from the beginning of the file
+
+
+def read_token_header(f) -> Optional[Tuple[int, bytes, int]]:
+    """
+    Reads only the 24-byte header of the next token, the file pointer is left at the beginning of the payload.
+    returns a tuple with 3 elements:
+    0: payload id
+    1: payload dtype string
+    2: payload number of elements
+    returns None if no token header was found / EOF
+    """
+    raw_header = f.read(bdo_token_header_dtype.itemsize)
+    if len(raw_header) < bdo_token_header_dtype.itemsize:
+        return None
+    header = np.frombuffer(raw_header, dtype=bdo_token_header_dtype, count=1)[0]
+    return int(header['pl_id']), header['pl_type'], int(header['pl_len'])
+
+
+def payload_nbytes(pl_type: bytes, pl_len: int) -> int:
+    """
+    Size (in bytes) of token payload with `pl_len` elements of `pl_type` numpy dtype.
+    Raises TypeError if `pl_type` is not a valid numpy dtype string.
+    """
+    return np.dtype(pl_type).itemsize * pl_len
+
+
+def scan_tokens(f) -> Iterator[Tuple[int, bytes, int, int]]:
+    """
+    Walks the token stream reading only token headers and seeking past the payloads,
+    so the cost depends on the number of tokens, not on the file size.
+    Yields tuples with 4 elements:
+    0: payload id
+    1: payload dtype string
+    2: payload number of elements
+    3: payload offset (in bytes, from the beginning of the file)
+    The consumer may read the payload (the file pointer is at the payload offset when a tuple is yielded),
+    the scan continues from the end of the payload anyway.
+    f is an open, readable and seekable file pointer, positioned at the beginning of a token.
+    """
+    while True:
+        header = read_token_header(f)
+        if header is None:
+            return
+        pl_id, pl_type, pl_len = header
+        try:
+            nbytes = payload_nbytes(pl_type, pl_len)
+        except TypeError:
+            return
+        offset = f.tell()
+        yield pl_id, pl_type, pl_len, offset
+        f.seek(offset + nbytes)
+
+
+@dataclass(frozen=True)
+class PayloadLoader:
+    """
+    Deferred read of a single token payload (or other contiguous data block) from a binary file.
+    Used as a data loader of lazy pages (see `Page.set_data_loader`).
+    Compressed files (and archive members) are decompressed up to the data block
+    (and cannot be memory-mapped, `mmap` is ignored then).
     """
-    returns a tuple with 4 elements:
+    filename: InputSource  # file path, file-like object or buffer
+    offset: int  # payload offset in bytes, from the beginning of the file
+    dtype: str  # numpy dtype string
+    count: int  # number of elements
+    mmap: bool = False  # return read-only memory-mapped view instead of reading the data
+    read_chunks: int = 1  # number of chunks read in parallel, see `compressed.pread_array`
+
+    def __call__(self) -> NDArray:
+        if self.mmap and is_plain_file(self.filename):
+            return np.memmap(self.filename, dtype=self.dtype, mode='r', offset=self.offset, shape=(self.count, ))
+        return read_array_at(self.filename,
+                             dtype=self.dtype,
+                             count=self.count,
+                             offset=self.offset,
+                             read_chunks=self.read_chunks)
+
+
+def read_next_token(f, mmap_tags: Container[int] = (), lazy_tags: Container[int] = ()) -> Optional[BDOToken]:
+    """
+    returns a `BDOToken` (tuple) with 5 elements:
     0: payload id
     1: payload dtype string
     2: payload number of elements
     3: payload itself
+    4: payload offset
     f is an open and readable file pointer.
     returns None if no token was found / EOF
-    """
-    tag = np.dtype([('pl_id', '<u8'), ('pl_type', 'S8'), ('pl_len', '<u8')])
 
-    x1 = np.fromfile(f, dtype=tag, count=1)  # read the data into numpy
+    Payloads of tokens listed in `mmap_tags` (and longer than a single element) are not read into memory.
+    Instead a read-only `np.memmap` view of the file, starting at the payload offset, is returned
+    and the file pointer is moved past the payload.
+    Payloads of tokens listed in `lazy_tags` (and longer than a single element) are skipped,
+    a `PayloadLoader` which can read them later is returned instead.
+    """
+    header = read_token_header(f)
 
-    if x1.size == 0:
+    if header is None:
         return None
     else:
-        pl_id = x1['pl_id'][0]
-        pl_type = x1['pl_type'][0]
-        pl_len = x1['pl_len'][0]
+        pl_id, pl_type, pl_len = header
+        offset = f.tell()
         try:
-            pl = np.fromfile(f, dtype=pl_type, count=pl_len)  # read the data into numpy
-            return pl_id, pl_type, pl_len, pl
+            pl = read_token_payload(f, pl_id, pl_type, pl_len, mmap_tags=mmap_tags, lazy_tags=lazy_tags)
+            return BDOToken(pl_id, pl_type, pl_len, pl, offset)
         except TypeError:
             return None
 
 
+def read_token_payload(f,
+                       pl_id: int,
+                       pl_type: bytes,
+                       pl_len: int,
+                       mmap_tags: Container[int] = (),
+                       lazy_tags: Container[int] = (),
+                       filename: Optional[InputSource] = None,
+                       read_chunks: int = 1):
+    """
+    Reads payload of a token, f is an open and readable file pointer positioned at the payload offset.
+    The file pointer is left at the end of the payload. See `read_next_token` for `mmap_tags` and `lazy_tags`.
+    `f` may be a decompressing stream (see `pymchelper.readers.compressed`), `mmap_tags` can't be used then
+    and `filename` needs to be given for `lazy_tags` (as such streams may have no `name` attribute).
+    Large payloads of plain files are read in `read_chunks` parallel chunks (now or by the loader),
+    see `pymchelper.readers.compressed.pread_array`.
+    Raises TypeError if `pl_type` is not a valid numpy dtype string.
+    """
+    if pl_id in lazy_tags and pl_len > 1:
+        offset = f.tell()
+        pl = PayloadLoader(filename=filename or f.name,
+                           offset=offset,
+                           dtype=pl_type.decode('ASCII'),
+                           count=pl_len,
+                           mmap=pl_id in mmap_tags,
+                           read_chunks=read_chunks)
+        f.seek(offset + payload_nbytes(pl_type, pl_len))
+    elif pl_id in mmap_tags and pl_len > 1:
+        offset = f.tell()
+        pl = np.memmap(f, dtype=pl_type, mode='r', offset=offset, shape=(pl_len, ))
+        f.seek(offset + pl.nbytes)
+    else:
+        pl = read_array(f, dtype=pl_type, count=pl_len, read_chunks=read_chunks)  # read the data into numpy
+    return pl
+
+
+# tags known to this release, tags written by newer SHIELD-HIT12A versions are reported when read
+known_tags = frozenset(tag.value for tag in SHBDOTagID)
+
+
+def log_token(log: logging.Logger, token_id: int, pl_type: bytes, pl_len: int, payload: Any) -> None:
+    """
+    Log a token read from a BDO file, at debug level, or at info level if its tag is unknown.
+    Called for each token, so nothing is formatted (i.e. no string made of the payload)
+    unless the message is going to be emitted.
+    """
+    if token_id in known_tags:
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Read token %s (0x%02x) value %s type %s length %d", SHBDOTagID(token_id).name, token_id,
+                      payload, pl_type.decode('ASCII'), pl_len)
+    elif log.isEnabledFor(logging.INFO):
+        log.info("Found unknown token (0x%02x) value %s type %s length %d, skipping", token_id, payload,
+                 pl_type.decode('ASCII'), pl_len)
+
+
+def decode_payload(pl_type: bytes, raw_payload: NDArray) -> Any:
+    """
+    Decodes raw token payload into something more convenient to work with.
+    Strings are decoded from ASCII (and stripped) into a list of Python strings,
+    single-element payloads (the vast majority of tokens) are unwrapped to a plain scalar or string,
+    so callers don't need to special-case `payload[0]` everywhere.
+    """
+    if 'S' in pl_type.decode('ASCII'):
+        # raw payload may contain non-ASCII characters (i.e. filedate on non-English Windows OS)
+        payload = [entry.decode('ASCII', 'replace').strip() for entry in raw_payload]
+    else:
+        payload = raw_payload
+
+    if len(payload) == 1:
+        payload = payload[0]
+    return payload
+
+
+def iter_bdo_tokens(file_path: InputSource,
+                    decode: bool = True,
+                    tags: Optional[Container[int]] = None,
+                    skip_payload_tags: Container[int] = (),
+                    mmap_tags: Container[int] = (),
+                    index: Optional[NDArray] = None,
+                    start: Optional[int] = None,
+                    end: Optional[int] = None,
+                    name: Optional[str] = None,
+                    read_chunks: int = 1) -> Iterator[BDOToken]:
+    """
+    Iterates over tokens of a BDO file (BDO2016 or BDO2019 format), yielding `BDOToken` records in file order.
+    This is the token walk used by the BDO readers, it can also be used directly to extract metadata,
+    i.e. number of primaries and simulation time of many files, without reading their data blocks:
+
+        tags = {SHBDOTagID.rt_nstat, SHBDOTagID.rt_time}
+        metadata = {token.tag_id: token.payload for token in iter_bdo_tokens(path, tags=tags)}
+
+    While walking the file only token headers are read, payloads are read only for tokens being yielded.
+    Only complete tokens are yielded: if the file is truncated (i.e. it is still being written), the walk stops
+    at the incomplete token and a warning is logged.
+
+    :param file_path: BDO file path (or other source, i.e. file-like object or buffer, see `open_input`)
+    :param decode: if True, payloads are decoded using `decode_payload`, otherwise raw numpy arrays are yielded
+    :param tags: if set, only tokens with these tag ids are yielded, payloads of other tokens are not read
+    :param skip_payload_tags: payloads of these tokens (if longer than single element) are not read,
+        a `PayloadLoader` which can read them later is yielded as payload instead
+    :param mmap_tags: payloads of these tokens (if longer than single element) are memory-mapped,
+        ignored for compressed files and archive members, which are streamed (see `pymchelper.readers.compressed`)
+    :param index: token index (see `pymchelper.readers.shieldhit.token_index`), if given token headers are not read,
+        payloads are read directly from the offsets stored in the index
+    :param start: offset of the first token to read (by default the first token after the file header),
+        used to resume the walk after the last complete token (see `SHFollowerBDO2019`)
+    :param end: tokens not fully contained in first `end` bytes of the file are not read, by default size
+        of the file; if given, truncation of the file is expected and is not reported as a warning
+    :param name: name of the file reported to tracing hooks (see `pymchelper.readers.tracing`),
+        by default derived from `file_path`
+    :param read_chunks: large payloads of plain files are read in that many chunks in parallel,
+        see `pymchelper.readers.compressed.pread_array`
+    """
+    if start is None:
+        start = bdo_header_dtype.itemsize
+    truncation_expected = end is not None
+    if not is_plain_file(file_path):
+        mmap_tags = ()
+    elif end is None:
+        end = os.path.getsize(file_path)
+    last_end = start  # end of the last complete token
+    truncated = False
+    trace = tracing.active
+    trace_name = (name or tracing.trace_name(file_path)) if trace else ''
+    with open_input(file_path) as f:
+        if index is None:
+            f.seek(start)
+            headers = scan_tokens(f)
+        else:
+            headers = (header for header in index.tolist() if header[3] >= start)
+        for pl_id, pl_type, pl_len, offset in headers:
+            token_end = offset + payload_nbytes(pl_type, pl_len)
+            if end is not None and token_end > end:
+                truncated = True
+                break
+            if tags is not None and pl_id not in tags:
+                last_end = token_end
+                continue
+            if trace:
+                start_time = time.perf_counter()
+            f.seek(offset)
+            payload = read_token_payload(f,
+                                         pl_id,
+                                         pl_type,
+                                         pl_len,
+                                         mmap_tags=mmap_tags,
+                                         lazy_tags=skip_payload_tags,
+                                         filename=file_path,
+                                         read_chunks=read_chunks)
+            if isinstance(payload, np.ndarray) and payload.size < pl_len:
+                truncated = True  # short read of a stream of unknown size (i.e. compressed file)
+                break
+            last_end = token_end
+            if trace:
+                # memory-mapped and skipped payloads are not read
+                nbytes = payload.nbytes if type(payload) is np.ndarray else 0
+                tracing.emit(tracing.TraceEvent(kind='token', source=trace_name, tag_id=pl_id, nbytes=nbytes,
+                                                seconds=time.perf_counter() - start_time))
+            if decode and not isinstance(payload, PayloadLoader):
+                payload = decode_payload(pl_type, payload)
+            yield BDOToken(pl_id, pl_type, pl_len, payload, offset)
+    if truncated or (end is not None and last_end < end):
+        log = logger.debug if truncation_expected else logger.warning
+        log("Incomplete token at offset %d of %s (file truncated or still being written), rest of file ignored",
+            last_end, file_path)
+
+
 def _postprocess(estimator: Estimator, nscale: float):
     """normalize result if we need that."""
     for page in estimator.pages:
@@ -226,17 +547,17 @@ def _postprocess(estimator: Estimator, nscale: float):
                                SHDetType.avg_energy, SHDetType.avg_beta, SHDetType.davge, SHDetType.dbeta,
                                SHDetType.dq_eff, SHDetType.tq_eff, SHDetType.material, SHDetType.q):
             if estimator.number_of_primaries != 0:  # geotyp = GEOMAP will have 0 projectiles simulated
-                page.data_raw /= np.float64(estimator.number_of_primaries)
+                page.transform_data(np.divide, np.float64(estimator.number_of_primaries))
 
     if nscale != 1:
         # scale with number of particles given by user
         for page in estimator.pages:
-            page.data_raw *= np.float64(nscale)
+            page.transform_data(np.multiply, np.float64(nscale))
 
         # rescaling with particle number means also unit change for some estimators
         # from per particle to Grey - this is why we override detector type
         for page in estimator.pages:
-            page.data_raw *= np.float64(nscale)
+            page.transform_data(np.multiply, np.float64(nscale))
 
             if page.dettyp == SHDetType.dose:
                 page.dettyp = SHDetType.dose_gy_bdo2016
@@ -248,5 +569,5 @@ def _postprocess(estimator: Estimator, nscale: float):
             if page.dettyp in (SHDetType.dose_gy_bdo2016, SHDetType.alanine_gy_bdo2016, SHDetType.dirtydose_gy_bdo2016):
                 # 1 megaelectron volt / gram = 1.60217662 x 10-10 Gy
                 MeV_g = np.float64(1.60217662e-10)
-                page.data_raw *= MeV_g
+                page.transform_data(np.multiply, MeV_g)
                 page.unit, page.name = _get_detector_unit(page.dettyp, estimator.geotyp)
@@ -4,9 +4,11 @@ import numpy as np
 
 from pymchelper.axis import MeshAxis
 from pymchelper.page import Page
+from pymchelper.readers.compressed import open_input, read_array
 from pymchelper.readers.shieldhit.reader_base import SHReader, mesh_unit_and_name, _bintyp, _get_detector_unit, \
-    read_next_token, safe_dettyp
+    bdo_header_dtype, iter_bdo_tokens, log_token, safe_dettyp, PayloadLoader
 from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID, detector_name_from_bdotag
+from pymchelper.readers.shieldhit.token_index import token_index
 from pymchelper.shieldhit.detector.estimator_type import SHGeoType
 
 logger = logging.getLogger(__name__)
@@ -34,22 +36,7 @@ class SHReaderBDO2016(SHReader):
     @staticmethod
     def _log_token(token_id, payload_type, payload_len, raw_payload):
         """Log a decoded token when its tag is recognized, otherwise note that it is skipped."""
-        try:
-            token_name = SHBDOTagID(token_id).name
-            logger.debug("Read token {:s} (0x{:02x}) value {} type {:s} length {:d}".format(
-                token_name,
-                token_id,
-                raw_payload,
-                payload_type.decode('ASCII'),
-                payload_len
-            ))
-        except ValueError:
-            logger.info("Skipping token (0x{:02x}) value {} type {:s} length {:d}".format(
-                token_id,
-                raw_payload,
-                payload_type.decode('ASCII'),
-                payload_len
-            ))
+        log_token(logger, token_id, payload_type, payload_len, raw_payload)
 
     @staticmethod
     def _update_differential_scoring(estimator, token_id, payload):
@@ -75,7 +62,7 @@ class SHReaderBDO2016(SHReader):
         """Apply file-level and run-level metadata tokens to the estimator."""
         if SHBDOTagID.shversion == token_id:
             estimator.mc_code_version = payload[0]
-            logger.debug("MC code version:" + estimator.mc_code_version)
+            logger.debug("MC code version: %s", estimator.mc_code_version)
 
         if SHBDOTagID.filedate == token_id:
             estimator.filedate = payload[0]
@@ -115,7 +102,10 @@ class SHReaderBDO2016(SHReader):
             estimator.scored_particle_a = payload[0]
 
         if SHBDOTagID.data_block == token_id:
-            estimator.pages[0].data_raw = np.asarray(payload)
+            if isinstance(payload, PayloadLoader):
+                estimator.pages[0].set_data_loader(payload)
+            else:
+                estimator.pages[0].data_raw = np.asarray(payload)
 
     @staticmethod
     def _update_geometry_data(estimator, token_id, payload, geometry_data):
@@ -197,16 +187,12 @@ class SHReaderBDO2016(SHReader):
         return nx, ny, nz, xmin, ymin, zmin, xmax, ymax, zmax
 
     def read_data(self, estimator):
-        logger.debug("Reading: " + self.filename)
-        with open(self.filename, "rb") as f:
-            d1 = np.dtype([('magic', 'S6'),
-                           ('end', 'S2'),
-                           ('vstr', 'S16')])
-
-            _x = np.fromfile(f, dtype=d1, count=1)  # read the data into numpy
-            logger.debug("Magic : " + _x['magic'][0].decode('ASCII'))
-            logger.debug("Endian: " + _x['end'][0].decode('ASCII'))
-            logger.debug("VerStr: " + _x['vstr'][0].decode('ASCII'))
+        logger.debug("Reading: %s", self.filename)
+        with open_input(self.filename) as f:
+            _x = read_array(f, dtype=bdo_header_dtype, count=1)  # read the data into numpy
+            logger.debug("Magic : %s", _x['magic'][0].decode('ASCII'))
+            logger.debug("Endian: %s", _x['end'][0].decode('ASCII'))
+            logger.debug("VerStr: %s", _x['vstr'][0].decode('ASCII'))
 
             # if no pages are present, add first one
             if not estimator.pages:
@@ -224,12 +210,19 @@ class SHReaderBDO2016(SHReader):
                 'zmax': None,
             }
 
-            while f:
-                token = read_next_token(f)
-                if token is None:
-                    break
-
-                pl_id, _pl_type, _pl_len, _pl = token
+            # in mmap mode data blocks are mapped, in lazy mode (or with page selection) skipped,
+            # not read, see `read_next_token`
+            mmap_tags = (SHBDOTagID.data_block, ) if self.mmap_data else ()
+            lazy_tags = (SHBDOTagID.data_block, ) if self.defer_data else ()
+            # with index file token headers are not read, payloads are read directly from the indexed offsets
+            index = token_index(self.filename) if self.index_file else None
+            for token in iter_bdo_tokens(self.filename,
+                                         decode=False,
+                                         skip_payload_tags=lazy_tags,
+                                         mmap_tags=mmap_tags,
+                                         read_chunks=self.read_chunks,
+                                         index=index):
+                pl_id, _pl_type, _pl_len, _pl, _offset = token
                 pl = self._decode_payload(_pl_type, _pl, _pl_len)
                 self._log_token(pl_id, _pl_type, _pl_len, pl)
                 self._update_estimator(estimator, pl_id, pl, geometry_data)
@@ -268,13 +261,15 @@ class SHReaderBDO2016(SHReader):
 
             estimator.file_format = 'bdo2016'
             estimator.data_order = 'F'  # Fortran column-major order
+            self.select_pages(estimator)
 
             logger.debug("Done reading bdo file.")
-            logger.debug("Detector data : " + str(estimator.pages[0].data))
-            logger.debug("Detector nstat: " + str(estimator.number_of_primaries))
-            logger.debug("Detector nx   : " + str(estimator.x.n))
-            logger.debug("Detector ny   : " + str(estimator.y.n))
-            logger.debug("Detector nz   : " + str(estimator.z.n))
+            if estimator.pages:
+                logger.debug("Detector data : %s", estimator.pages[0].data)
+            logger.debug("Detector nstat: %s", estimator.number_of_primaries)
+            logger.debug("Detector nx   : %s", estimator.x.n)
+            logger.debug("Detector ny   : %s", estimator.y.n)
+            logger.debug("Detector nz   : %s", estimator.z.n)
             estimator.file_counter = 1
         super(SHReaderBDO2016, self).read_data(estimator)
         return True
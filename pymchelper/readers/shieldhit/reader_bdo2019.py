@@ -1,26 +1,26 @@
+import copy
 import logging
+import os
 from typing import Any, Optional, Tuple
 
 import numpy as np
 from numpy.typing import NDArray
 
 from pymchelper.axis import MeshAxis
-from pymchelper.estimator import Estimator
+from pymchelper.estimator import ErrorEstimate, Estimator
 from pymchelper.page import Page
+from pymchelper.readers.compressed import head_size, read_array_at, read_head
 from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID, detector_name_from_bdotag, unit_name_from_unit_id, \
     page_tags_to_save
-from pymchelper.readers.shieldhit.reader_base import SHReader, read_next_token, mesh_unit_and_name, safe_dettyp
+from pymchelper.readers.shieldhit.reader_base import SHReader, BDOToken, bdo_header_dtype, decode_payload, \
+    iter_bdo_tokens, log_token, mesh_unit_and_name, payload_nbytes, safe_dettyp, PayloadLoader
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.readers.shieldhit.token_index import token_index
 from pymchelper.shieldhit.detector.detector_type import SHDetType
 from pymchelper.shieldhit.detector.estimator_type import SHGeoType
 
 logger = logging.getLogger(__name__)
 
-# A single (tag_id, numpy_dtype_string, payload_length, raw_payload) tuple as returned by
-# `read_next_token`. `raw_payload` is always a numpy array at this point (of length `payload_length`),
-# even for scalar or string tokens - it is `_decode_payload` that unwraps/decodes it into something
-# more convenient to work with.
-BDOToken = Tuple[int, np.generic, int, NDArray]
-
 # What a token payload turns into after decoding: depending on the tag, this can be a plain
 # scalar, a decoded ASCII string, a list (for multi-element string tokens), or a numpy array
 # (for multi-element numeric tokens). Which one it is depends entirely on which SHBDOTagID the
@@ -28,39 +28,144 @@ BDOToken = Tuple[int, np.generic, int, NDArray]
 # below decide, per tag, how to interpret/index it, in a way a type checker can't verify statically.
 BDOPayload = Any
 
+# names of page attributes set from the page tokens, looked up for each token
+_page_attribute_names = {tag: SHBDOTagID(tag).name for tag in page_tags_to_save}
+
 
 class SHReaderBDO2019(SHReader):
     """Experimental binary format reader version >= 0.7"""
 
+    # files with averaged results written by `SHBinaryWriter` hold errors of the data
+    keep_errors = True
+
     def read_data(self, estimator: Estimator, nscale: float = 1.) -> bool:
         logger.debug("Reading: %s", self.filename)
 
-        with open(self.filename, "rb") as f:
-            # fixed-size file header: magic bytes, endianness marker and a free-form version string
-            d1 = np.dtype([('magic', 'S6'), ('end', 'S2'), ('vstr', 'S16')])
+        # fixed-size file header: magic bytes, endianness marker and a free-form version string
+        _x = read_array_at(self.filename, dtype=bdo_header_dtype, count=1)  # read the data into numpy
+        logger.debug("Magic : %s", _x['magic'][0].decode('ASCII'))
+        logger.debug("Endiannes: %s", _x['end'][0].decode('ASCII'))
+        logger.debug("VerStr: %s", _x['vstr'][0].decode('ASCII'))
+
+        # the rest of the file is a flat stream of (tag, type, length, payload) tokens;
+        # each token either updates estimator-level metadata, starts a new page (detector_type
+        # token) or fills in fields of the page currently being built
+        # in mmap mode data blocks are mapped, in lazy mode (or with page selection) skipped,
+        # not read, see `read_next_token`
+        mmap_tags, lazy_tags = self._payload_tags()
+        # with index file token headers are not read, payloads are read directly from the indexed offsets
+        index = token_index(self.filename) if self.index_file else None
+        for token in iter_bdo_tokens(self.filename,
+                                     decode=False,
+                                     skip_payload_tags=lazy_tags,
+                                     mmap_tags=mmap_tags,
+                                     read_chunks=self.read_chunks,
+                                     index=index):
+            _process_token(estimator, token)
+
+        self._complete_estimator(estimator)
 
-            _x = np.fromfile(f, dtype=d1, count=1)  # read the data into numpy
-            logger.debug("Magic : " + _x['magic'][0].decode('ASCII'))
-            logger.debug("Endiannes: " + _x['end'][0].decode('ASCII'))
-            logger.debug("VerStr: " + _x['vstr'][0].decode('ASCII'))
-
-            # the rest of the file is a flat stream of (tag, type, length, payload) tokens;
-            # each token either updates estimator-level metadata, starts a new page (detector_type
-            # token) or fills in fields of the page currently being built
-            while f:
-                token = read_next_token(f)
-                if token is None:
-                    break
-                _process_token(estimator, token)
+        logger.debug("Done reading bdo file.")
+        return True
 
-            # once all tokens have been consumed, derive fields that depend on more than one
-            # token (differential axes, axis names, per-page normalisation, ...)
-            _finalize_estimator(estimator)
+    def _payload_tags(self) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """Tags of the tokens whose payloads are memory-mapped and tags of those which are skipped (read later)."""
+        mmap_tags = (SHBDOTagID.data_block, ) if self.mmap_data else ()
+        lazy_tags = (SHBDOTagID.data_block, ) if self.defer_data else ()
+        # error blocks are not read lazily, but mapped instead of being read when the data is not needed at once
+        if self.mmap_data or self.defer_data:
+            mmap_tags += (SHBDOTagID.data_error_block, )
+        return mmap_tags, lazy_tags
+
+    def _complete_estimator(self, estimator: Estimator) -> None:
+        """Post-processing of the estimator built from all (complete) tokens of the file."""
+        # once all tokens have been consumed, derive fields that depend on more than one
+        # token (differential axes, axis names, per-page normalisation, ...)
+        _finalize_estimator(estimator)
 
         estimator.file_format = 'bdo2019'
         estimator.data_order = 'F'  # Fortran column-major order
+        # normalisation goes after page selection, so only the data of selected pages (and bins) is copied
+        self.select_pages(estimator)
+        _normalise_pages(estimator)
 
-        logger.debug("Done reading bdo file.")
+
+class SHFollowerBDO2019(SHReaderBDO2019):
+    """
+    Incremental reader of a BDO2019 file which is still being written (i.e. by a running SHIELD-HIT12A job).
+
+    Each `poll` continues the token walk from the end of the last complete token read so far,
+    so the file is never parsed again from the beginning. `read` polls the file and fills the estimator
+    with all pages complete so far (the page being written is left out).
+    If the file is rewritten (it got shorter or its beginning has changed), reading starts over.
+    A missing file is treated as an empty one, it is read once it appears.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 mmap: bool = False,
+                 lazy: bool = False,
+                 selection: Optional[PageSelection] = None) -> None:
+        super().__init__(filename, mmap=mmap, lazy=lazy, selection=selection)
+        self._reset()
+
+    def _reset(self) -> None:
+        # estimator built from the tokens read so far, data of its pages is never modified
+        self._estimator = Estimator()
+        self._offset = bdo_header_dtype.itemsize  # end of the last complete token
+        self._complete_pages = 0
+        self._head = b''  # first bytes of the file, as read in the last poll
+
+    @property
+    def complete_pages(self) -> int:
+        """Number of pages whose data was already written to the file."""
+        return self._complete_pages
+
+    def poll(self) -> bool:
+        """Read tokens written to the file since the last poll, returns True if new pages were completed."""
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            size = 0
+        if self._head and (size < self._offset or read_head(self.filename, len(self._head)) != self._head):
+            logger.info("File %s was rewritten, reading it from the beginning", self.filename)
+            self._reset()
+        if size <= self._offset:
+            return False
+
+        pages_before = self._complete_pages
+        mmap_tags, lazy_tags = self._payload_tags()
+        for token in iter_bdo_tokens(self.filename,
+                                     decode=False,
+                                     skip_payload_tags=lazy_tags,
+                                     mmap_tags=mmap_tags,
+                                     read_chunks=self.read_chunks,
+                                     start=self._offset,
+                                     end=size):
+            _process_token(self._estimator, token)
+            if token.tag_id == SHBDOTagID.data_block:
+                self._complete_pages += 1
+            self._offset = token.offset + payload_nbytes(token.dtype, token.length)
+        self._head = read_head(self.filename, min(self._offset, head_size))
+        logger.debug("File %s read up to offset %d, %d complete pages", self.filename, self._offset,
+                     self._complete_pages)
+        return self._complete_pages > pages_before
+
+    def read_data(self, estimator: Estimator, nscale: float = 1.) -> bool:
+        self.poll()
+        state = self._estimator
+        # pages of the copy refer to `estimator`, their data arrays are shared with the pages of the state
+        # and are copied only when modified (i.e. normalised), see `Page.transform_data`
+        memo = {id(state): estimator}
+        for page in state.pages:
+            if page.data_loaded and isinstance(page.data_raw, np.ndarray):
+                page.data_raw.flags.writeable = False
+                memo[id(page.data_raw)] = page.data_raw
+        for name, value in vars(state).items():
+            setattr(estimator, name, copy.deepcopy(value, memo))
+        estimator.pages = estimator.pages[:self._complete_pages]
+
+        self._complete_estimator(estimator)
         return True
 
 
@@ -68,39 +173,18 @@ def _decode_payload(token: BDOToken) -> BDOPayload:
     """
     Decode a raw token into its final Python/numpy payload representation.
 
-    :param token: raw (tag_id, dtype, length, raw_payload) tuple, as returned by `read_next_token`
-    :return: decoded payload: a scalar, decoded ASCII string, list of strings, or numpy array
+    :param token: raw token, as yielded by `iter_bdo_tokens` with `decode=False`
+    :return: decoded payload: a scalar, decoded ASCII string, list of strings, numpy array or `PayloadLoader`
     """
-    token_id, token_type, payload_len, raw_payload = token
-
-    # `payload` starts out as a list of placeholders for a string token, but is unconditionally
-    # replaced (with the numpy array, then possibly a scalar) below, so it holds several
-    # different, mutually-incompatible types over its lifetime here - see the BDOPayload comment.
-    payload: BDOPayload = [None] * payload_len
-
-    # decode all strings (currently there will never be more than one per token)
-    if 'S' in token_type.decode('ASCII'):
-        for i, payload_entry in enumerate(raw_payload):
-            # raw payload may contain non-ASCII characters (i.e. filedate on non-English Windows OS)
-            payload[i] = payload_entry.decode('ASCII', 'replace').strip()
-    else:
-        payload = raw_payload
+    token_id, token_type, payload_len, raw_payload, _ = token
 
-    # unwrap single-element payloads (the vast majority of tokens) to a plain scalar/string,
-    # so callers don't need to special-case `payload[0]` everywhere
-    if payload_len == 1:
-        payload = payload[0]
+    # skipped (not yet read) payloads are left as they are
+    payload = raw_payload if isinstance(raw_payload, PayloadLoader) else decode_payload(token_type, raw_payload)
 
-    try:
-        token_name = SHBDOTagID(token_id).name
-        logger.debug("Read token {:s} (0x{:02x}) value {} type {:s} length {:d}".format(
-            token_name, token_id, raw_payload, token_type.decode('ASCII'), payload_len))
-    except ValueError:
-        # a newer MC engine may write tags a given pymchelper release doesn't know about yet;
-        # skip logging its name but still return the decoded payload so the caller can decide
-        # (via page_tags_to_save / detector_name_from_bdotag) whether to keep it
-        logger.info("Found unknown token (0x{:02x}) value {} type {:s} length {:d}, skipping".format(
-            token_id, raw_payload, token_type.decode('ASCII'), payload_len))
+    # a newer MC engine may write tags a given pymchelper release doesn't know about yet;
+    # these are only reported, the decoded payload is returned anyway so the caller can decide
+    # (via page_tags_to_save / detector_name_from_bdotag) whether to keep it
+    log_token(logger, token_id, token_type, payload_len, raw_payload)
 
     return payload
 
@@ -110,7 +194,7 @@ def _process_token(estimator: Estimator, token: BDOToken) -> None:
     Apply a single decoded BDO token to the estimator (and its current page) being built.
 
     :param estimator: estimator under construction; mutated in place
-    :param token: raw token as returned by `read_next_token`
+    :param token: raw token as yielded by `iter_bdo_tokens` with `decode=False`
     """
     token_id = token[0]
     payload = _decode_payload(token)
@@ -159,8 +243,20 @@ def _process_token(estimator: Estimator, token: BDOToken) -> None:
     # page(detector) data is the last thing related to page that is saved in binary file
     # at this point all other page related tags should already be processed
     if SHBDOTagID.data_block == token_id:
-        logger.debug("Setting page data = %s", np.asarray(payload))
-        estimator.pages[-1].data_raw = np.asarray(payload)
+        if isinstance(payload, PayloadLoader):
+            logger.debug("Setting page data loader = %s", payload)
+            estimator.pages[-1].set_data_loader(payload)
+        else:
+            estimator.pages[-1].data_raw = np.asarray(payload)
+            logger.debug("Setting page data = %s", estimator.pages[-1].data_raw)
+
+    # errors of the data, present only in files with averaged results, follow the data block
+    if SHBDOTagID.data_error_block == token_id:
+        estimator.pages[-1].error_raw = np.asarray(payload)
+
+    # type of these errors, written by pymchelper together with the error blocks
+    if SHBDOTagID.rt_error_type == token_id:
+        payload = ErrorEstimate(payload)
 
     # read tokens based on tag <-> name mapping for detector
     if token_id in detector_name_from_bdotag:
@@ -168,9 +264,9 @@ def _process_token(estimator: Estimator, token: BDOToken) -> None:
         setattr(estimator, detector_name_from_bdotag[token_id], payload)
 
     # read tokens based on tag <-> name mapping for pages
-    if token_id in page_tags_to_save:
-        logger.debug("Setting page.%s = %s", SHBDOTagID(token_id).name, payload)
-        setattr(estimator.pages[-1], SHBDOTagID(token_id).name, payload)
+    if token_id in _page_attribute_names:
+        logger.debug("Setting page.%s = %s", _page_attribute_names[token_id], payload)
+        setattr(estimator.pages[-1], _page_attribute_names[token_id], payload)
 
 
 def _diff_axis_binning(diff_flag: Optional[NDArray], index: int) -> MeshAxis.BinningType:
@@ -285,10 +381,20 @@ def _finalize_estimator(estimator: Estimator) -> None:
         if not page.name:
             page.name = str(page.dettyp)
 
+
+def _normalise_pages(estimator: Estimator) -> None:
+    """
+    Normalise data of pages tagged for normalisation by the number of primaries.
+
+    :param estimator: estimator with all pages already selected; mutated in place
+    """
+    for page in estimator.pages:
         # apply basic normalization for pages with normalisation tag
         page_normalisation = getattr(page, 'page_normalized', None)
         # see pymchelper/readers/shieldhit/binary_spec.py for details on the normalisation tags
         # normalize the detectors such as dose or fluence (tagged as SH_POSTPROC_NORM or 2)
         if page_normalisation == 2:
-            page.data_raw /= np.float64(estimator.number_of_primaries)
+            page.transform_data(np.divide, np.float64(estimator.number_of_primaries))
+            if page.error_raw is not None:
+                page.error_raw = np.divide(page.error_raw, np.float64(estimator.number_of_primaries))
             page.unit += "/prim"
@@ -5,8 +5,9 @@ import numpy as np
 
 from pymchelper.axis import MeshAxis
 from pymchelper.page import Page
+from pymchelper.readers.compressed import read_array_at
 from pymchelper.readers.shieldhit.reader_base import SHReader, mesh_unit_and_name, _bintyp, _get_detector_unit, \
-    safe_dettyp
+    safe_dettyp, PayloadLoader
 from pymchelper.shieldhit.detector.detector_type import SHDetType
 from pymchelper.shieldhit.detector.estimator_type import SHGeoType
 
@@ -19,7 +20,7 @@ class SHReaderBin2010(SHReader):
     """
 
     def read_header(self, estimator):
-        logger.info("Reading header: " + self.filename)
+        logger.info("Reading header: %s", self.filename)
 
         estimator.tripdose = 0.0
         estimator.tripntot = -1
@@ -27,9 +28,9 @@ class SHReaderBin2010(SHReader):
         # effective read
         # first figure out if this is a VOXSCORE card
         header_dtype = np.dtype([('__fo1', '<i4'), ('geotyp', 'S10')])
-        header = np.fromfile(self.filename, header_dtype, count=1)
+        header = read_array_at(self.filename, header_dtype, count=1)
         if not header:
-            print("File {:s} has unknown format".format(self.filename))
+            print("File {} has unknown format".format(self.filename))
             return None
 
         if 'VOXSCORE' in header['geotyp'][0].decode('ascii'):
@@ -80,7 +81,7 @@ class SHReaderBin2010(SHReader):
             # payload starts at 0x9E (158)
             estimator.payload_offset = 158
 
-        header = np.fromfile(self.filename, header_dtype, count=1)
+        header = read_array_at(self.filename, header_dtype, count=1)
         estimator.rec_size = header['reclen'][0] // 8
 
         if 'VOXSCORE' in header['geotyp'][0].decode('ascii'):
@@ -173,23 +174,27 @@ class SHReaderBin2010(SHReader):
     # TODO: we need an alternative list, in case things have been scaled with nscale, since then things
     # are not "/particle" anymore.
     def read_payload(self, estimator):
-        logger.info("Reading data: " + self.filename)
+        logger.info("Reading data: %s", self.filename)
 
         if estimator.geotyp == SHGeoType.unknown or estimator.pages[0].dettyp == SHDetType.none:
             logger.error("Unknown geotyp or dettyp")
             return None
 
-        # next read the data:
-        offset_str = "S" + str(estimator.payload_offset)
-        if estimator.rec_size == 1:
-            record_dtype = np.dtype([('trash', offset_str), ('bin2', '<f8')])
+        # next read the data, BIN(*) is a large array holding results. Accessed using pointers.
+        # It starts right after the header, so there is no need to read the header again.
+        loader = PayloadLoader(filename=self.filename,
+                               offset=estimator.payload_offset,
+                               dtype='<f8',
+                               count=estimator.rec_size,
+                               mmap=self.mmap_data,
+                               read_chunks=self.read_chunks)
+        if self.defer_data:
+            estimator.pages[0].set_data_loader(loader)
         else:
-            record_dtype = np.dtype([('trash', offset_str), ('bin2', '<f8', estimator.rec_size)])
-        record = np.fromfile(self.filename, record_dtype, count=-1)
-        # BIN(*)  : a large array holding results. Accessed using pointers.
-        estimator.pages[0].data_raw = np.array(record['bin2'][:][0])
-
-        logger.debug("Raw data: {}".format(estimator.pages[0].data_raw))
+            estimator.pages[0].data_raw = loader()
+        if estimator.rec_size == 1:
+            # single bin data is stored as 0-dim array, as in other readers
+            estimator.pages[0].map_data(np.squeeze)
 
         estimator.file_counter = 1
 
@@ -204,5 +209,6 @@ class SHReaderBin2010(SHReader):
             return None
         estimator.file_format = 'bin2010'
         estimator.data_order = 'C'  # C row-major order
+        self.select_pages(estimator)
         super(SHReaderBin2010, self).read_data(estimator)
         return True
@@ -0,0 +1,152 @@
+"""
+Read-time selection of pages and sub-meshes of SHIELD-HIT12A estimators.
+
+Selection is applied by the readers after all page metadata is parsed, but before the data blocks are read.
+Data blocks of pages which are not selected are never read from the file,
+for the selected pages only the bins inside the index box are copied into memory.
+"""
+from dataclasses import dataclass
+from functools import partial
+import logging
+from typing import Callable, Collection, Optional, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from pymchelper.axis import MeshAxis
+from pymchelper.estimator import Estimator
+from pymchelper.page import Page
+from pymchelper.shieldhit.detector.detector_type import SHDetType
+from pymchelper.shieldhit.detector.estimator_type import SHGeoType
+
+logger = logging.getLogger(__name__)
+
+# order of the axes in the index box, the same as order of dimensions of `Page.data`
+box_axes = ('x', 'y', 'z', 'diff1', 'diff2')
+
+
+@dataclass(frozen=True)
+class PageSelection:
+    """
+    Selection of pages (and optionally of a sub-mesh) to be read from a file.
+
+    A page is selected if it matches all criteria which are set (None means "any value"):
+     - `dettyp`: collection of detector types (i.e. `{SHDetType.dose, SHDetType.fluence}`),
+     - `name`: collection of page names (as in `Page.name`),
+     - `index`: collection of page numbers (position of the page in the file, starting from 0),
+     - `predicate`: callable taking a page (with metadata, but without data) and returning True for selected pages.
+
+    `box` is a tuple of up to 5 slices over bin indices of (x, y, z, diff1, diff2) axes,
+    missing trailing slices select the whole axis. Only contiguous slices are supported,
+    as the selected bins need to form a regular mesh again.
+
+    >>> PageSelection(dettyp={SHDetType.dose}, box=(slice(0, 10), slice(None), slice(5, 6))).box[2]
+    slice(5, 6, None)
+    >>> PageSelection(box=(slice(0, 10, 2), ))
+    Traceback (most recent call last):
+    ...
+    ValueError: Only contiguous slices are supported in box selection, got slice(0, 10, 2) for x axis
+    """
+    dettyp: Optional[Collection[SHDetType]] = None
+    name: Optional[Collection[str]] = None
+    index: Optional[Collection[int]] = None
+    predicate: Optional[Callable[[Page], bool]] = None
+    box: Optional[Tuple[slice, ...]] = None
+
+    def __post_init__(self) -> None:
+        if self.box is None:
+            return
+        if len(self.box) > len(box_axes):
+            raise ValueError("Box selection has {:d} slices, at most {:d} expected".format(
+                len(self.box), len(box_axes)))
+        for axis_name, axis_slice in zip(box_axes, self.box):
+            if axis_slice.step not in (None, 1):
+                raise ValueError("Only contiguous slices are supported in box selection, got {} for {:s} axis".format(
+                    axis_slice, axis_name))
+
+    def matches(self, page_index: int, page: Page) -> bool:
+        """Check if a page (at position `page_index` in the file) is selected."""
+        if self.index is not None and page_index not in self.index:
+            return False
+        if self.dettyp is not None and page.dettyp not in self.dettyp:
+            return False
+        if self.name is not None and page.name not in self.name:
+            return False
+        if self.predicate is not None and not self.predicate(page):
+            return False
+        return True
+
+
+def apply_selection(estimator: Estimator, selection: PageSelection) -> None:
+    """
+    Remove pages not matching the selection from the estimator and cut the selected pages to the index box.
+
+    Page data is not read here, the box cut is applied using `Page.map_data`, thus for lazy pages
+    it happens when the data is loaded (and memory-mapped data blocks are read only for the selected bins).
+    Mesh axes of the estimator and differential axes of the pages are adjusted to the box.
+
+    :param estimator: estimator with all page metadata already read; mutated in place
+    :param selection: pages and sub-mesh to keep
+    """
+    estimator.pages = tuple(page for page_index, page in enumerate(estimator.pages)
+                            if selection.matches(page_index, page))
+    logger.debug("Selected %d page(s)", len(estimator.pages))
+
+    if selection.box is None:
+        return
+
+    box = selection.box + (slice(None), ) * (len(box_axes) - len(selection.box))
+    mesh_shape = (estimator.x.n, estimator.y.n, estimator.z.n)
+    mesh_ranges = tuple(_bin_range(n, axis_slice, axis_name)
+                        for n, axis_slice, axis_name in zip(mesh_shape, box, box_axes))
+
+    for page in estimator.pages:
+        # MCPL pages hold list of particles, not a mesh
+        if page.dettyp == SHDetType.mcpl:
+            continue
+        diff_shape = (page.diff_axis1.n, page.diff_axis2.n)
+        diff_ranges = tuple(_bin_range(n, axis_slice, axis_name)
+                            for n, axis_slice, axis_name in zip(diff_shape, box[3:], box_axes[3:]))
+        ranges = mesh_ranges + diff_ranges
+        cut_box = partial(_cut_box,
+                          shape=mesh_shape + diff_shape,
+                          index=tuple(slice(r.start, r.stop) for r in ranges),
+                          order=estimator.data_order)
+        page.map_data(cut_box)
+        if page.error_raw is not None:
+            page.error_raw = cut_box(page.error_raw)
+        page.diff_axis1 = _cut_axis(page.diff_axis1, diff_ranges[0])
+        page.diff_axis2 = _cut_axis(page.diff_axis2, diff_ranges[1])
+
+    # zone scoring: x axis holds zone numbers (first and last zone), not bin edges
+    if estimator.geotyp in {SHGeoType.zone, SHGeoType.dzone} and len(mesh_ranges[0]) < estimator.x.n:
+        estimator.x = estimator.x._replace(n=len(mesh_ranges[0]),
+                                           min_val=estimator.x.min_val + mesh_ranges[0].start,
+                                           max_val=estimator.x.min_val + mesh_ranges[0].stop - 1)
+    else:
+        estimator.x = _cut_axis(estimator.x, mesh_ranges[0])
+    estimator.y = _cut_axis(estimator.y, mesh_ranges[1])
+    estimator.z = _cut_axis(estimator.z, mesh_ranges[2])
+
+
+def _bin_range(n: int, axis_slice: slice, axis_name: str) -> range:
+    """Bin indices selected by a slice on an axis with `n` bins."""
+    bins = range(n)[axis_slice]
+    if not bins:
+        raise ValueError("Box selection {} is empty for {:s} axis with {:d} bins".format(axis_slice, axis_name, n))
+    return bins
+
+
+def _cut_axis(axis: MeshAxis, bins: range) -> MeshAxis:
+    """Axis restricted to the bins from `bins` range, axis is returned unchanged if all bins are selected."""
+    if len(bins) == axis.n:
+        return axis
+    return axis.subaxis(bins.start, bins.stop)
+
+
+def _cut_box(data: NDArray, shape: Tuple[int, ...], index: Tuple[slice, ...], order: str) -> NDArray:
+    """Linear data of the bins inside the index box, only these bins are copied (or read, for memory-mapped data)."""
+    # single bin pages hold 0-dim data, there is nothing to cut
+    if np.ndim(data) == 0:
+        return data
+    return np.asarray(data.reshape(shape, order=order)[index].ravel(order=order))
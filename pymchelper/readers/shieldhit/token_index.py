@@ -0,0 +1,106 @@
+"""
+Persistent token index of SHIELD-HIT12A BDO files.
+
+Reading a BDO file requires walking its token stream, header by header. For files with many pages
+(and repeated conversions of the same, archived outputs) this walk can be avoided by an index saved
+next to the file (`<filename>.idx` sidecar), which holds id, dtype, length and payload offset of every token.
+The index is keyed by the size and modification time of the BDO file, a stale index is rebuilt.
+Members of archives (see `pymchelper.readers.archive`), file-like objects and buffers have no sidecar,
+they are always read by walking the tokens.
+"""
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+from pymchelper.readers.archive import is_archive_member
+from pymchelper.readers.compressed import open_input
+from pymchelper.readers.sources import InputSource, is_path
+from pymchelper.readers.shieldhit.reader_base import bdo_header_dtype, scan_tokens
+
+logger = logging.getLogger(__name__)
+
+# one record per token, same fields as in the token header, plus offset of the payload from the beginning of file
+token_index_dtype = np.dtype([('pl_id', '<u8'), ('pl_type', 'S8'), ('pl_len', '<u8'), ('offset', '<u8')])
+
+_index_header_dtype = np.dtype([('magic', 'S8'), ('size', '<u8'), ('mtime_ns', '<i8'), ('count', '<u8')])
+_index_magic = b'PMHIDX01'
+
+
+def index_path(filename: str) -> str:
+    """Path to the index sidecar of the BDO file `filename`."""
+    return str(filename) + '.idx'
+
+
+def build_token_index(filename: str) -> NDArray:
+    """Scan token headers of the BDO file `filename` (payloads are skipped) and return the token index."""
+    with open_input(filename) as f:
+        f.seek(bdo_header_dtype.itemsize)
+        records = [(pl_id, pl_type, pl_len, offset) for pl_id, pl_type, pl_len, offset in scan_tokens(f)]
+    return np.array(records, dtype=token_index_dtype)
+
+
+def load_token_index(filename: str) -> Optional[NDArray]:
+    """
+    Load the index of the BDO file `filename` from its sidecar.
+    Returns None if there is no sidecar, or it is not valid for the current version of the file.
+    """
+    try:
+        stat = os.stat(filename)
+        with open(index_path(filename), 'rb') as f:
+            header = np.fromfile(f, dtype=_index_header_dtype, count=1)
+            if header.size != 1 or header['magic'][0] != _index_magic:
+                logger.info("Invalid token index %s, ignoring", index_path(filename))
+                return None
+            if header['size'][0] != stat.st_size or header['mtime_ns'][0] != stat.st_mtime_ns:
+                logger.info("Token index %s is outdated, ignoring", index_path(filename))
+                return None
+            index = np.fromfile(f, dtype=token_index_dtype, count=int(header['count'][0]))
+    except OSError:
+        return None
+    if index.size != header['count'][0]:
+        logger.info("Truncated token index %s, ignoring", index_path(filename))
+        return None
+    return index
+
+
+def save_token_index(filename: str, index: NDArray) -> bool:
+    """
+    Save index of the BDO file `filename` in its sidecar.
+    The sidecar is written to a temporary file first and then renamed, so concurrent readers never see
+    a partially written index. Failures (i.e. read-only directory) are logged and otherwise ignored.
+    """
+    stat = os.stat(filename)
+    header = np.array([(_index_magic, stat.st_size, stat.st_mtime_ns, index.size)], dtype=_index_header_dtype)
+    # unique per process and thread, as the same file may be indexed concurrently (i.e. `fromfilelist` workers)
+    tmp_path = '{:s}.{:d}.{:d}.tmp'.format(index_path(filename), os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(index.astype(token_index_dtype).tobytes())
+        os.replace(tmp_path, index_path(filename))
+    except OSError as e:
+        logger.warning("Cannot save token index %s: %s", index_path(filename), e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def token_index(filename: InputSource) -> Optional[NDArray]:
+    """
+    Token index of the BDO file `filename`, loaded from the sidecar or (re)built and saved in the sidecar.
+    Returns None for archive members, file-like objects and buffers, which cannot have a sidecar.
+    """
+    if not is_path(filename) or is_archive_member(filename):
+        logger.debug("No token index for %s", filename)
+        return None
+    index = load_token_index(filename)
+    if index is None:
+        logger.debug("Building token index of %s", filename)
+        index = build_token_index(filename)
+        save_token_index(filename, index)
+    return index
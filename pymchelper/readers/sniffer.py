@@ -0,0 +1,57 @@
+"""
+Recognition of the input file type, used by `guess_reader`.
+
+The file is opened once and only its first bytes (see `read_head`) are read. The reader class is then chosen
+using the magic numbers found there (FLUKA USRxxx header, SHIELD-HIT12A BDO magic and format token)
+and the file extension. Reader classes recognized for files on disk (and archive members) are cached,
+keyed by path, size and modification time of the file, so repeated reads of the same files are not sniffed again.
+"""
+import logging
+import os
+from functools import lru_cache
+from typing import Optional, Type
+
+from pymchelper.readers.archive import split_archive_path
+from pymchelper.readers.common import Reader
+from pymchelper.readers.compressed import read_head, strip_compression_suffix
+from pymchelper.readers.fluka import FlukaReader, is_fluka_header
+from pymchelper.readers.shieldhit.general import reader_from_head
+from pymchelper.readers.sources import InputSource, is_path, source_name
+from pymchelper.readers.topas import TopasReader
+
+logger = logging.getLogger(__name__)
+
+
+def sniff_reader(source: InputSource) -> Optional[Type[Reader]]:
+    """Reader class for the `source` (path, file-like object or buffer), recognized from its first bytes."""
+    if is_path(source):
+        archive, _ = split_archive_path(source)
+        try:
+            stat = os.stat(archive or source)
+        except OSError:
+            return _sniff(source)  # let the reading fail with the proper error
+        return _sniff_path(str(source), stat.st_size, stat.st_mtime_ns)
+    return _sniff(source)
+
+
+@lru_cache(maxsize=128 * 1024)
+def _sniff_path(path: str, size: int, mtime_ns: int) -> Optional[Type[Reader]]:
+    """Cached `_sniff` of a file on disk (`size` and `mtime_ns` are part of the cache key only)."""
+    return _sniff(path)
+
+
+def _sniff(source: InputSource) -> Optional[Type[Reader]]:
+    head = read_head(source)
+    if is_fluka_header(head):
+        reader = FlukaReader
+    elif strip_compression_suffix(source_name(source)).endswith('.csv'):
+        reader = TopasReader
+    else:
+        reader = reader_from_head(source, head)
+    logger.debug("Detected reader %s for %s", reader.__name__ if reader else None, source)
+    return reader
+
+
+def clear_cache() -> None:
+    """Forget reader classes recognized for files on disk."""
+    _sniff_path.cache_clear()
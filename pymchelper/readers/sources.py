@@ -0,0 +1,140 @@
+"""
+Input sources other than files on disk: binary file-like objects and in-memory buffers.
+
+Readers accept, in place of a filename, any binary file-like object (i.e. `sys.stdin.buffer`, a socket file
+or an already open file) or a buffer (`bytes`, `bytearray`, `memoryview`, i.e. a shared memory block).
+Such a source is opened many times during reading (format detection, headers, data blocks),
+each time a new reader with its own position is created over the same handle or buffer,
+so no temporary files are written and buffers are not copied.
+
+File-like objects which cannot seek (pipes, sockets) are read into memory once, see `input_source`.
+"""
+import io
+import os
+import threading
+from typing import BinaryIO, Union
+
+InputSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+# serializes access to file-like objects, shared (with their position) by all readers opened over them
+_file_object_lock = threading.Lock()
+
+
+def is_path(source: InputSource) -> bool:
+    """True if `source` is a path (file on disk or archive member), not a file-like object or buffer."""
+    return isinstance(source, (str, os.PathLike))
+
+
+def is_buffer(source: InputSource) -> bool:
+    """True if `source` is an in-memory buffer."""
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def source_name(source: InputSource) -> str:
+    """
+    Name of the source, used to recognize file type and to derive the corename.
+    Paths are returned as they are, file-like objects give their `name` (if it is a string),
+    buffers have no name (empty string is returned).
+
+    >>> source_name(b'xSH12A')
+    ''
+    >>> source_name(io.BytesIO())
+    ''
+    """
+    if is_path(source):
+        return str(source)
+    name = getattr(source, 'name', None)
+    return name if isinstance(name, str) else ''
+
+
+def input_source(source: InputSource) -> InputSource:
+    """
+    Source which can be opened many times: file-like objects which cannot seek are read into memory (from their
+    current position to the end), other sources are returned as they are.
+    """
+    if is_path(source) or is_buffer(source):
+        return source
+    if not source.seekable():
+        return source.read()
+    return source
+
+
+class _BufferReader(io.RawIOBase):
+    """Binary stream reading from an in-memory buffer, without copying it."""
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview]) -> None:
+        super().__init__()
+        self._buffer = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._buffer[self._position:self._position + len(b)]
+        memoryview(b).cast('B')[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._buffer)}[whence]
+        self._position = max(start + offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class _FileObjectReader(io.RawIOBase):
+    """
+    Binary stream reading from a seekable file-like object, with its own position.
+    Underlying file-like object is not closed together with the reader.
+    """
+
+    def __init__(self, file_object: BinaryIO) -> None:
+        super().__init__()
+        self._file_object = file_object
+        self._position = 0
+        self.name = source_name(file_object)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        with _file_object_lock:
+            self._file_object.seek(self._position)
+            if hasattr(self._file_object, 'readinto'):
+                nread = self._file_object.readinto(b) or 0
+            else:
+                data = self._file_object.read(len(b))
+                nread = len(data)
+                memoryview(b).cast('B')[:nread] = data
+        self._position += nread
+        return nread
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            with _file_object_lock:
+                start = self._file_object.seek(0, io.SEEK_END)
+        else:
+            start = {io.SEEK_SET: 0, io.SEEK_CUR: self._position}[whence]
+        self._position = max(start + offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def open_source(source: InputSource) -> BinaryIO:
+    """Open a new binary stream (with position at the beginning) over the file-like object or buffer `source`."""
+    if is_buffer(source):
+        return _BufferReader(source)
+    if not source.seekable():
+        raise io.UnsupportedOperation("Source {!r} is not seekable, read it with `input_source` first".format(source))
+    return _FileObjectReader(source)
@@ -7,6 +7,7 @@ from pymchelper.axis import MeshAxis
 from pymchelper.estimator import Estimator
 from pymchelper.page import Page
 from pymchelper.readers.common import Reader, ReaderFactory
+from pymchelper.readers.sources import source_name
 
 
 class TopasReaderFactory(ReaderFactory):
@@ -14,7 +15,7 @@ class TopasReaderFactory(ReaderFactory):
 
     def get_reader(self):
         """Return TopasReader if the file extension is .csv"""
-        if self.filename.endswith('.csv'):
+        if source_name(self.filename).endswith('.csv'):
             return TopasReader
         return None
 
@@ -0,0 +1,137 @@
+"""
+Tracing hooks of the readers, i.e. for profiling of reading (and averaging) of many large files.
+
+Readers report what they do to the hooks registered with `add_hook`: each token read from a BDO file
+(with the number of payload bytes read into memory and the time it took) and each file read
+(with the time of the whole read, including parsing). Without hooks nothing is measured or formatted,
+readers check the `active` flag (a plain module attribute) before collecting anything.
+
+`TraceCounters` is a hook summing up tokens, bytes and time per tag and per file,
+`collect` registers it for a block of code:
+
+>>> with collect() as counters:
+...     emit(TraceEvent(kind='token', source='dose_0001.bdo', tag_id=0xAA00, nbytes=8, seconds=1e-6))
+>>> counters.report()['tags']['rt_nstat']
+{'tokens': 1, 'nbytes': 8, 'seconds': 1e-06}
+>>> active
+False
+"""
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.sources import InputSource, source_name
+
+# True if any hook is registered, checked by the readers before measuring anything
+active: bool = False
+
+_hooks: List[Callable[['TraceEvent'], None]] = []
+_hooks_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class TraceEvent:
+    """Single event reported by the readers."""
+    kind: str  # 'token' (token read from BDO file) or 'file' (whole file read)
+    source: str  # file path, or description of other input source (see `trace_name`)
+    tag_id: Optional[int] = None  # tag of the token (see SHBDOTagID), None for file events
+    # number of payload bytes read into memory (not memory-mapped or skipped), for file events
+    # only bytes not reported by token events (i.e. files read at once using the layout of other file)
+    nbytes: int = 0
+    seconds: float = 0.0  # time of reading the token payload, or of the whole file read
+
+
+def trace_name(source: InputSource) -> str:
+    """
+    Name of the source used in the events: path, or type of the source if it has no name.
+
+    >>> trace_name(b'xSH12A')
+    '<bytes>'
+    """
+    return source_name(source) or '<{:s}>'.format(type(source).__name__)
+
+
+def add_hook(hook: Callable[[TraceEvent], None]) -> None:
+    """Register a callable called with each `TraceEvent`, it may be called from many threads."""
+    global active
+    with _hooks_lock:
+        _hooks.append(hook)
+        active = True
+
+
+def remove_hook(hook: Callable[[TraceEvent], None]) -> None:
+    """Unregister a hook registered with `add_hook`."""
+    global active
+    with _hooks_lock:
+        _hooks.remove(hook)
+        active = bool(_hooks)
+
+
+def emit(event: TraceEvent) -> None:
+    """Pass the event to all registered hooks."""
+    for hook in tuple(_hooks):
+        hook(event)
+
+
+@dataclass
+class TraceCounter:
+    """Number of tokens, bytes read and time taken."""
+    tokens: int = 0
+    nbytes: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class TraceCounters:
+    """
+    Hook summing up the events: per tag (tokens, bytes and time of reading the payloads)
+    and per file (tokens and bytes read, time of the whole file read, including parsing).
+    """
+    tags: Dict[int, TraceCounter] = field(default_factory=dict)
+    files: Dict[str, TraceCounter] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def __call__(self, event: TraceEvent) -> None:
+        with self._lock:
+            file_counter = self.files.setdefault(event.source, TraceCounter())
+            if event.kind == 'file':
+                file_counter.nbytes += event.nbytes
+                file_counter.seconds += event.seconds
+                return
+            tag_counter = self.tags.setdefault(event.tag_id, TraceCounter())
+            for counter in (tag_counter, file_counter):
+                counter.tokens += 1
+                counter.nbytes += event.nbytes
+            tag_counter.seconds += event.seconds
+
+    def report(self) -> Dict[str, Any]:
+        """Counters as a dictionary (i.e. to be saved as JSON), tags are given by their names."""
+        with self._lock:
+            tags = {}
+            for tag_id, counter in sorted(self.tags.items()):
+                try:
+                    tag_name = SHBDOTagID(tag_id).name
+                except ValueError:
+                    tag_name = '0x{:04x}'.format(tag_id)
+                tags[tag_name] = asdict(counter)
+            files = {source: asdict(counter) for source, counter in self.files.items()}
+        return {
+            'tokens': sum(counter['tokens'] for counter in tags.values()),
+            'nbytes': sum(counter['nbytes'] for counter in tags.values()),
+            'seconds': sum(counter['seconds'] for counter in files.values()),
+            'tags': tags,
+            'files': files,
+        }
+
+
+@contextmanager
+def collect() -> Iterator[TraceCounters]:
+    """Collect `TraceCounters` of all reads done inside the `with` block."""
+    counters = TraceCounters()
+    add_hook(counters)
+    try:
+        yield counters
+    finally:
+        remove_hook(counters)
@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 
 import argparse
-import glob
+import contextlib
+import json
 import logging
 import sys
 from typing import Optional
 
 from pymchelper.estimator import ErrorEstimate
-from pymchelper.input_output import convertfromlist, convertfrompattern
+from pymchelper.input_output import convertfromlist, convertfrompattern, mergetodir
+from pymchelper.readers import tracing
+from pymchelper.readers.archive import expand_pattern
 from pymchelper.writers.common import Converters
 from pymchelper.writers.plots import ImageWriter, PlotAxis
 
@@ -15,8 +18,9 @@ logger = logging.getLogger(__name__)
 
 
 def add_default_options(parser: argparse.ArgumentParser) -> None:
-    import pymchelper
-    parser.add_argument('input', help='input filename, file list or pattern', type=str)
+    parser.add_argument('input',
+                        help='input filename, file list or pattern (archive members as results.tar::run_*/dose*.bdo)',
+                        type=str)
     parser.add_argument('output', help='output filename or directory', nargs='?')
     parser.add_argument('--many', help='automatically merge data from various sources', action="store_true")
     parser.add_argument('-a', '--nan', help='ignore NaN in averaging', action="store_true")
@@ -26,6 +30,55 @@ def add_default_options(parser: argparse.ArgumentParser) -> None:
                         choices=[x.name for x in ErrorEstimate],
                         type=str)
     parser.add_argument('-n', '--nscale', help='scale with number of primaries N.', default=1, type=float)
+    parser.add_argument('--cache-dir',
+                        help='directory of the cache of parsed and merged input files, '
+                             'repeated conversions of the same files are served from it',
+                        type=str)
+    parser.add_argument('--dtype',
+                        help='type of saved data and errors, float32 halves memory usage and output size '
+                             '(default: float64)',
+                        choices=['float32', 'float64'],
+                        type=str)
+    add_reading_options(parser)
+    parser.add_argument('--trace',
+                        help='save number of tokens, bytes and time of reading, per tag and per input file, '
+                             'to JSON file (for profiling)',
+                        metavar='FILE',
+                        type=str)
+    add_logging_options(parser)
+
+
+def add_reading_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--index',
+                        help='save token offsets of BDO files in .idx files and use them to speed up later reads',
+                        action="store_true")
+    parser.add_argument('--reuse-layout',
+                        help='read BDO files with the same structure as the first file of each group '
+                             'using its token offsets (faster for many small files)',
+                        action="store_true")
+    parser.add_argument('-j', '--jobs', help='number of threads reading input files (default: 1)', default=1, type=int)
+    parser.add_argument('-P', '--processes',
+                        help='number of processes aggregating parts of the input files (default: 1)',
+                        default=1,
+                        type=int)
+    parser.add_argument('--spill-dir',
+                        help='directory of temporary files holding the aggregated data (out-of-core aggregation), '
+                             'to keep memory usage bounded when merging many or large files',
+                        type=str)
+    parser.add_argument('--compensated',
+                        help='accumulate sums and total weights with compensated summation '
+                             '(more accurate sums of COUNT scorers of very many files, slightly slower)',
+                        action="store_true")
+    parser.add_argument('--read-chunks',
+                        help='read large data blocks in that many chunks in parallel '
+                             '(faster on parallel file systems and NVMe drives, default: 1)',
+                        default=1,
+                        metavar='N',
+                        type=int)
+
+
+def add_logging_options(parser: argparse.ArgumentParser) -> None:
+    import pymchelper
     parser.add_argument('-v',
                         '--verbose',
                         action='count',
@@ -83,6 +136,9 @@ def main(args: Optional[list[str]] = None) -> int:
     parser_json = subparsers.add_parser(Converters.json.name, help='converts to JSON file')
     add_default_options(parser_json)
 
+    parser_bdo = subparsers.add_parser(Converters.bdo.name, help='converts to SHIELD-HIT12A BDO file')
+    add_default_options(parser_bdo)
+
     parser_inspect = subparsers.add_parser(Converters.inspect.name, help='prints metadata')
     add_default_options(parser_inspect)
     parser_inspect.add_argument('-d', '--details',
@@ -113,6 +169,22 @@ def main(args: Optional[list[str]] = None) -> int:
                                 default=0,
                                 type=int)
 
+    parser_merge = subparsers.add_parser('merge',
+                                         help='merges input files into partial aggregates (<corename>.agg.npz), '
+                                              'to be merged further or converted')
+    parser_merge.add_argument('input',
+                              help='input filename or pattern, outputs or partial aggregates '
+                                   '(archive members as results.tar::run_*/dose*.bdo)',
+                              type=str)
+    parser_merge.add_argument('output',
+                              help='directory of partial aggregates, existing ones are merged with the input files '
+                                   '(default: current directory)',
+                              nargs='?',
+                              default='.')
+    parser_merge.add_argument('-a', '--nan', help='ignore NaN in averaging', action="store_true")
+    add_reading_options(parser_merge)
+    add_logging_options(parser_merge)
+
     parser.add_argument('-V', '--version', action='version', version=pymchelper.__version__)
 
     parsed_args = parser.parse_args(args)
@@ -126,9 +198,19 @@ def main(args: Optional[list[str]] = None) -> int:
         logging.basicConfig()
 
     status = 0
-    if parsed_args.command is not None:
+    if parsed_args.command == 'merge':
+        files = expand_pattern(parsed_args.input)
+        if not files:
+            logger.error('File %s does not exist: ', parsed_args.input)
+            return 1
+        status = mergetodir(files, parsed_args.output,
+                            index_file=parsed_args.index, workers=parsed_args.jobs,
+                            reuse_layout=parsed_args.reuse_layout, read_chunks=parsed_args.read_chunks,
+                            processes=parsed_args.processes, spill_dir=parsed_args.spill_dir,
+                            compensated=parsed_args.compensated, nan=parsed_args.nan)
+    elif parsed_args.command is not None:
         # TODO add filename discovery
-        files = sorted(glob.glob(parsed_args.input))
+        files = expand_pattern(parsed_args.input)
         if not files:
             logger.error('File %s does not exist: ', parsed_args.input)
 
@@ -149,14 +231,31 @@ def main(args: Optional[list[str]] = None) -> int:
 
         parsed_args.error = ErrorEstimate[parsed_args.error]
 
-        if parsed_args.many:
-            status = convertfrompattern(parsed_args.input, output_dir,
-                                        converter_name=parsed_args.command, options=parsed_args,
-                                        error=parsed_args.error, nan=parsed_args.nan)
-        else:
-            status = convertfromlist(parsed_args.input,
-                                     error=parsed_args.error, nan=parsed_args.nan, outputdir=output_dir,
-                                     converter_name=parsed_args.command, options=parsed_args, outputfile=output_file)
+        # reading is traced only when requested, see `pymchelper.readers.tracing`
+        with tracing.collect() if parsed_args.trace else contextlib.nullcontext() as counters:
+            if parsed_args.many:
+                status = convertfrompattern(parsed_args.input, output_dir,
+                                            converter_name=parsed_args.command, options=parsed_args,
+                                            error=parsed_args.error, nan=parsed_args.nan,
+                                            index_file=parsed_args.index, workers=parsed_args.jobs,
+                                            dtype=parsed_args.dtype, reuse_layout=parsed_args.reuse_layout,
+                                            cache_dir=parsed_args.cache_dir, read_chunks=parsed_args.read_chunks,
+                                            processes=parsed_args.processes, spill_dir=parsed_args.spill_dir,
+                                            compensated=parsed_args.compensated)
+            else:
+                status = convertfromlist(parsed_args.input,
+                                         error=parsed_args.error, nan=parsed_args.nan, outputdir=output_dir,
+                                         converter_name=parsed_args.command, options=parsed_args,
+                                         outputfile=output_file,
+                                         index_file=parsed_args.index, workers=parsed_args.jobs,
+                                         dtype=parsed_args.dtype, reuse_layout=parsed_args.reuse_layout,
+                                         cache_dir=parsed_args.cache_dir, read_chunks=parsed_args.read_chunks,
+                                         processes=parsed_args.processes, spill_dir=parsed_args.spill_dir,
+                                         compensated=parsed_args.compensated)
+
+        if parsed_args.trace:
+            with open(parsed_args.trace, 'w') as trace_file:
+                json.dump(counters.report(), trace_file, indent=2)
 
     return status
 
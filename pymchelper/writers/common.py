@@ -3,7 +3,7 @@ from enum import IntEnum
 from pymchelper.writers.excel import ExcelWriter
 from pymchelper.writers.inspector import Inspector
 from pymchelper.writers.plots import PlotDataWriter, ImageWriter
-from pymchelper.writers.shieldhit import TxtWriter
+from pymchelper.writers.shieldhit import SHBinaryWriter, TxtWriter
 from pymchelper.writers.sparse import SparseWriter
 from pymchelper.writers.trip98cube import TRiP98CubeWriter
 from pymchelper.writers.trip98ddd import TRiP98DDDWriter
@@ -27,6 +27,7 @@ class Converters(IntEnum):
     hdf = 9
     json = 10
     mcpl = 11
+    bdo = 12
 
     @classmethod
     def _converter_mapping(cls, item) -> type:
@@ -42,6 +43,7 @@ class Converters(IntEnum):
             cls.hdf: HdfWriter,
             cls.json: JsonWriter,
             cls.mcpl: MCPLWriter,
+            cls.bdo: SHBinaryWriter,
         }.get(item)
 
     @classmethod
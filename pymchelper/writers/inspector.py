@@ -17,7 +17,7 @@ class Inspector:
         """
         for name, value in sorted(estimator.__dict__.items()):
             # skip non-metadata fields
-            if name not in {'data', 'data_raw', 'error', 'error_raw', 'counter', 'pages'}:
+            if name not in {'data', 'data_raw', 'error', 'error_raw', 'counter', 'pages'} and not name.startswith('_'):
                 line = f"{name:24s}: {value}"
                 print(line)
         # print some data-related statistics
@@ -27,7 +27,7 @@ class Inspector:
             print("Page {} / {}".format(page_no, len(estimator.pages)))
             for name, value in sorted(page.__dict__.items()):
                 # skip non-metadata fields
-                if name not in {'data', 'data_raw', 'error', 'error_raw'}:
+                if name not in {'data', 'data_raw', 'error', 'error_raw'} and not name.startswith('_'):
                     line = f"\t{name:24s}: {value}"
                     print(line)
             print(f"Data min: {page.data.min():g}, max: {page.data.max():g}, mean: {page.data.mean():g}")
@@ -1,6 +1,8 @@
 import logging
 import json
 
+import numpy as np
+
 from pymchelper.axis import MeshAxis
 from pymchelper.estimator import Estimator
 from pymchelper.page import Page
@@ -37,7 +39,8 @@ class JsonWriter:
         # read metadata from estimator object
         for name, value in estimator.__dict__.items():
             # skip non-metadata fields
-            if name not in {"data", "data_raw", "error", "error_raw", "counter", "pages", "x", "y", "z"}:
+            if name not in {"data", "data_raw", "error", "error_raw", "counter", "pages", "x", "y", "z"} \
+                    and not name.startswith("_"):
                 # remove \" to properly generate JSON
                 est_dict["metadata"][name] = str(value).replace("\"", "")
 
@@ -57,15 +60,15 @@ class JsonWriter:
 
             # read metadata from page object
             for name, value in page.__dict__.items():
-                # skip non-metadata fields and fields already read from estimator object
-                if name not in exclude:
+                # skip non-metadata (including private) fields and fields already read from estimator object
+                if name not in exclude and not name.startswith("_"):
                     # remove \" to properly generate JSON
                     page_dict["metadata"][name] = str(value).replace("\"", "")
 
             if page.dimension == 0:
-                page_dict["data"]["values"] = [page.data_raw.tolist()]
+                page_dict["data"]["values"] = [_values(page.data_raw)]
             else:
-                page_dict["data"]["values"] = page.data_raw.tolist()
+                page_dict["data"]["values"] = _values(page.data_raw)
 
             for i in range(page.dimension):
                 axis: MeshAxis = page.plot_axis(i)
@@ -81,3 +84,28 @@ class JsonWriter:
             json.dump(est_dict, json_file)
 
         return 0
+
+
+# number of single precision values converted to text at once, bounds the temporary array of strings (8 MiB)
+_block_size = 65536
+
+
+def _values(data: np.ndarray):
+    """
+    Data converted to Python floats. Single precision values are written only with digits they really hold
+    (i.e. 0.1 instead of 0.10000000149011612), so JSON files of `float32` data are smaller.
+    The shortest representation of the values is found in blocks, not to make a text copy of the whole page.
+
+    >>> _values(np.array([0.1, 2.5e-39], dtype=np.float32))
+    [0.1, 2.5e-39]
+    """
+    if data.dtype != np.float32:
+        return data.tolist()
+    if data.ndim == 0:
+        return _values(data.reshape(1))[0]
+    if data.ndim > 1:
+        return [_values(row) for row in data]
+    values = []
+    for start in range(0, data.size, _block_size):
+        values.extend(data[start:start + _block_size].astype(str).astype(np.float64).tolist())
+    return values
@@ -1,10 +1,14 @@
 import logging
 import os
-from typing import TYPE_CHECKING
+from typing import Any, BinaryIO, Iterator, Tuple, TYPE_CHECKING
 
 import numpy as np
 
+from pymchelper.axis import MeshAxis
 from pymchelper.estimator import Estimator
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID, detector_name_from_bdotag, page_tags_to_save
+from pymchelper.readers.shieldhit.general import SHFileFormatId, sh_bdo_magic_number
+from pymchelper.readers.shieldhit.reader_base import bdo_header_dtype, bdo_token_header_dtype
 from pymchelper.shieldhit.detector.detector_type import SHDetType
 from pymchelper.shieldhit.detector.estimator_type import SHGeoType
 
@@ -14,14 +18,164 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+def _encode_token(tag_id: int, value: Any) -> Tuple[bytes, np.ndarray]:
+    """
+    Token header and payload array for the value, in the form read back by `SHReaderBDO2019`.
+    Strings (or lists of strings) are stored as NUL-terminated ASCII, padded to multiple of 8 bytes
+    as SHIELD-HIT12A does. Integers are stored as 64-bit integers and all other numbers as doubles.
+
+    >>> header, payload = _encode_token(SHBDOTagID.geometry_type, 'MSH')
+    >>> payload
+    array([b'MSH'], dtype='|S8')
+    >>> _encode_token(SHBDOTagID.geo_n_bins, [1, 2, 3])[1]
+    array([1, 2, 3])
+    """
+    if isinstance(value, str):
+        value = [value]
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, str) for item in value):
+        encoded = [item.encode('ASCII', 'replace') for item in value]
+        size = 8 * (max(len(item) for item in encoded) // 8 + 1)  # at least one terminating NUL
+        payload = np.array(encoded, dtype='S{:d}'.format(size))
+        pl_type = 'S{:d}'.format(size)
+    else:
+        payload = np.ravel(value)
+        payload = payload.astype('<i8' if payload.dtype.kind in 'biu' else '<f8', copy=False)
+        pl_type = payload.dtype.str
+    header = np.array([(tag_id, pl_type, payload.size)], dtype=bdo_token_header_dtype)
+    return header.tobytes(), payload
+
+
+# estimator and page tokens written from the estimator (or page) fields, instead of the attributes set by the reader
+_estimator_derived_tags = {
+    SHBDOTagID.rt_nstat,
+    SHBDOTagID.rt_file_counter,
+    SHBDOTagID.rt_error_type,
+    SHBDOTagID.rt_nstat_squared,
+    SHBDOTagID.number_of_pages,
+}
+_page_derived_tags = {
+    SHBDOTagID.detector_type,
+    SHBDOTagID.page_diff_flag,
+    SHBDOTagID.page_diff_start,
+    SHBDOTagID.page_diff_stop,
+    SHBDOTagID.page_diff_size,
+}
+
+
 class SHBinaryWriter:
+    """
+    Writes estimators in SHIELD-HIT12A BDO2019 binary format, i.e. to store averaged results
+    in the native format, so they can be read (or averaged again with other files) as any other BDO file.
+
+    Written is the same token stream as SHIELD-HIT12A writes and `SHReaderBDO2019` reads: estimator
+    metadata and geometry, then metadata and data block of each page. Errors (if present) are stored
+    after the data block in an error block, a token written only by pymchelper.
+    Together with the errors the state of the averaging is stored in runtime tokens (number of averaged files,
+    type of errors and sum of squared numbers of primaries), so the spread of the averaged files is kept
+    when the file is averaged again (see `fromfilelist`).
+    Data of pages normalised by the number of primaries when read is written back multiplied by it
+    (as stored by SHIELD-HIT12A), errors are scaled in the same way.
+    """
 
-    def __init__(self, filename, options):
-        self.filename = filename
+    def __init__(self, filename: str, options: object) -> None:
+        self.filename: str = filename
+        if not self.filename.endswith(".bdo"):
+            self.filename += ".bdo"
+
+    def write(self, estimator: Estimator) -> int:
+        if len(estimator.pages) == 0:
+            print("No pages in the output file, conversion to BDO skipped.")
+            return 1
+
+        # written to a temporary file first, output may replace one of the input files (possibly memory-mapped)
+        tmp_filename = "{:s}.{:d}.tmp".format(self.filename, os.getpid())
+        try:
+            with open(tmp_filename, 'wb') as f:
+                header = np.array([(sh_bdo_magic_number, b'II', b'1.0')], dtype=bdo_header_dtype)
+                f.write(header.tobytes())
+                for tag_id, value in self._estimator_tokens(estimator):
+                    self._write_token(f, tag_id, value)
+                for page in estimator.pages:
+                    for tag_id, value in self._page_tokens(page, estimator.number_of_primaries):
+                        self._write_token(f, tag_id, value)
+            os.replace(tmp_filename, self.filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+        logger.info("Written %d page(s) to %s", len(estimator.pages), self.filename)
+        return 0
 
-    def write(self, estimator):
-        # TODO
-        pass
+    @staticmethod
+    def _write_token(f: BinaryIO, tag_id: int, value: Any) -> None:
+        header, payload = _encode_token(tag_id, value)
+        f.write(header)
+        f.write(np.ascontiguousarray(payload).data)
+
+    @staticmethod
+    def _estimator_tokens(estimator: Estimator) -> Iterator[Tuple[int, Any]]:
+        """Tokens with the file format, estimator metadata and geometry."""
+        yield SHBDOTagID.format, SHFileFormatId.bdo2019.value
+        for tag_id, name in detector_name_from_bdotag.items():
+            if tag_id not in _estimator_derived_tags and hasattr(estimator, name):
+                yield tag_id, getattr(estimator, name)
+        yield SHBDOTagID.rt_nstat, estimator.number_of_primaries
+        if any(page.error_raw is not None for page in estimator.pages):
+            # state of the averaging, needed to average the file again together with other files
+            yield SHBDOTagID.rt_file_counter, estimator.file_counter
+            yield SHBDOTagID.rt_error_type, int(estimator.error_type)
+            if hasattr(estimator, 'number_of_primaries_squared'):
+                yield SHBDOTagID.rt_nstat_squared, float(estimator.number_of_primaries_squared)
+        if estimator.geotyp is not None:
+            yield SHBDOTagID.geometry_type, str(estimator.geotyp)
+        axes = (estimator.x, estimator.y, estimator.z)
+        yield SHBDOTagID.geo_p_start, [axis.min_val for axis in axes]
+        yield SHBDOTagID.geo_q_stop, [axis.max_val for axis in axes]
+        yield SHBDOTagID.geo_n_bins, [axis.n for axis in axes]
+        if not hasattr(estimator, 'geo_units'):
+            yield SHBDOTagID.geo_units, ';'.join(axis.unit for axis in axes)
+        yield SHBDOTagID.number_of_pages, len(estimator.pages)
+
+    @staticmethod
+    def _page_tokens(page: 'Page', number_of_primaries: int) -> Iterator[Tuple[int, Any]]:
+        """Tokens with page metadata, data and errors, the first one starts a new page."""
+        try:
+            dettyp = SHDetType(page.dettyp)
+        except ValueError:
+            dettyp = SHDetType.invalid
+        yield SHBDOTagID.detector_type, dettyp.value
+        for tag_id in page_tags_to_save:
+            if tag_id not in _page_derived_tags and hasattr(page, SHBDOTagID(tag_id).name):
+                yield tag_id, getattr(page, SHBDOTagID(tag_id).name)
+        if not hasattr(page, 'detector_unit'):
+            yield SHBDOTagID.detector_unit, page.unit
+        yield from _diff_axes_tokens(page)
+
+        data = np.asarray(page.data_raw)
+        error = page.error_raw
+        if getattr(page, 'page_normalized', None) == 2:
+            # data was divided by the number of primaries when read, see `_normalise_pages`
+            data = np.multiply(data, np.float64(number_of_primaries))
+            if error is not None:
+                error = np.multiply(error, np.float64(number_of_primaries))
+        yield SHBDOTagID.data_block, data
+        if error is not None:
+            yield SHBDOTagID.data_error_block, error
+
+
+def _diff_axes_tokens(page: 'Page') -> Iterator[Tuple[int, Any]]:
+    """Tokens describing differential axes, taken from the axes (which may be cut by the page selection)."""
+    diff_axes = (page.diff_axis1, page.diff_axis2)
+    if all(axis.n == 1 for axis in diff_axes) and not hasattr(page, 'page_diff_size'):
+        return
+    # as in SHIELD-HIT12A, values for both axes are written, also if only the first one is used
+    yield SHBDOTagID.page_diff_flag, [
+        -1 if axis.binning == MeshAxis.BinningType.logarithmic else 1 for axis in diff_axes
+    ]
+    yield SHBDOTagID.page_diff_start, [axis.min_val for axis in diff_axes]
+    yield SHBDOTagID.page_diff_stop, [axis.max_val for axis in diff_axes]
+    yield SHBDOTagID.page_diff_size, [axis.n for axis in diff_axes]
+    if not hasattr(page, 'page_diff_units'):
+        yield SHBDOTagID.page_diff_units, ';'.join(axis.unit for axis in diff_axes)
 
 
 class TxtWriter:
@@ -0,0 +1,33 @@
+"""
+Benchmark of averaging many small BDO files with identical structure, without and with layout reuse.
+
+Run from the main directory of the repository:
+
+    python -m tests.benchmarks.bench_layout [number_of_files]
+"""
+import shutil
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+from pymchelper.input_output import fromfilelist
+
+source = Path("tests") / "res" / "shieldhit" / "averaging" / "normalisation-3_aggregation-mean_0001.bdo"
+
+
+def main(number_of_files: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(number_of_files):
+            path = Path(tmp_dir) / "sweep_{:05d}.bdo".format(i)
+            shutil.copy(source, path)
+            paths.append(str(path))
+
+        for name, reuse_layout in (("full parser", False), ("layout reuse", True)):
+            seconds = min(timeit.repeat(lambda: fromfilelist(paths, reuse_layout=reuse_layout), number=1, repeat=3))
+            print("{:20s} {:8.1f} us per file".format(name, 1e6 * seconds / number_of_files))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,36 @@
+"""
+Benchmark of reading a large data block at once and in a growing number of parallel chunks.
+
+The block is written to a temporary file in the given directory (by default the system temporary directory),
+point it to the file system of interest (i.e. Lustre scratch or NVMe drive). Reads after the first one
+are served from the page cache unless the file is larger than the memory (or the cache is dropped between runs).
+
+Run from the main directory of the repository:
+
+    python -m tests.benchmarks.bench_pread [size_in_MiB] [directory]
+"""
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+from pymchelper.readers.compressed import read_array_at
+
+
+def main(size_mib: int, directory: str = None) -> None:
+    count = size_mib * 1024 * 1024 // 8
+    with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+        path = str(Path(tmp_dir) / "data_block.dat")
+        np.random.default_rng(0).random(count).tofile(path)
+
+        for read_chunks in (1, 2, 4, 8, 16, 32):
+            seconds = min(timeit.repeat(lambda: read_array_at(path, '<f8', count, read_chunks=read_chunks),
+                                        number=1,
+                                        repeat=3))
+            print("{:3d} chunks {:8.1f} MiB/s".format(read_chunks, size_mib / seconds))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024, sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark of the input file type recognition (per-file overhead of `guess_reader`).
+
+Compares the legacy chain of reader factories (FLUKA `Usrxxx` header parsing, SHIELD-HIT12A magic number
+check and format token scan) with the single-open sniffer, without and with its per-path cache.
+Run from the main directory of the repository:
+
+    python -m tests.benchmarks.bench_sniffing [number_of_files]
+"""
+import shutil
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+from pymchelper.readers import sniffer
+from pymchelper.readers.fluka import FlukaReaderFactory
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.general import file_has_sh_magic_number, read_token
+
+sources = sorted((Path("tests") / "res" / "shieldhit" / "averaging").glob("*.bdo"))
+
+
+def legacy_sniff(path: str) -> None:
+    if FlukaReaderFactory(path).get_reader() is None and file_has_sh_magic_number(path):
+        read_token(path, SHBDOTagID.format)
+
+
+def uncached_sniff(path: str) -> None:
+    sniffer.clear_cache()
+    sniffer.sniff_reader(path)
+
+
+def main(number_of_files: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(number_of_files):
+            path = Path(tmp_dir) / "{:s}_{:05d}.bdo".format(sources[i % len(sources)].stem, i)
+            shutil.copy(sources[i % len(sources)], path)
+            paths.append(str(path))
+
+        sniffer.clear_cache()
+        for name, function in (("legacy factories", legacy_sniff), ("sniffer", uncached_sniff),
+                               ("sniffer, cached", sniffer.sniff_reader)):
+            seconds = min(timeit.repeat(lambda: [function(path) for path in paths], number=1, repeat=3))
+            print("{:20s} {:8.1f} us per file".format(name, 1e6 * seconds / number_of_files))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,58 @@
+"""
+Benchmark of `SumAggregator` with plain and compensated summation: time of an update of a large page,
+and accuracy of sums of many small pages (i.e. COUNT scorers of many files) and of total weights,
+compared to the correctly rounded sums (`math.fsum`).
+
+Run from the main directory of the repository:
+
+    python -m tests.benchmarks.bench_sum [number_of_bins] [number_of_files]
+"""
+import math
+import sys
+import time
+
+import numpy as np
+
+from pymchelper.averaging import SumAggregator, WeightedStatsAggregator
+
+
+def _relative_error(result: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.max(np.abs(result - exact) / np.abs(exact)))
+
+
+def main(number_of_bins: int, number_of_files: int) -> None:
+    rng = np.random.default_rng(0)
+
+    print("update of a page of {:d} bins:".format(number_of_bins))
+    values = [rng.random(number_of_bins) for _ in range(2)]
+    for compensated in (False, True):
+        aggregator = SumAggregator(compensated=compensated)
+        aggregator.update(values[0])
+        start_time = time.perf_counter()
+        for update_no in range(10):
+            aggregator.update(values[update_no % 2])
+        print("  {:12s} {:8.2f} ms per update".format("compensated" if compensated else "plain",
+                                                      1e3 * (time.perf_counter() - start_time) / 10))
+
+    # counts per primary of very different magnitude, as in COUNT scorers of many files
+    print("sum of {:d} files, 1000 bins:".format(number_of_files))
+    counts = rng.random((number_of_files, 1000)) * 10.**rng.integers(-6, 3, size=(number_of_files, 1000))
+    exact = np.array([math.fsum(bin_values) for bin_values in counts.T])
+    weights = rng.integers(10**5, 10**6, size=number_of_files) / 7  # non-integer weights
+    exact_weight = math.fsum(weights)
+    for compensated in (False, True):
+        aggregator = SumAggregator(compensated=compensated)
+        stats = WeightedStatsAggregator(compensated=compensated)
+        start_time = time.perf_counter()
+        for value, weight in zip(counts, weights):
+            aggregator.update(value)
+            stats.update(value, weight)
+        print("  {:12s} {:8.2f} s, max relative error of sums {:.1e}, of total weight {:.1e}".format(
+            "compensated" if compensated else "plain",
+            time.perf_counter() - start_time,
+            _relative_error(aggregator.data, exact),
+            abs(stats.total_weight - exact_weight) / exact_weight))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10**7, int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
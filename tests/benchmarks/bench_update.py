@@ -0,0 +1,52 @@
+"""
+Benchmark of `WeightedStatsAggregator.update` of a large page: time and peak memory of the in-place blocked update,
+compared to the update evaluating the formulas with full-size temporary arrays (as done before).
+
+Run from the main directory of the repository:
+
+    python -m tests.benchmarks.bench_update [number_of_bins] [number_of_updates]
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from pymchelper.averaging import WeightedStatsAggregator
+
+
+class TemporariesAggregator(WeightedStatsAggregator):
+    """Update with full-size temporary arrays, as implemented before the in-place update."""
+
+    def update(self, value, weight: float = 1.0, **kwargs):
+        if not self.updated:
+            self.data = value.astype(np.float64) * 0
+            self._accumulator_S = value.astype(np.float64) * 0
+        self.total_weight += weight
+        self._total_weight_squared += weight**2
+        delta_old = value - self.data
+        self.data += (weight / self.total_weight) * delta_old
+        self._accumulator_S += weight * (value - self.data) * delta_old
+        self._updated = True
+
+
+def main(number_of_bins: int, number_of_updates: int) -> None:
+    rng = np.random.default_rng(0)
+    values = [rng.random(number_of_bins) for _ in range(2)]
+    page_mib = values[0].nbytes / 1024**2
+
+    for name, aggregator_cls in (("temporaries", TemporariesAggregator), ("in place", WeightedStatsAggregator)):
+        aggregator = aggregator_cls()
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        for update_no in range(number_of_updates):
+            aggregator.update(values[update_no % 2], weight=1000 + update_no)
+        seconds = time.perf_counter() - start_time
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{:12s} {:8.1f} ms per update, peak memory {:5.2f} x page ({:.0f} MiB page)".format(
+            name, 1e3 * seconds / number_of_updates, peak / 1024**2 / page_mib, page_mib))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10**7, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -1,9 +1,12 @@
 import platform
 from pathlib import Path
-from typing import Generator
+from typing import Callable, Generator, List, Optional, Sequence
 
+import numpy as np
 import pytest
 
+from pymchelper.estimator import Estimator
+
 
 @pytest.fixture(scope='session')
 def main_dir() -> Generator[Path, None, None]:
@@ -34,3 +37,62 @@ def shieldhit_binary_path(shieldhit_installation_dir: Path,
                           shieldhit_binary_filename: Path) -> Generator[Path, None, None]:
     """Returns the path to the SHIELD-HIT12A binary"""
     yield shieldhit_installation_dir / shieldhit_binary_filename
+
+
+@pytest.fixture(scope='session')
+def fluka_usrbin_path(tmp_path_factory: pytest.TempPathFactory) -> Generator[Path, None, None]:
+    """Returns the path to a small FLUKA USRBIN binary file, decoded from the FLUKA mock script"""
+    import base64
+    import re
+    mock_script = Path(__file__).resolve().parent / 'res' / 'mocks' / 'fluka_minimal' / 'rfluka'
+    content = re.search(r'OUTPUT_FILE_CONTENT_0="(.*)"', mock_script.read_text()).group(1)
+    output_path = tmp_path_factory.mktemp('fluka') / 'minimal001_fort.21'
+    output_path.write_bytes(base64.b64decode(content))
+    yield output_path
+
+
+@pytest.fixture(scope='session')
+def averaging_dir(main_dir: Path) -> Generator[Path, None, None]:
+    """Returns the directory with SHIELD-HIT12A outputs of several jobs, for all kinds of aggregation"""
+    yield main_dir / 'res' / 'shieldhit' / 'averaging'
+
+
+@pytest.fixture(scope='session')
+def averaging_files(averaging_dir: Path) -> Generator[Callable[[str], List[str]], None, None]:
+    """Returns a function listing (sorted) paths of the files in `averaging_dir` matching the glob pattern"""
+
+    def file_list(pattern: str) -> List[str]:
+        return sorted(str(path) for path in averaging_dir.glob(pattern))
+
+    yield file_list
+
+
+def assert_same_estimators(estimator: Estimator,
+                           expected: Estimator,
+                           attributes: Sequence[str] = (),
+                           page_attributes: Sequence[str] = (),
+                           rtol: float = 0,
+                           error_rtol: Optional[float] = None) -> None:
+    """
+    Asserts that the estimators have the same number of primaries, mesh axes and pages. Pages have to have
+    the same name, unit, detector type and differential axes, equal data and errors (close with `rtol`,
+    or `error_rtol` for errors, if given). Also `attributes` of estimators and `page_attributes` of pages
+    are compared (missing attributes are taken as None).
+    """
+    for name in ('number_of_primaries', 'x', 'y', 'z', *attributes):
+        np.testing.assert_equal(getattr(estimator, name, None), getattr(expected, name, None), err_msg=name)
+    if error_rtol is None:
+        error_rtol = rtol
+    assert len(estimator.pages) == len(expected.pages)
+    for page, expected_page in zip(estimator.pages, expected.pages):
+        assert page.estimator is estimator
+        for name in ('name', 'unit', 'dettyp', 'diff_axis1', 'diff_axis2', *page_attributes):
+            np.testing.assert_equal(getattr(page, name, None), getattr(expected_page, name, None), err_msg=name)
+        for values, expected_values, values_rtol in ((page.data_raw, expected_page.data_raw, rtol),
+                                                     (page.error_raw, expected_page.error_raw, error_rtol)):
+            if expected_values is None:
+                assert values is None
+            elif values_rtol:
+                np.testing.assert_allclose(values, expected_values, rtol=values_rtol)
+            else:
+                np.testing.assert_array_equal(values, expected_values)
@@ -0,0 +1,112 @@
+"""Tests for reading members of tar and zip archives."""
+
+import gzip
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from pymchelper import run
+from pymchelper.input_output import fromfile, fromfilelist, frompattern, group_input_files
+from pymchelper.readers.archive import expand_pattern, open_member
+from tests.conftest import assert_same_estimators
+
+# members of the archive, as in bundles of HPC jobs: one directory per job with outputs of all estimators,
+# mapped to the names of the files in the averaging directory
+_run_files = {
+    f"run_{job}/{output_type}_{job:04d}.bdo": f"{output_type}_{job:04d}.bdo"
+    for job in (1, 2, 3)
+    for output_type in ("normalisation-3_aggregation-mean", "normalisation-4_aggregation-concat")
+}
+
+
+@pytest.fixture
+def make_archive(averaging_dir: Path):
+    """Function making tar or zip archive (depending on the suffix of its path) with all `_run_files` members."""
+
+    def make(path: Path) -> str:
+        if path.suffix == '.zip':
+            with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+                for name, source in _run_files.items():
+                    zip_file.write(averaging_dir / source, name)
+        else:
+            with tarfile.open(path, 'w:gz' if path.suffix == '.gz' else 'w') as tar:
+                for name, source in _run_files.items():
+                    tar.add(averaging_dir / source, name)
+        return str(path)
+
+    return make
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("archive_name", ["results.tar", "results.tar.gz", "results.zip"])
+def test_read_archive_member(tmp_path: Path, make_archive, averaging_dir: Path, archive_name: str):
+    """Single member is read as the original file, also in lazy and mmap mode."""
+    archive = make_archive(tmp_path / archive_name)
+    member = archive + "::run_2/normalisation-3_aggregation-mean_0002.bdo"
+    regular = fromfile(str(averaging_dir / "normalisation-3_aggregation-mean_0002.bdo"))
+
+    assert_same_estimators(fromfile(member), regular)
+    assert_same_estimators(fromfile(member, lazy=True), regular)
+    assert_same_estimators(fromfile(member, mmap=True, index_file=True), regular)
+    assert not any(name.endswith('.idx') for name in os.listdir(tmp_path))
+
+
+def test_frompattern_in_archives(tmp_path: Path, make_archive, averaging_files):
+    """Members matching the pattern (from all matching archives) are grouped by corename and averaged."""
+    make_archive(tmp_path / "results_a.tar")
+    make_archive(tmp_path / "results_b.zip")
+    pattern = str(tmp_path / "results_*::run_*/normalisation-*.bdo")
+
+    members = expand_pattern(pattern)
+    assert len(members) == 2 * len(_run_files)
+    groups = group_input_files(members)
+    assert sorted(groups) == ["normalisation-3_aggregation-mean", "normalisation-4_aggregation-concat"]
+
+    estimators = frompattern(pattern, nan=False)
+    for estimator in estimators:
+        files = averaging_files(f"{estimator.file_corename}_000?.bdo")
+        regular = fromfilelist(files + files)
+        assert estimator.file_counter == len(files) * 2
+        assert_same_estimators(estimator, regular)
+
+
+def test_convertmc_with_archive(tmp_path: Path, make_archive, averaging_dir: Path):
+    """convertmc --many reads archive members without extracting them, output is the same as for files on disk."""
+    pattern = make_archive(tmp_path / "results.tar") + "::run_*/normalisation-3_aggregation-mean_*.bdo"
+    regular_pattern = str(averaging_dir / "normalisation-3_aggregation-mean_000?.bdo")
+
+    assert run.main(['txt', '--many', pattern, str(tmp_path / "archive")]) == 0
+    run.main(['txt', '--many', regular_pattern, str(tmp_path / "regular")])
+
+    regular_files = sorted(path.name for path in (tmp_path / "regular").iterdir())
+    assert regular_files == sorted(path.name for path in (tmp_path / "archive").iterdir())
+    for name in regular_files:
+        assert (tmp_path / "regular" / name).read_text() == (tmp_path / "archive" / name).read_text()
+
+
+def test_compressed_member(tmp_path: Path, fluka_usrbin_path: Path):
+    """Compressed members (here FLUKA output) are decompressed while being read from the archive."""
+    archive = tmp_path / "fluka.tar"
+    with tarfile.open(archive, 'w') as tar:
+        compressed_path = tmp_path / (fluka_usrbin_path.name + '.gz')
+        compressed_path.write_bytes(gzip.compress(fluka_usrbin_path.read_bytes()))
+        tar.add(compressed_path, "run_1/" + compressed_path.name)
+
+    member = str(archive) + "::run_1/" + compressed_path.name
+    assert expand_pattern(str(archive) + "::*_fort.*") == [member]
+    assert_same_estimators(fromfile(member), fromfile(str(fluka_usrbin_path)))
+
+
+@pytest.mark.smoke
+def test_missing_member(tmp_path: Path, make_archive):
+    """Missing members are reported as missing files, archive is closed together with the member."""
+    archive = make_archive(tmp_path / "results.tar")
+    with pytest.raises(FileNotFoundError):
+        open_member(archive + "::run_1/missing.bdo")
+    with open_member(archive + "::run_1/normalisation-3_aggregation-mean_0001.bdo") as f:
+        assert f.read(6) == b'xSH12A'
+    assert f.closed
+    assert expand_pattern(str(tmp_path / "missing.tar::*.bdo")) == []
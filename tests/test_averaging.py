@@ -1,4 +1,5 @@
 import logging
+import math
 from pathlib import Path
 from typing import Generator
 
@@ -6,6 +7,7 @@ import numpy as np
 import pytest
 
 from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.run import main
 
 logger = logging.getLogger(__name__)
 
@@ -40,3 +42,22 @@ def test_averaging(shieldhit_multiple_result_pattern: str, shieldhit_multiple_re
     assert len(list_of_entries_to_average) == 3
     assert np.average(list_of_entries_to_average, axis=0) == pytest.approx(averaged_data.pages[0].data[5, 0, 0, 0, 0],
                                                                            rel=1e-9)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_compensated_sum(averaging_files, processes: int) -> None:
+    """With compensated summation, sums of COUNT pages of many files are correctly rounded sums of the file data"""
+    input_file_list = averaging_files("normalisation-2_aggregation-sum_*.bdo")
+    summed = fromfilelist(input_file_list, compensated=True, processes=processes)
+    plain = fromfilelist(input_file_list)
+    file_data = np.reshape([fromfile(path).pages[0].data_raw for path in input_file_list], (len(input_file_list), -1))
+    exact = [math.fsum(bin_values) for bin_values in file_data.T]
+    np.testing.assert_array_equal(np.reshape(summed.pages[0].data_raw, -1), exact)
+    np.testing.assert_allclose(summed.pages[0].data_raw, plain.pages[0].data_raw, rtol=1e-12)
+
+
+def test_convertmc_compensated(averaging_dir: Path, tmp_path: Path) -> None:
+    """`convertmc --compensated` accumulates the sums with compensated summation"""
+    pattern = str(averaging_dir / "normalisation-2_aggregation-sum_*.bdo")
+    assert main(['bdo', '--many', '--compensated', pattern, str(tmp_path)]) == 0
+    assert fromfile(str(tmp_path / "normalisation-2_aggregation-sum.bdo")).number_of_primaries > 0
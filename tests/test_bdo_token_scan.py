@@ -0,0 +1,138 @@
+"""Tests for payload-skipping BDO token scanning."""
+
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.general import SHFileFormatId, SHReaderFactory, read_token
+from pymchelper.readers.shieldhit.reader_base import BDOToken, PayloadLoader, iter_bdo_tokens, read_next_token, \
+    scan_tokens
+from pymchelper.readers.shieldhit.reader_bdo2019 import SHReaderBDO2019
+from pymchelper.readers.shieldhit.token_index import build_token_index
+
+bdo_path = Path("tests") / "res" / "shieldhit" / "averaging" / "normalisation-4_aggregation-concat_0001.bdo"
+
+
+class CountingRawIO(io.RawIOBase):
+    """Raw binary stream which counts the number of bytes read from the underlying buffer."""
+
+    def __init__(self, payload: bytes) -> None:
+        self.stream = io.BytesIO(payload)
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.stream.tell()
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+
+def _token(tag_id: int, values: np.ndarray) -> bytes:
+    """Serialize a single BDO token (header and payload)."""
+    header = np.array([(tag_id, values.dtype.str.encode('ASCII'), values.size)],
+                      dtype=[('pl_id', '<u8'), ('pl_type', 'S8'), ('pl_len', '<u8')])
+    return header.tobytes() + values.tobytes()
+
+
+@pytest.mark.smoke
+def test_scan_tokens_matches_full_token_walk():
+    """Token ids and lengths found by the scanner should be the same as found by reading all payloads."""
+    with open(bdo_path, "rb") as f:
+        f.seek(24)
+        scanned = [(pl_id, pl_type, pl_len) for pl_id, pl_type, pl_len, _ in scan_tokens(f)]
+
+    with open(bdo_path, "rb") as f:
+        f.seek(24)
+        walked = []
+        while True:
+            token = read_next_token(f)
+            if token is None:
+                break
+            walked.append((token[0], token[1], token[2]))
+
+    assert scanned == walked
+
+
+@pytest.mark.smoke
+def test_scan_tokens_skips_payloads():
+    """Scanning a stream with a large data block should read only the token headers."""
+    data_block = np.zeros(100_000, dtype='<f8')
+    stream = _token(SHBDOTagID.shversion, np.array([b'1.0'], dtype='S8')) + \
+        _token(SHBDOTagID.data_block, data_block) + \
+        _token(SHBDOTagID.format, np.array([SHFileFormatId.bdo2019], dtype='<i8'))
+    raw = CountingRawIO(stream)
+
+    tokens = list(scan_tokens(io.BufferedReader(raw, buffer_size=64)))
+
+    assert [token[0] for token in tokens] == [SHBDOTagID.shversion, SHBDOTagID.data_block, SHBDOTagID.format]
+    assert tokens[1][3] == 24 + 8 + 24
+    assert raw.bytes_read < data_block.nbytes // 100
+
+
+@pytest.mark.smoke
+def test_read_token_and_format_detection():
+    """Format tag is read without decoding the data blocks."""
+    assert read_token(bdo_path, SHBDOTagID.format) == SHFileFormatId.bdo2019
+    assert read_token(bdo_path, SHBDOTagID.rt_nstat) == 1000
+    assert SHReaderFactory(str(bdo_path)).get_reader() is SHReaderBDO2019
+
+
+@pytest.mark.smoke
+def test_iter_bdo_tokens_matches_token_walk():
+    """Raw tokens yielded by the iterator (with or without token index) are the same as read by the token walk."""
+    with open(bdo_path, "rb") as f:
+        f.seek(24)
+        walked = []
+        while True:
+            token = read_next_token(f)
+            if token is None:
+                break
+            walked.append(token)
+
+    for index in (None, build_token_index(str(bdo_path))):
+        tokens = list(iter_bdo_tokens(bdo_path, decode=False, index=index))
+        assert len(tokens) == len(walked)
+        for token, walked_token in zip(tokens, walked):
+            assert isinstance(token, BDOToken)
+            assert token[:3] == walked_token[:3]
+            assert token.offset == walked_token.offset
+            np.testing.assert_array_equal(token.payload, walked_token.payload)
+
+
+@pytest.mark.smoke
+def test_iter_bdo_tokens_filters_and_decodes():
+    """Only requested tokens are yielded, single values and strings are decoded."""
+    tags = {SHBDOTagID.rt_nstat, SHBDOTagID.shversion, SHBDOTagID.format}
+    tokens = {token.tag_id: token for token in iter_bdo_tokens(bdo_path, tags=tags)}
+
+    assert set(tokens) == tags
+    assert tokens[SHBDOTagID.rt_nstat].payload == 1000
+    assert tokens[SHBDOTagID.format].payload == SHFileFormatId.bdo2019
+    assert isinstance(tokens[SHBDOTagID.shversion].payload, str)
+
+
+@pytest.mark.smoke
+def test_iter_bdo_tokens_skips_payloads():
+    """Skipped payloads are yielded as loaders reading the same data as the full token walk."""
+    full = [token for token in iter_bdo_tokens(bdo_path) if token.tag_id == SHBDOTagID.data_block]
+    skipped = list(iter_bdo_tokens(bdo_path, tags={SHBDOTagID.data_block}, skip_payload_tags={SHBDOTagID.data_block}))
+
+    assert len(skipped) == len(full) > 0
+    for full_token, skipped_token in zip(full, skipped):
+        assert isinstance(skipped_token.payload, PayloadLoader)
+        np.testing.assert_array_equal(skipped_token.payload(), full_token.payload)
@@ -0,0 +1,122 @@
+"""Tests for writing estimators in SHIELD-HIT12A BDO2019 format."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.estimator import ErrorEstimate
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.writers.shieldhit import SHBinaryWriter
+from tests.conftest import assert_same_estimators
+
+res_dir = Path("tests") / "res" / "shieldhit"
+
+
+def _write_and_read(estimator, path: Path):
+    assert SHBinaryWriter(str(path), None).write(estimator) == 0
+    return fromfile(str(path) + ".bdo")
+
+
+def _assert_same_estimators(estimator, expected):
+    assert_same_estimators(estimator, expected, ('geotyp', 'mc_code_version'), ('page_normalized', ))
+    # characters which were not decoded from ASCII (i.e. in localised dates) are written as '?'
+    assert estimator.filedate == expected.filedate.encode('ASCII', 'replace').decode('ASCII')
+    for page, expected_page in zip(estimator.pages, expected.pages):
+        # byte-level equality, not only up to rounding
+        assert np.asarray(page.data_raw).tobytes() == np.asarray(expected_page.data_raw).tobytes()
+        if expected_page.error_raw is not None:
+            assert page.error_raw.tobytes() == expected_page.error_raw.tobytes()
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("path", [
+    res_dir / "v1.0.0" / "ex_yzmsh.bdo",
+    res_dir / "diff_scoring" / "fluence_elog.bdo",
+    res_dir / "diff_scoring" / "fluence_2d_lin.bdo",
+    res_dir / "averaging" / "normalisation-4_aggregation-concat_0001.bdo",
+])
+def test_round_trip(path: Path, tmp_path: Path):
+    """Written file is read back as the same estimator, writing it again gives identical file."""
+    estimator = fromfile(str(path))
+    written = _write_and_read(estimator, tmp_path / "first")
+    _assert_same_estimators(written, estimator)
+
+    _write_and_read(written, tmp_path / "second")
+    assert (tmp_path / "second.bdo").read_bytes() == (tmp_path / "first.bdo").read_bytes()
+
+
+@pytest.mark.parametrize("normalisation", ["1", "2", "3", "4", "5"])
+def test_averaged_round_trip(normalisation: str, tmp_path: Path, averaging_files):
+    """Averaged results are stored together with their errors (for aggregations which calculate them)."""
+    averaged = fromfilelist(averaging_files(f"normalisation-{normalisation}_*.bdo"), error=ErrorEstimate.stderr)
+    written = _write_and_read(averaged, tmp_path / "averaged")
+    assert all((page.error_raw is not None) == (normalisation in {"3", "5"}) for page in written.pages)
+    _assert_same_estimators(written, averaged)
+
+    # read options are applied to errors as well as to the data
+    for page in fromfile(str(tmp_path / "averaged.bdo"), lazy=True, dtype=np.float32).pages:
+        assert page.error_raw is None or page.error_raw.dtype == np.float32
+
+
+@pytest.mark.parametrize("part_error", [ErrorEstimate.stddev, ErrorEstimate.stderr])
+@pytest.mark.parametrize("error", [ErrorEstimate.stddev, ErrorEstimate.stderr])
+def test_averaged_files_averaged_again(tmp_path: Path, averaging_files, part_error: ErrorEstimate,
+                                       error: ErrorEstimate):
+    """Files with averaged results of parts of the simulation are averaged again to the result of all files."""
+    file_list = averaging_files("normalisation-5_*.bdo")
+    parts = []
+    for part_no, part in enumerate((file_list[:3], file_list[3:])):
+        path = tmp_path / "part_{:d}".format(part_no)
+        SHBinaryWriter(str(path), None).write(fromfilelist(part, error=part_error))
+        parts.append(str(path) + ".bdo")
+
+    averaged = fromfilelist(file_list, error=error)
+    for options in ({}, {'reuse_layout': True}, {'processes': 2}):
+        averaged_again = fromfilelist(parts, error=error, **options)
+        assert averaged_again.number_of_primaries == averaged.number_of_primaries
+        assert averaged_again.file_counter == averaged.file_counter == len(file_list)
+        for page, expected_page in zip(averaged_again.pages, averaged.pages):
+            np.testing.assert_allclose(page.data_raw, expected_page.data_raw, rtol=1e-12)
+            # spread of the files averaged in each part is kept
+            np.testing.assert_allclose(page.error_raw, expected_page.error_raw, rtol=1e-9)
+
+
+def test_averaged_files_without_errors(tmp_path: Path, averaging_files, caplog):
+    """Files with averaged results, written without the averaging state, are averaged as single files."""
+    file_list = averaging_files("normalisation-5_*.bdo")
+    parts = []
+    for part_no, part in enumerate((file_list[:3], file_list[3:])):
+        averaged = fromfilelist(part)
+        del averaged.number_of_primaries_squared
+        path = tmp_path / "part_{:d}".format(part_no)
+        SHBinaryWriter(str(path), None).write(averaged)
+        parts.append(str(path) + ".bdo")
+
+    averaged_again = fromfilelist(parts)
+    assert "Results averaged from 3 files are aggregated as results of a single file" in caplog.text
+    for page, expected_page in zip(averaged_again.pages, fromfilelist(file_list).pages):
+        np.testing.assert_allclose(page.data_raw, expected_page.data_raw, rtol=1e-12)
+
+
+def test_selection(tmp_path: Path, averaging_files):
+    """Estimators cut by page selection are written with the cut axes, errors are cut when read with a selection."""
+    path = res_dir / "diff_scoring" / "fluence_2d_lin.bdo"
+    box = (slice(None), slice(None), slice(None), slice(2, 5))
+    selected = fromfile(str(path), selection=PageSelection(box=box))
+    _assert_same_estimators(_write_and_read(selected, tmp_path / "selected"), selected)
+
+    averaged = fromfilelist(averaging_files("normalisation-5_*.bdo"))
+    SHBinaryWriter(str(tmp_path / "averaged"), None).write(averaged)
+    for page in fromfile(str(tmp_path / "averaged.bdo"), selection=PageSelection(index={0}, box=(slice(0, 1), ))).pages:
+        assert page.error_raw.size == page.data_raw.size
+
+
+def test_convertmc_bdo(tmp_path: Path, averaging_dir: Path, averaging_files):
+    """Many files are averaged by `convertmc bdo` into a single BDO file."""
+    from pymchelper.run import main
+    pattern = str(averaging_dir / "normalisation-5_aggregation-mean_*.bdo")
+    assert main(['bdo', '--many', '--error', 'stddev', pattern, str(tmp_path)]) == 0
+    _assert_same_estimators(fromfile(str(tmp_path / "normalisation-5_aggregation-mean.bdo")),
+                            fromfilelist(averaging_files("normalisation-5_*.bdo"), error=ErrorEstimate.stddev))
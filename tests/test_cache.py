@@ -0,0 +1,152 @@
+"""Tests for the on-disk cache of parsed and merged estimators."""
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper import cache as cache_module
+from pymchelper import input_output
+from pymchelper.cache import EstimatorCache
+from pymchelper.estimator import ErrorEstimate
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.shieldhit.detector.detector_type import SHDetType
+from tests.conftest import assert_same_estimators
+
+# estimator attributes restored from the cache metadata, compared in addition to the data
+_cached_attributes = ('file_counter', 'file_corename', 'file_format')
+
+
+@pytest.fixture
+def count_reads(monkeypatch):
+    """List of files parsed by the readers."""
+    read = []
+    guess_reader = input_output.guess_reader
+
+    def counting_guess_reader(filename, **kwargs):
+        read.append(filename)
+        return guess_reader(filename, **kwargs)
+
+    monkeypatch.setattr(input_output, "guess_reader", counting_guess_reader)
+    return read
+
+
+@pytest.fixture
+def file_list(tmp_path: Path, averaging_files):
+    """Copies of files from one simulation, which can be modified by tests."""
+    paths = []
+    for path in map(Path, averaging_files("normalisation-3_aggregation-mean_000?.bdo")):
+        paths.append(str(tmp_path / path.name))
+        Path(paths[-1]).write_bytes(path.read_bytes())
+    return paths
+
+
+@pytest.mark.smoke
+def test_fromfilelist_cache(file_list, tmp_path: Path, count_reads):
+    """Merged estimator is loaded from the cache on the second call, without reading the files."""
+    cache_dir = str(tmp_path / "cache")
+    regular = fromfilelist(file_list)
+    count_reads.clear()
+
+    assert_same_estimators(fromfilelist(file_list, cache_dir=cache_dir), regular, _cached_attributes)
+    assert len(count_reads) == len(file_list)
+    cached = fromfilelist(file_list, cache_dir=cache_dir)
+    assert len(count_reads) == len(file_list)
+    assert_same_estimators(cached, regular, _cached_attributes)
+    assert isinstance(cached.pages[0].data_raw, np.memmap)
+
+
+def test_cache_key(file_list, tmp_path: Path, count_reads):
+    """Other options, modified file or other list of files are not served from the cache."""
+    cache_dir = str(tmp_path / "cache")
+    fromfilelist(file_list, cache_dir=cache_dir)
+    fromfilelist(file_list, cache_dir=cache_dir, dtype='float32')
+    fromfilelist(file_list, cache_dir=cache_dir, dtype=np.float32)
+    fromfilelist(file_list, cache_dir=cache_dir, error=ErrorEstimate.stddev)
+    fromfilelist(file_list[:2], cache_dir=cache_dir)
+    assert len(count_reads) == 4 * len(file_list) - 1
+
+    stat = os.stat(file_list[0])
+    os.utime(file_list[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    count_reads.clear()
+    fromfilelist(file_list, cache_dir=cache_dir)
+    assert len(count_reads) == len(file_list)
+
+
+def test_fromfile_cache(file_list, tmp_path: Path, count_reads):
+    """Single file reads are cached, selection is part of the key, other sources than files are not cached."""
+    cache_dir = str(tmp_path / "cache")
+    selection = PageSelection(dettyp={SHDetType.tlet})
+    for _ in range(2):
+        assert_same_estimators(fromfile(file_list[0], cache_dir=cache_dir), fromfile(file_list[0]), _cached_attributes)
+        assert_same_estimators(fromfile(file_list[0], cache_dir=cache_dir, selection=selection),
+                               fromfile(file_list[0], selection=selection), _cached_attributes)
+    assert count_reads.count(file_list[0]) == 2 + 4
+
+    data = Path(file_list[0]).read_bytes()
+    fromfile(data, cache_dir=cache_dir)
+    fromfile(data, cache_dir=cache_dir)
+    assert count_reads.count(data) == 2
+    assert fromfile(file_list[0], cache_dir=cache_dir, selection=PageSelection(predicate=bool)).pages
+
+
+def test_lru_eviction(file_list, tmp_path: Path):
+    """Least recently used entries are removed when the cache gets too large."""
+    cache = EstimatorCache(str(tmp_path / "cache"))
+    estimator = fromfile(file_list[0])
+    keys = [cache.key([path], {}) for path in file_list[:3]]
+    for key in keys:
+        assert cache.store(key, estimator)
+    entry_size = sum(entry.stat().st_size for entry in os.scandir(tmp_path / "cache" / keys[0]))
+
+    for mtime, key in enumerate(keys):  # make the order of use unambiguous
+        os.utime(tmp_path / "cache" / key, ns=(mtime * 1_000_000_000, mtime * 1_000_000_000))
+    assert cache.load(keys[0]) is not None  # used again, now it is the most recent
+
+    cache.max_size = 2 * entry_size
+    cache.evict()
+    assert sorted(os.listdir(tmp_path / "cache")) == sorted([keys[0], keys[2]])
+    assert cache.load(keys[1]) is None
+
+
+def test_metadata_is_json(file_list, tmp_path: Path):
+    """Entries hold metadata as JSON (nothing is unpickled), entries in other formats are cache misses."""
+    cache = EstimatorCache(str(tmp_path / "cache"))
+    estimator = fromfile(file_list[0])
+    key = cache.key([file_list[0]], {})
+    assert cache.store(key, estimator)
+
+    metadata_path = tmp_path / "cache" / key / "estimator.json"
+    state = json.loads(metadata_path.read_text())
+    assert state['format'] == 1
+    assert_same_estimators(cache.load(key), estimator, _cached_attributes)
+
+    state['format'] = 0
+    metadata_path.write_text(json.dumps(state))
+    assert cache.load(key) is None
+
+
+def test_eviction_of_removed_entries(file_list, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Entries removed by other process while the cache is scanned are skipped."""
+    cache = EstimatorCache(str(tmp_path / "cache"))
+    estimator = fromfile(file_list[0])
+    keys = [cache.key([path], {}) for path in file_list[:3]]
+    for key in keys:
+        assert cache.store(key, estimator)
+
+    directory_size = cache_module._directory_size
+
+    def removing_directory_size(path):
+        # other process removes all entries, including the one being scanned
+        for key in keys:
+            shutil.rmtree(tmp_path / "cache" / key, ignore_errors=True)
+        return directory_size(path)
+
+    monkeypatch.setattr(cache_module, "_directory_size", removing_directory_size)
+    cache.max_size = 0
+    cache.evict()
+    assert os.listdir(tmp_path / "cache") == []
@@ -0,0 +1,102 @@
+"""Tests for reading compressed input files."""
+
+import bz2
+import gzip
+import io
+import lzma
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile, fromfilelist, guess_corename
+from pymchelper.readers import compressed
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.general import SHReaderFactory, read_token
+from pymchelper.readers.shieldhit.reader_bdo2019 import SHReaderBDO2019
+from pymchelper.readers.shieldhit.reader_bin2010 import SHReaderBin2010
+from pymchelper.readers.shieldhit.selection import PageSelection
+from tests.conftest import assert_same_estimators
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+
+_compressors = {'.gz': gzip.open, '.xz': lzma.open, '.bz2': bz2.open}
+
+
+def _compress(source: Path, target_dir: Path, suffix: str) -> str:
+    """Compressed copy of the `source` file, saved in `target_dir`."""
+    target = target_dir / (source.name + suffix)
+    with open(source, 'rb') as f_in, _compressors[suffix](target, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    return str(target)
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("suffix", list(_compressors))
+@pytest.mark.parametrize("path, reader", [
+    (shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo", SHReaderBDO2019),
+    (shieldhit_dir / "averaging" / "normalisation-4_aggregation-concat_0001.bdo", SHReaderBDO2019),
+    (shieldhit_dir / "diff_scoring" / "fluence_2d_log.bdo", SHReaderBDO2019),
+    (shieldhit_dir / "single" / "ex_yzmsh.bdo", SHReaderBin2010),
+])
+def test_compressed_shieldhit_file(tmp_path: Path, path: Path, reader, suffix: str):
+    """Compressed files are recognized and read as the uncompressed ones, also with lazy, mmap or index options."""
+    compressed_path = _compress(path, tmp_path, suffix)
+    regular = fromfile(str(path))
+
+    assert SHReaderFactory(compressed_path).get_reader() is reader
+    assert_same_estimators(fromfile(compressed_path), regular)
+    assert_same_estimators(fromfile(compressed_path, lazy=True), regular)
+    assert_same_estimators(fromfile(compressed_path, mmap=True), regular)
+    if reader is SHReaderBDO2019:
+        assert_same_estimators(fromfile(compressed_path, index_file=True), regular)
+        assert read_token(compressed_path, SHBDOTagID.rt_nstat) == read_token(str(path), SHBDOTagID.rt_nstat)
+
+
+def test_compressed_box_selection(tmp_path: Path):
+    """Box selection (memory-mapped for regular files) works for compressed files too."""
+    path = shieldhit_dir / "diff_scoring" / "fluence_2d_lin.bdo"
+    selection = PageSelection(box=(slice(None), slice(None), slice(None), slice(2, 5)))
+    regular = fromfile(str(path), selection=selection)
+    assert_same_estimators(fromfile(_compress(path, tmp_path, '.xz'), selection=selection), regular)
+
+
+def test_compressed_fluka_file(tmp_path: Path, fluka_usrbin_path: Path):
+    """Compressed FLUKA binary files are read by the FLUKA reader."""
+    compressed_path = _compress(fluka_usrbin_path, tmp_path, '.gz')
+    regular = fromfile(str(fluka_usrbin_path))
+
+    assert_same_estimators(fromfile(compressed_path), regular)
+    assert guess_corename(compressed_path) == guess_corename(str(fluka_usrbin_path))
+
+
+def test_aggregation_of_compressed_files(tmp_path: Path):
+    """Aggregation runs directly on compressed files, results are the same as for uncompressed ones."""
+    file_list = sorted((shieldhit_dir / "averaging").glob("normalisation-3_aggregation-mean_000?.bdo"))
+    compressed_list = [_compress(path, tmp_path, '.gz') for path in file_list]
+
+    regular = fromfilelist([str(path) for path in file_list])
+    aggregated = fromfilelist(compressed_list)
+
+    assert aggregated.file_corename == regular.file_corename
+    for regular_page, page in zip(regular.pages, aggregated.pages):
+        np.testing.assert_allclose(page.data_raw, regular_page.data_raw)
+        np.testing.assert_allclose(page.error_raw, regular_page.error_raw)
+
+
+@pytest.mark.smoke
+def test_read_array_in_chunks(monkeypatch):
+    """Streams are read in bounded chunks directly into the array, short reads end the array."""
+    monkeypatch.setattr(compressed, "_chunk_size", 10)
+    values = np.arange(100, dtype='<f8')
+    stream = io.BytesIO(gzip.compress(values.tobytes()))
+
+    with gzip.open(stream, 'rb') as f:
+        f.seek(8)
+        head = compressed.read_array(f, '<f8', 10)
+        tail = compressed.read_array(f, '<f8', 1000)
+
+    np.testing.assert_array_equal(head, values[1:11])
+    np.testing.assert_array_equal(tail, values[11:])
+    assert head.flags.writeable
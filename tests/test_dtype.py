@@ -0,0 +1,98 @@
+"""Tests for storing page data in reduced precision (`dtype` option of the readers)."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.averaging import SumAggregator, WeightedStatsAggregator
+from pymchelper.input_output import fromfile, fromfilelist
+
+# relative precision of float32 data, as compared to float64 data (2**-24 rounding of each value)
+float32_rtol = 1e-7
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("read_options", [{}, {'mmap': True}, {'lazy': True}])
+def test_fromfile_float32(averaging_dir: Path, read_options: dict):
+    """Single precision data differs from double precision only by rounding, and takes half of the memory."""
+    path = averaging_dir / "normalisation-5_aggregation-mean_0001.bdo"
+    regular = fromfile(str(path))
+    estimator = fromfile(str(path), dtype=np.float32, **read_options)
+
+    for page, regular_page in zip(estimator.pages, regular.pages):
+        assert page.data_raw.dtype == np.float32
+        assert page.data_raw.nbytes * 2 == regular_page.data_raw.nbytes
+        np.testing.assert_allclose(page.data_raw, regular_page.data_raw, rtol=float32_rtol)
+
+
+@pytest.mark.parametrize("aggregation, nan", [("mean", False), ("mean", True), ("sum", False), ("sum", True),
+                                              ("concat", False)])
+def test_fromfilelist_float32(averaging_files, aggregation: str, nan: bool):
+    """Data aggregated in double precision and saved as float32 matches the double precision results."""
+    file_list = averaging_files(f"normalisation-*_aggregation-{aggregation}_000?.bdo")
+    regular = fromfilelist(file_list, nan=nan)
+    estimator = fromfilelist(file_list, nan=nan, dtype=np.float32)
+
+    for page, regular_page in zip(estimator.pages, regular.pages):
+        assert page.data_raw.dtype == np.float32
+        # values below the float32 range (~1e-38) are flushed to zero
+        np.testing.assert_allclose(page.data_raw, regular_page.data_raw, rtol=float32_rtol, atol=1e-38)
+        if regular_page.error_raw is not None:
+            assert page.error_raw.dtype == np.float32
+            # spread is calculated from values rounded to single precision, its relative error is larger
+            np.testing.assert_allclose(page.error_raw, regular_page.error_raw, rtol=1e-4, atol=1e-30)
+
+
+def test_float64_accumulation():
+    """Aggregators accumulate single precision arrays in double precision."""
+    values = np.full(3, 0.1, dtype=np.float32)
+    weighted = WeightedStatsAggregator()
+    summed = SumAggregator()
+    for _ in range(10_000):
+        weighted.update(values, weight=1)
+        summed.update(values)
+
+    assert weighted.data.dtype == weighted.error(error_type='stddev').dtype == summed.data.dtype == np.float64
+    np.testing.assert_allclose(summed.data, 10_000 * np.float64(values[0]), rtol=1e-12)
+    np.testing.assert_allclose(weighted.mean, np.float64(values[0]), rtol=1e-12)
+    assert values.dtype == np.float32 and values[0] == np.float32(0.1)  # input is not modified
+
+
+def test_convertmc_float32(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Converters save single precision data with `--dtype float32`, output files are smaller."""
+    from pymchelper.run import main
+    path = (Path("tests") / "res" / "shieldhit" / "single" / "ex_yzmsh.bdo").resolve()
+    monkeypatch.chdir(tmp_path)
+
+    for converter, suffix in (('sparse', '.npz'), ('json', '.json')):
+        main([converter, str(path), 'float64' + suffix])
+        main([converter, '--dtype', 'float32', str(path), 'float32' + suffix])
+        assert (tmp_path / ('float32' + suffix)).stat().st_size < (tmp_path / ('float64' + suffix)).stat().st_size
+
+    regular, reduced = np.load('float64.npz'), np.load('float32.npz')
+    assert reduced['data'].dtype == np.float32
+    np.testing.assert_allclose(reduced['data'], regular['data'], rtol=float32_rtol)
+
+    # JSON holds the shortest decimal representation of float32 values
+    values = json.loads((tmp_path / 'float32.json').read_text())['pages'][0]['data']['values']
+    np.testing.assert_array_equal(np.array(values, dtype=np.float32),
+                                  fromfile(str(path), dtype=np.float32).pages[0].data_raw)
+
+
+def test_json_values_float32(monkeypatch: pytest.MonkeyPatch):
+    """JSON writer converts float32 pages block by block to the shortest decimals, other dtypes are unchanged."""
+    from pymchelper.writers import json as json_writer
+    monkeypatch.setattr(json_writer, "_block_size", 3)
+
+    data = np.array([0.1, 1.0 / 3, 2.5e-39, -7.0, 1e30, 0.2, 123.456], dtype=np.float32)
+    values = json_writer._values(data)
+    assert values == [0.1, 0.33333334, 2.5e-39, -7.0, 1e30, 0.2, 123.456]
+    assert all(type(value) is float for value in values)
+    np.testing.assert_array_equal(np.array(values, dtype=np.float32), data)
+    assert data.dtype == np.float32  # input is not modified
+
+    assert json_writer._values(data.reshape(7, 1)) == [[value] for value in values]
+    assert json_writer._values(data[1]) == 0.33333334
+    assert json_writer._values(data.astype(np.float64)) == data.astype(np.float64).tolist()
@@ -0,0 +1,109 @@
+"""Tests for incremental reading of BDO files which are still being written."""
+
+import logging
+from pathlib import Path
+
+import pytest
+
+from pymchelper.estimator import Estimator
+from pymchelper.input_output import follow, fromfile
+from pymchelper.readers.shieldhit import reader_bdo2019
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.reader_bdo2019 import SHFollowerBDO2019
+from pymchelper.readers.shieldhit.reader_base import iter_bdo_tokens
+from tests.conftest import assert_same_estimators
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+multipage_path = shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo"
+
+
+def _read(reader: SHFollowerBDO2019) -> Estimator:
+    estimator = Estimator()
+    reader.read(estimator)
+    return estimator
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("mmap, lazy", [(False, False), (True, False), (False, True)])
+@pytest.mark.parametrize("path", [multipage_path, shieldhit_dir / "diff_scoring" / "fluence_2d_lin.bdo"])
+def test_follow_growing_file(tmp_path: Path, monkeypatch, path: Path, mmap: bool, lazy: bool):
+    """File written in small chunks (cut also inside tokens) is read incrementally, each token exactly once."""
+    data = path.read_bytes()
+    regular = fromfile(str(path))
+    data_block_ends = [token.offset + token.payload.nbytes for token in iter_bdo_tokens(str(path), decode=False)
+                       if token.tag_id == SHBDOTagID.data_block]
+
+    processed = []
+    process_token = reader_bdo2019._process_token
+
+    def counting_process_token(estimator, token):
+        processed.append(token.offset)
+        process_token(estimator, token)
+
+    monkeypatch.setattr(reader_bdo2019, "_process_token", counting_process_token)
+
+    growing_path = tmp_path / path.name
+    reader = SHFollowerBDO2019(str(growing_path), mmap=mmap, lazy=lazy)
+    assert not reader.poll()  # file does not exist yet
+    for size in range(0, len(data) + 1, 37):
+        growing_path.write_bytes(data[:size])
+        expected_pages = sum(end <= size for end in data_block_ends)
+        pages_before = reader.complete_pages
+        assert reader.poll() == (expected_pages > pages_before)
+        assert reader.complete_pages == expected_pages
+
+    growing_path.write_bytes(data)
+    for _ in range(2):  # data kept by the reader is not normalised again
+        assert_same_estimators(_read(reader), regular)
+    assert sorted(processed) == sorted(set(processed))
+    assert len(processed) == len(list(iter_bdo_tokens(str(path), decode=False)))
+
+
+def test_partial_pages(tmp_path: Path):
+    """Only complete pages are read, the page being written is left out."""
+    data = multipage_path.read_bytes()
+    regular = fromfile(str(multipage_path))
+    regular.pages = regular.pages[:1]  # only the first page is complete
+    second_page_end = max(token.offset + token.payload.nbytes
+                          for token in iter_bdo_tokens(str(multipage_path), decode=False)
+                          if token.tag_id == SHBDOTagID.data_block)
+
+    growing_path = tmp_path / multipage_path.name
+    growing_path.write_bytes(data[:second_page_end - 1])
+    reader = SHFollowerBDO2019(str(growing_path))
+    assert_same_estimators(_read(reader), regular)
+
+
+def test_rewritten_file(tmp_path: Path):
+    """File rewritten from scratch (as by periodic dumps of a running simulation) is read from the beginning."""
+    path = tmp_path / "dose.bdo"
+    path.write_bytes(multipage_path.read_bytes())
+    reader = SHFollowerBDO2019(str(path))
+    assert reader.poll()
+
+    other_path = shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0002.bdo"
+    path.write_bytes(other_path.read_bytes())
+    assert_same_estimators(_read(reader), fromfile(str(other_path)))
+
+
+def test_follow_generator(tmp_path: Path):
+    """Estimators are yielded when new pages are complete, iteration ends after the timeout."""
+    path = tmp_path / multipage_path.name
+    path.write_bytes(multipage_path.read_bytes())
+
+    estimators = list(follow(str(path), interval=0.01, timeout=0.05))
+
+    assert len(estimators) == 1
+    assert_same_estimators(estimators[0], fromfile(str(multipage_path)))
+
+
+def test_truncated_file_warning(tmp_path: Path, caplog):
+    """Regular read of a truncated file reports the incomplete token."""
+    path = tmp_path / multipage_path.name
+    path.write_bytes(multipage_path.read_bytes()[:-10])
+
+    with caplog.at_level(logging.WARNING):
+        estimator = fromfile(str(path))
+
+    assert "Incomplete token" in caplog.text
+    assert len(estimator.pages) == 2
@@ -0,0 +1,95 @@
+"""Tests for reading many BDO files with identical structure using the layout of the first one."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers import sniffer
+from pymchelper.readers.shieldhit import layout
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.shieldhit.detector.detector_type import SHDetType
+from tests.conftest import assert_same_estimators
+
+# estimator attributes set from the layout, compared in addition to the data
+_layout_attributes = ('file_counter', 'file_format', 'geotyp', 'filedate')
+
+
+@pytest.fixture
+def count_sniffs(monkeypatch):
+    """List of sources whose type was recognized by reading their first bytes."""
+    sniffed = []
+    sniff = sniffer._sniff
+
+    def counting_sniff(source):
+        sniffed.append(source)
+        return sniff(source)
+
+    monkeypatch.setattr(sniffer, "_sniff", counting_sniff)
+    sniffer.clear_cache()
+    yield sniffed
+    sniffer.clear_cache()
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("aggregation", ["none", "sum", "mean", "concat"])
+def test_same_as_full_parser(averaging_files, aggregation: str):
+    """Averaged results are the same as with the full parsing of each file."""
+    file_list = averaging_files(f"normalisation-*_aggregation-{aggregation}_*.bdo")
+    assert_same_estimators(fromfilelist(file_list, reuse_layout=True), fromfilelist(file_list), _layout_attributes)
+
+
+def test_read_with_layout(count_sniffs, averaging_files):
+    """Files with the same structure are read without recognition of their format, metadata is taken from each."""
+    file_list = averaging_files("normalisation-3_aggregation-mean_*.bdo")
+    reader = layout.LayoutReader()
+    estimators = [reader.read(path) for path in file_list]
+    assert count_sniffs == [file_list[0]]
+    for path, estimator in zip(file_list, estimators):
+        estimator.file_counter = 1
+        assert_same_estimators(estimator, fromfile(path), _layout_attributes)
+
+    # files of other estimator (other scorers, the same size) do not match
+    assert all(reader.read(path) is None for path in averaging_files("normalisation-5_aggregation-mean_*.bdo"))
+
+
+def test_structure_mismatch(tmp_path: Path, averaging_files):
+    """Files with other size or other metadata are not read using the layout."""
+    first_path, second_path = averaging_files("normalisation-3_aggregation-mean_*.bdo")[:2]
+    reader = layout.LayoutReader()
+    assert reader.read(first_path) is not None
+
+    data = bytearray(Path(second_path).read_bytes())
+    assert reader.read(data) is not None
+    assert reader.read(data[:-8]) is None
+    beam_energy = data.index(b'MeV')  # part of page and beam metadata strings
+    data[beam_energy] = ord('G')
+    assert reader.read(data) is None
+
+    # fromfilelist falls back to the full parser
+    other_path = tmp_path / "other_0002.bdo"
+    other_path.write_bytes(data)
+    regular = fromfilelist([first_path, str(other_path)])
+    assert_same_estimators(fromfilelist([first_path, str(other_path)], reuse_layout=True), regular,
+                           _layout_attributes)
+
+
+def test_not_bdo2019():
+    """Layout is not recorded for other file formats, files are read by the regular readers."""
+    bdo2016_list = [str(path) for path in sorted((Path("tests") / "res" / "shieldhit" / "generated" / "many" /
+                                                  "msh").glob("aen_x_al0*.bdo"))]
+    reader = layout.LayoutReader()
+    assert reader.read(bdo2016_list[0]) is None and reader.layout is None
+    assert_same_estimators(fromfilelist(bdo2016_list, reuse_layout=True, workers=2), fromfilelist(bdo2016_list),
+                           _layout_attributes)
+
+
+def test_selection_and_dtype(averaging_files):
+    """Page selection and dtype are applied to the files read using the layout."""
+    file_list = averaging_files("normalisation-3_aggregation-mean_*.bdo")
+    selection = PageSelection(dettyp={SHDetType.tlet}, box=(slice(0, 1), ))
+    regular = fromfilelist(file_list, selection=selection, dtype=np.float32, workers=3)
+    estimator = fromfilelist(file_list, selection=selection, dtype=np.float32, reuse_layout=True, workers=3)
+    assert estimator.pages and estimator.pages[0].data_raw.dtype == np.float32
+    assert_same_estimators(estimator, regular, _layout_attributes)
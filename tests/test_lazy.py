@@ -0,0 +1,58 @@
+"""Tests for lazy (metadata-only) reading of MC output files."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+
+
+def _assert_lazy_equals_regular(path: Path) -> None:
+    """Compare lazily read estimator with the regular one."""
+    regular = fromfile(str(path))
+    lazy = fromfile(str(path), lazy=True)
+
+    assert lazy.number_of_primaries == regular.number_of_primaries
+    assert (lazy.x, lazy.y, lazy.z) == (regular.x, regular.y, regular.z)
+    assert len(lazy.pages) == len(regular.pages)
+    for regular_page, lazy_page in zip(regular.pages, lazy.pages):
+        assert lazy_page.dettyp == regular_page.dettyp
+        assert lazy_page.unit == regular_page.unit
+        np.testing.assert_array_equal(lazy_page.data_raw, regular_page.data_raw)
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("path", [
+    shieldhit_dir / "averaging" / "normalisation-4_aggregation-concat_0001.bdo",
+    shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo",
+    shieldhit_dir / "diff_scoring" / "fluence_2d_log.bdo",
+    shieldhit_dir / "single" / "ex_yzmsh.bdo",
+])
+def test_lazy_read_equals_regular_read(path: Path):
+    """Lazily loaded SHIELD-HIT12A data (including normalisation) should be identical to the regular read."""
+    _assert_lazy_equals_regular(path)
+
+
+@pytest.mark.smoke
+def test_lazy_read_fluka(fluka_usrbin_path: Path):
+    """Lazily loaded FLUKA USRBIN data should be identical to the regular read."""
+    _assert_lazy_equals_regular(fluka_usrbin_path)
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("path", [
+    shieldhit_dir / "diff_scoring" / "fluence_2d_log.bdo",
+    shieldhit_dir / "single" / "ex_yzmsh.bdo",
+])
+def test_lazy_read_defers_data(path: Path):
+    """Page data of lazy estimators is not read until it is accessed."""
+    estimator = fromfile(str(path), lazy=True)
+    page = estimator.pages[0]
+
+    assert not page.data_loaded
+    assert page.dimension > 0
+    assert page.data.size == estimator.x.n * estimator.y.n * estimator.z.n * page.diff_axis1.n * page.diff_axis2.n
+    assert page.data_loaded
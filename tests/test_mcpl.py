@@ -138,3 +138,33 @@ def test_concatenation_of_bdo_files(phasespace_bdo_files_path: Generator[Path, N
     assert sum(data.pages[2].data.shape[1] for data in file_data.values()) == 15
     concatenated_page = np.concatenate([data.pages[0].data_raw for data in file_data.values()])
     assert np.isclose(concatenated_page, estimator_data.pages[0].data_raw).all()
+
+
+def test_spilled_concatenation(phasespace_bdo_files_path: Generator[Path, None, None], tmp_path: Path):
+    """Concatenated data spilled to temporary files is the same as collected in memory, files are removed."""
+    list_of_input_files = sorted(str(path) for path in phasespace_bdo_files_path)
+    in_memory = fromfilelist(list_of_input_files, nan=False)
+    spilled = fromfilelist(list_of_input_files, nan=False, spill_dir=str(tmp_path))
+
+    for page, expected_page in zip(spilled.pages, in_memory.pages):
+        assert isinstance(page.data_raw, np.memmap)
+        np.testing.assert_array_equal(page.data, expected_page.data)
+    # spill files are anonymous, nothing is left in the directory
+    assert not list(tmp_path.iterdir())
+
+
+def test_mcpl_written_in_chunks(phasespace_bdo_files_path: Generator[Path, None, None], tmp_path: Path,
+                                monkeypatch: pytest.MonkeyPatch):
+    """MCPL file written in small chunks of particles is identical to the one written at once."""
+    from pymchelper.run import main
+    from pymchelper.writers.mcpl import MCPLWriter
+    pattern = str(next(phasespace_bdo_files_path).parent / "NB_mcpl_000*.bdo")
+
+    main(['mcpl', '--many', pattern, str(tmp_path / "at_once")])
+    monkeypatch.setattr(MCPLWriter, "particles_per_chunk", 7)
+    main(['mcpl', '--many', '--spill-dir', str(tmp_path), pattern, str(tmp_path / "in_chunks")])
+
+    for page_no in range(1, 4):
+        at_once = tmp_path / "at_once" / f"NB_mcpl_p{page_no}.mcpl"
+        assert (tmp_path / "in_chunks" / at_once.name).read_bytes() == at_once.read_bytes()
+        assert mcpl.MCPLFile(at_once).nparticles > 7
@@ -0,0 +1,61 @@
+"""Tests for the memory-mapped (mmap) data path of SHIELD-HIT12A readers."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile, fromfilelist
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("path", [
+    shieldhit_dir / "averaging" / "normalisation-1_aggregation-none_0001.bdo",
+    shieldhit_dir / "averaging" / "normalisation-3_aggregation-mean_0001.bdo",
+    shieldhit_dir / "averaging" / "normalisation-4_aggregation-concat_0001.bdo",
+    shieldhit_dir / "diff_scoring" / "fluence_2d_log.bdo",
+    shieldhit_dir / "single" / "ex_yzmsh.bdo",
+])
+def test_mmap_read_equals_regular_read(path: Path):
+    """Data read with mmap should be identical to the data read into memory."""
+    regular = fromfile(str(path))
+    mapped = fromfile(str(path), mmap=True)
+
+    assert len(regular.pages) == len(mapped.pages)
+    for regular_page, mapped_page in zip(regular.pages, mapped.pages):
+        np.testing.assert_array_equal(regular_page.data_raw, mapped_page.data_raw)
+        assert regular_page.unit == mapped_page.unit
+
+
+@pytest.mark.smoke
+def test_mmap_pages_are_read_only_views():
+    """Pages which are not normalised should keep the read-only memory-mapped view of the file."""
+    estimator = fromfile(str(shieldhit_dir / "averaging" / "normalisation-4_aggregation-concat_0001.bdo"), mmap=True)
+    page = estimator.pages[0]
+
+    assert not page.data_raw.flags.owndata
+    assert not page.data_raw.flags.writeable
+
+
+@pytest.mark.smoke
+def test_mmap_normalised_pages_are_copied():
+    """Pages which need normalisation are copied to memory before being modified."""
+    estimator = fromfile(str(shieldhit_dir / "single" / "ex_yzmsh.bdo"), mmap=True)
+    page = estimator.pages[0]
+
+    assert page.data_raw.flags.writeable
+    assert page.data_raw.flags.owndata
+
+
+@pytest.mark.parametrize("output_type", ["normalisation-2_aggregation-sum", "normalisation-3_aggregation-mean"])
+def test_mmap_fromfilelist_equals_regular(output_type: str):
+    """Aggregated results should not depend on the mmap option."""
+    file_list = sorted(str(path) for path in (shieldhit_dir / "averaging").glob(f"{output_type}_000?.bdo"))
+
+    regular = fromfilelist(file_list)
+    mapped = fromfilelist(file_list, mmap=True)
+
+    for regular_page, mapped_page in zip(regular.pages, mapped.pages):
+        np.testing.assert_allclose(regular_page.data_raw, mapped_page.data_raw)
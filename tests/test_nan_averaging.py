@@ -0,0 +1,147 @@
+"""Tests for the streaming NaN-aware averaging (`fromfilelist` with `nan=True`)."""
+
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper import averaging
+from pymchelper.averaging import NanWeightedStatsAggregator
+from pymchelper.estimator import ErrorEstimate, average_with_nan
+from pymchelper.input_output import fromfile, fromfilelist, mergetodir
+from pymchelper.writers.shieldhit import SHBinaryWriter
+
+
+def _values_with_nan(number_of_values: int, shape: tuple) -> list:
+    """Random arrays with some NaN values, the first bin is NaN in all arrays, the second valid in one only."""
+    rng = np.random.default_rng(7)
+    values = []
+    for value_no in range(number_of_values):
+        value = rng.random(shape)
+        value[rng.random(shape) < 0.3] = np.nan
+        value.reshape(-1)[0] = np.nan
+        value.reshape(-1)[1] = 0.5 if value_no == 0 else np.nan
+        values.append(value)
+    return values
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("block_size", [3, averaging._block_size])
+def test_aggregator(monkeypatch, block_size: int):
+    """Mean and errors are the same as calculated by numpy NaN-aware functions."""
+    monkeypatch.setattr(averaging, "_block_size", block_size)
+    values = _values_with_nan(5, (4, 7))
+    aggregator = NanWeightedStatsAggregator()
+    for value in values:
+        aggregator.update(value)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN bins
+        expected_mean = np.nanmean(values, axis=0)
+        expected_stddev = np.nanstd(values, axis=0, ddof=1)
+    np.testing.assert_allclose(aggregator.mean, expected_mean, rtol=1e-12)
+    np.testing.assert_allclose(aggregator.error(error_type='stddev'), expected_stddev, rtol=1e-10)
+    np.testing.assert_allclose(aggregator.error(error_type='stderr'), expected_stddev / np.sqrt(len(values)),
+                               rtol=1e-10)
+    assert np.isnan(aggregator.mean.reshape(-1)[0]) and aggregator.mean.reshape(-1)[1] == 0.5
+
+
+@pytest.mark.parametrize("split", [1, 2, 4])
+def test_merge(split: int):
+    """Merged partial aggregations give the same mean and variance as the aggregation of all values."""
+    values = _values_with_nan(5, (30, ))
+    whole, first, second = NanWeightedStatsAggregator(), NanWeightedStatsAggregator(), NanWeightedStatsAggregator()
+    for value_no, (value, weight) in enumerate(zip(values, (1., 3., 2., 5., 4.))):
+        whole.update(value, weight=weight)
+        (first if value_no < split else second).update(value, weight=weight)
+    first.merge(second)
+    np.testing.assert_allclose(first.mean, whole.mean, rtol=1e-12)
+    np.testing.assert_allclose(first.variance_sample, whole.variance_sample, rtol=1e-10)
+    assert first.total_weight == whole.total_weight
+
+
+def test_out_of_core(tmp_path: Path, monkeypatch):
+    """Disk-backed accumulators give identical results as the ones in memory."""
+    monkeypatch.setattr(averaging, "_block_size", 5)
+    values = _values_with_nan(4, (3, 8))
+    in_memory, out_of_core = NanWeightedStatsAggregator(), NanWeightedStatsAggregator(spill_dir=str(tmp_path))
+    for value in values:
+        in_memory.update(value)
+        out_of_core.update(value)
+    assert isinstance(out_of_core.data, np.memmap)
+    assert out_of_core.data.tobytes() == in_memory.data.tobytes()
+    for error_type in ('stddev', 'stderr'):
+        error = out_of_core.error(error_type=error_type)
+        assert isinstance(error, np.memmap)
+        np.testing.assert_array_equal(error, in_memory.error(error_type=error_type))
+
+
+@pytest.fixture
+def files_with_nan(tmp_path: Path, averaging_files) -> list:
+    """Copies of averaging test files, with NaN values in some of the bins."""
+    file_list = averaging_files("normalisation-3_aggregation-mean_*.bdo")
+    rng = np.random.default_rng(11)
+    paths = []
+    for file_no, path in enumerate(file_list):
+        estimator = fromfile(path)
+        for page in estimator.pages:
+            data = np.array(page.data_raw, dtype=np.float64)
+            data[rng.random(data.shape) < 0.2] = np.nan
+            page.data_raw = data
+        output_path = tmp_path / f"dose_{file_no + 1:04d}"
+        assert SHBinaryWriter(str(output_path), None).write(estimator) == 0
+        paths.append(str(output_path) + ".bdo")
+    return paths
+
+
+@pytest.mark.parametrize("error", list(ErrorEstimate))
+@pytest.mark.parametrize("options", [{}, {'workers': 3}, {'processes': 2}])
+def test_fromfilelist(files_with_nan: list, error: ErrorEstimate, options: dict):
+    """Streaming NaN-aware averaging gives the same result as `average_with_nan`."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN bins
+        expected = average_with_nan([fromfile(path) for path in files_with_nan], error)
+    result = fromfilelist(files_with_nan, error=error, nan=True, **options)
+
+    assert result.number_of_primaries == expected.number_of_primaries
+    assert result.file_counter == expected.file_counter
+    for page, expected_page in zip(result.pages, expected.pages):
+        np.testing.assert_allclose(page.data_raw, expected_page.data_raw, rtol=1e-12)
+        if expected_page.error_raw is None:
+            assert page.error_raw is None
+        else:
+            np.testing.assert_allclose(page.error_raw, expected_page.error_raw, rtol=1e-10)
+
+
+def test_single_file(files_with_nan: list):
+    """Single file is not averaged, no error is estimated."""
+    result = fromfilelist(files_with_nan[:1], nan=True)
+    expected = fromfile(files_with_nan[0])
+    np.testing.assert_array_equal(result.pages[0].data_raw, expected.pages[0].data_raw)
+    assert result.pages[0].error_raw is None
+
+
+@pytest.mark.parametrize("error", [ErrorEstimate.stddev, ErrorEstimate.stderr])
+def test_partial_aggregates(files_with_nan: list, tmp_path: Path, error: ErrorEstimate):
+    """Partial aggregates saved with NaN values excluded are merged to the result of all the files."""
+    for node_no, start in enumerate(range(0, len(files_with_nan), 3)):
+        assert mergetodir(files_with_nan[start:start + 3], str(tmp_path / f"node_{node_no}"), nan=True) == 0
+    partials = sorted(str(path) for path in tmp_path.glob("node_*/dose.agg.npz"))
+    assert mergetodir(partials, str(tmp_path / "final"), nan=True) == 0
+    final = str(tmp_path / "final" / "dose.agg.npz")
+
+    expected = fromfilelist(files_with_nan, error=error, nan=True)
+    # type of the aggregators is kept in the partial aggregates, also mixed with the outputs
+    for result in (fromfilelist([final], error=error), fromfilelist([final], error=error, nan=True),
+                   fromfilelist(partials[:1] + files_with_nan[3:], error=error, nan=True)):
+        assert result.file_counter == expected.file_counter
+        assert result.number_of_primaries == expected.number_of_primaries
+        for page, expected_page in zip(result.pages, expected.pages):
+            np.testing.assert_allclose(page.data_raw, expected_page.data_raw, rtol=1e-12)
+            np.testing.assert_allclose(page.error_raw, expected_page.error_raw, rtol=1e-10)
+
+    # aggregations with and without NaN values excluded are not merged
+    assert mergetodir(files_with_nan, str(tmp_path / "final")) == 1
+    with pytest.raises(ValueError):
+        fromfilelist([final] + files_with_nan)
@@ -0,0 +1,83 @@
+"""Tests for out-of-core aggregation, with aggregator state kept in disk-backed arrays."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper import averaging
+from pymchelper.averaging import SumAggregator, WeightedStatsAggregator
+from pymchelper.estimator import ErrorEstimate
+from pymchelper.input_output import fromfile, fromfilelist
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    """Arrays of the small test files are processed in many blocks."""
+    monkeypatch.setattr(averaging, "_block_size", 3)
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("error_type", ["stddev", "stderr"])
+def test_aggregators(tmp_path: Path, small_blocks, error_type: str):
+    """Disk-backed accumulators give identical results as the ones in memory."""
+    rng = np.random.default_rng(3)
+    in_memory, out_of_core = WeightedStatsAggregator(), WeightedStatsAggregator(spill_dir=str(tmp_path))
+    sum_in_memory, sum_out_of_core = SumAggregator(), SumAggregator(spill_dir=str(tmp_path))
+    for weight in (10, 200, 3000):
+        value = rng.random((4, 5)).astype(np.float32)
+        for aggregator in (in_memory, out_of_core, sum_in_memory, sum_out_of_core):
+            aggregator.update(value, weight=weight)
+
+    assert isinstance(out_of_core.data, np.memmap) and isinstance(out_of_core._accumulator_S, np.memmap)
+    assert out_of_core.data.dtype == np.float64
+    assert out_of_core.data.tobytes() == in_memory.data.tobytes()
+    error = out_of_core.error(error_type=error_type)
+    assert isinstance(error, np.memmap)
+    assert error.tobytes() == in_memory.error(error_type=error_type).tobytes()
+    assert out_of_core.error(error_type='none') is None
+
+    assert isinstance(sum_out_of_core.data, np.memmap)
+    assert sum_out_of_core.data.tobytes() == sum_in_memory.data.tobytes()
+    # temporary files are anonymous, nothing is left in the directory
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("output_type", [
+    "normalisation-1_aggregation-none",
+    "normalisation-2_aggregation-sum",
+    "normalisation-3_aggregation-mean",
+    "normalisation-4_aggregation-concat",
+    "normalisation-5_aggregation-mean",
+])
+def test_fromfilelist(tmp_path: Path, small_blocks, averaging_files, output_type: str):
+    """Out-of-core aggregation of files gives identical data and errors, returned as memory-mapped pages."""
+    file_list = averaging_files(f"{output_type}_*.bdo")
+    in_memory = fromfilelist(file_list, error=ErrorEstimate.stddev)
+    out_of_core = fromfilelist(file_list, error=ErrorEstimate.stddev, spill_dir=str(tmp_path))
+
+    assert out_of_core.number_of_primaries == in_memory.number_of_primaries
+    for page, expected_page in zip(out_of_core.pages, in_memory.pages):
+        np.testing.assert_array_equal(page.data_raw, expected_page.data_raw)
+        if expected_page.error_raw is None:
+            assert page.error_raw is None
+        else:
+            assert isinstance(page.data_raw, np.memmap) and isinstance(page.error_raw, np.memmap)
+            np.testing.assert_array_equal(page.error_raw, expected_page.error_raw)
+    assert not list(tmp_path.iterdir())
+
+
+def test_convertmc_spill_dir(tmp_path: Path, averaging_dir: Path):
+    """Result of out-of-core aggregation is written by `convertmc` as the one aggregated in memory."""
+    from pymchelper.run import main
+    pattern = str(averaging_dir / "normalisation-5_aggregation-mean_*.bdo")
+    spill_dir = tmp_path / "scratch"
+    spill_dir.mkdir()
+    assert main(['bdo', '--many', '--spill-dir', str(spill_dir), pattern, str(tmp_path / "out_of_core")]) == 0
+    assert main(['bdo', '--many', pattern, str(tmp_path / "in_memory")]) == 0
+    name = "normalisation-5_aggregation-mean.bdo"
+    out_of_core = fromfile(str(tmp_path / "out_of_core" / name))
+    in_memory = fromfile(str(tmp_path / "in_memory" / name))
+    for page, expected_page in zip(out_of_core.pages, in_memory.pages):
+        np.testing.assert_array_equal(page.data_raw, expected_page.data_raw)
+        np.testing.assert_array_equal(page.error_raw, expected_page.error_raw)
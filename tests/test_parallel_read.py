@@ -0,0 +1,106 @@
+"""Tests for reading input files using a pool of threads."""
+
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper import input_output
+from pymchelper.estimator import ErrorEstimate
+from pymchelper.input_output import fromfile, fromfilelist, frompattern
+
+
+@pytest.mark.parametrize("output_type, nan", [
+    ("normalisation-1_aggregation-none", False),
+    ("normalisation-2_aggregation-sum", False),
+    ("normalisation-3_aggregation-mean", False),
+    ("normalisation-4_aggregation-concat", False),
+    ("normalisation-5_aggregation-mean", False),
+    ("normalisation-3_aggregation-mean", True),
+    ("normalisation-5_aggregation-mean", True),
+])
+def test_parallel_read_equals_sequential(averaging_files, output_type: str, nan: bool):
+    """Aggregated data (also order dependent, as concatenation) should not depend on the number of workers."""
+    file_list = averaging_files(f"{output_type}_*.bdo")
+
+    sequential = fromfilelist(file_list, nan=nan)
+    parallel = fromfilelist(file_list, nan=nan, workers=4)
+
+    assert parallel.number_of_primaries == sequential.number_of_primaries
+    for sequential_page, parallel_page in zip(sequential.pages, parallel.pages):
+        np.testing.assert_array_equal(parallel_page.data_raw, sequential_page.data_raw)
+        if sequential_page.error_raw is not None:
+            np.testing.assert_array_equal(parallel_page.error_raw, sequential_page.error_raw)
+
+
+def test_parallel_frompattern(averaging_dir: Path):
+    """Each group of files matching the pattern is read in parallel."""
+    pattern = str(averaging_dir / "normalisation-*_aggregation-mean_000?.bdo")
+    sequential = frompattern(pattern)
+    parallel = frompattern(pattern, workers=3)
+
+    assert len(parallel) == len(sequential) == 2
+    for sequential_estimator, parallel_estimator in zip(sequential, parallel):
+        for sequential_page, parallel_page in zip(sequential_estimator.pages, parallel_estimator.pages):
+            np.testing.assert_array_equal(parallel_page.data_raw, sequential_page.data_raw)
+
+
+@pytest.mark.parametrize("output_type", [
+    "normalisation-1_aggregation-none",
+    "normalisation-2_aggregation-sum",
+    "normalisation-3_aggregation-mean",
+    "normalisation-4_aggregation-concat",
+    "normalisation-5_aggregation-mean",
+])
+@pytest.mark.parametrize("processes", [2, 3])
+def test_process_pool_equals_sequential(averaging_files, output_type: str, processes: int):
+    """Partial aggregations of parts of the list, merged in order, should give the sequential result."""
+    file_list = averaging_files(f"{output_type}_*.bdo")
+
+    sequential = fromfilelist(file_list, error=ErrorEstimate.stddev)
+    merged = fromfilelist(file_list, error=ErrorEstimate.stddev, processes=processes, reuse_layout=True)
+
+    assert merged.number_of_primaries == sequential.number_of_primaries
+    assert merged.file_counter == sequential.file_counter
+    for sequential_page, merged_page in zip(sequential.pages, merged.pages):
+        np.testing.assert_allclose(merged_page.data_raw, sequential_page.data_raw, rtol=1e-12)
+        if sequential_page.error_raw is None:
+            assert merged_page.error_raw is None
+        else:
+            np.testing.assert_allclose(merged_page.error_raw, sequential_page.error_raw, rtol=1e-9, atol=1e-300)
+
+
+def test_convertmc_processes(tmp_path: Path, averaging_dir: Path, averaging_files):
+    """`convertmc --processes` aggregates the files using a pool of processes."""
+    from pymchelper.run import main
+    pattern = str(averaging_dir / "normalisation-5_aggregation-mean_*.bdo")
+    assert main(['bdo', '--many', '--processes', '2', pattern, str(tmp_path)]) == 0
+    file_list = averaging_files("normalisation-5_aggregation-mean_*.bdo")
+    converted = fromfile(str(tmp_path / "normalisation-5_aggregation-mean.bdo"))
+    for page, expected_page in zip(converted.pages, fromfilelist(file_list).pages):
+        np.testing.assert_allclose(page.data_raw, expected_page.data_raw, rtol=1e-12)
+
+
+@pytest.mark.smoke
+def test_read_ahead_is_bounded(monkeypatch):
+    """Files are yielded in order and no more than `workers` estimators are kept in memory at once."""
+    workers = 3
+    lock = threading.Lock()
+    started = []
+
+    def fake_fromfile(filename, **read_options):
+        with lock:
+            started.append(filename)
+        return filename
+
+    monkeypatch.setattr(input_output, "fromfile", fake_fromfile)
+    filenames = [f"file_{i:02d}.bdo" for i in range(20)]
+
+    consumed = []
+    for estimator in input_output._read_files(filenames, workers=workers):
+        consumed.append(estimator)
+        with lock:
+            assert len(started) - len(consumed) < workers
+
+    assert consumed == filenames
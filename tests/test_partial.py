@@ -0,0 +1,143 @@
+"""Tests for persisted partial aggregates and hierarchical merging (`convertmc merge`)."""
+
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper import partial
+from pymchelper.averaging import WeightedStatsAggregator
+from pymchelper.estimator import ErrorEstimate
+from pymchelper.input_output import fromfile, fromfilelist, mergetodir
+from tests.conftest import assert_same_estimators
+
+# estimator attributes restored from partial aggregates, compared in addition to the data
+_partial_attributes = ('file_counter', 'file_corename')
+
+output_types = [
+    "normalisation-1_aggregation-none",
+    "normalisation-2_aggregation-sum",
+    "normalisation-3_aggregation-mean",
+    "normalisation-4_aggregation-concat",
+    "normalisation-5_aggregation-mean",
+]
+
+
+@pytest.mark.smoke
+def test_save_load(tmp_path: Path, averaging_files):
+    """State of the aggregators and page metadata are restored from the partial aggregate file."""
+    file_list = averaging_files("normalisation-5_aggregation-mean_*.bdo")
+    mergetodir(file_list, str(tmp_path))
+    path = partial.aggregate_path(str(tmp_path), "normalisation-5_aggregation-mean")
+    assert partial.is_partial_aggregate(path)
+    assert partial.corename(path) == "normalisation-5_aggregation-mean"
+
+    estimator, page_aggregators = partial.load(path)
+    assert estimator.file_counter == len(file_list)
+    assert all(page.data_raw.size == 0 for page in estimator.pages)
+    expected = WeightedStatsAggregator()
+    for filename in file_list:
+        part = fromfilelist(filename)
+        expected.update(part.pages[0].data_raw, weight=part.number_of_primaries)
+    aggregator = page_aggregators[0]
+    assert isinstance(aggregator, WeightedStatsAggregator) and aggregator.updated
+    assert aggregator.total_weight == expected.total_weight
+    assert aggregator._total_weight_squared == expected._total_weight_squared
+    np.testing.assert_array_equal(aggregator.data, expected.data)
+    np.testing.assert_array_equal(aggregator._accumulator_S, expected._accumulator_S)
+
+
+@pytest.mark.parametrize("path", [
+    Path("diff_scoring") / "fluence_2d_log.bdo",
+    Path("averaging") / "normalisation-4_aggregation-concat_0001.bdo",
+    None,  # FLUKA file
+])
+def test_metadata(tmp_path: Path, main_dir: Path, fluka_usrbin_path: Path, path: Path):
+    """Metadata is saved as JSON, without pickled objects, and rebuilt as read from the output."""
+    path = main_dir / "res" / "shieldhit" / path if path else fluka_usrbin_path
+    assert mergetodir([str(path)], str(tmp_path)) == 0
+    aggregate_path, = tmp_path.glob("*.agg.npz")
+    with np.load(aggregate_path, allow_pickle=False) as archive:
+        assert all(archive[name].dtype != object for name in archive.files)
+
+    estimator, _ = partial.load(str(aggregate_path))
+    expected = fromfile(str(path))
+    for name, value in vars(expected).items():
+        if name not in ('pages', 'file_corename'):
+            np.testing.assert_equal(getattr(estimator, name), value, err_msg=name)
+    assert len(estimator.pages) == len(expected.pages)
+    for page, expected_page in zip(estimator.pages, expected.pages):
+        assert page.estimator is estimator
+        assert type(page.dettyp) is type(expected_page.dettyp)
+        assert type(page.diff_axis1.binning) is type(expected_page.diff_axis1.binning)
+        for name, value in vars(expected_page).items():
+            if name not in ('estimator', '_data_raw', '_data_loader', 'error_raw'):
+                np.testing.assert_equal(getattr(page, name), value, err_msg=name)
+
+
+@pytest.mark.parametrize("output_type", output_types)
+@pytest.mark.parametrize("error", [ErrorEstimate.stddev, ErrorEstimate.stderr])
+def test_hierarchical_merge(tmp_path: Path, averaging_files, output_type: str, error: ErrorEstimate):
+    """Partial aggregates of parts of the outputs, merged in a tree, give the result of all outputs read at once."""
+    file_list = averaging_files(f"{output_type}_*.bdo")
+    for node_no, start in enumerate(range(0, len(file_list), 2)):
+        assert mergetodir(file_list[start:start + 2], str(tmp_path / f"node_{node_no}")) == 0
+    # second level of the tree, both into the same target
+    assert mergetodir(sorted(str(path) for path in tmp_path.glob("node_[01]/*.agg.npz")), str(tmp_path / "final")) == 0
+    assert mergetodir(sorted(str(path) for path in tmp_path.glob("node_[23]/*.agg.npz")), str(tmp_path / "final")) == 0
+
+    merged = fromfilelist([str(tmp_path / "final" / f"{output_type}.agg.npz")], error=error)
+    assert_same_estimators(merged, fromfilelist(file_list, error=error), _partial_attributes, rtol=1e-12,
+                           error_rtol=1e-9)
+
+    # partial aggregates mixed with outputs
+    mixed = fromfilelist([str(tmp_path / "node_0" / f"{output_type}.agg.npz")] + file_list[2:], error=error)
+    assert_same_estimators(mixed, fromfilelist(file_list, error=error), _partial_attributes, rtol=1e-12,
+                           error_rtol=1e-9)
+
+
+def test_target_not_merged_again(tmp_path: Path, averaging_files):
+    """Target partial aggregate matching the input pattern is not merged into itself."""
+    file_list = averaging_files("normalisation-3_aggregation-mean_*.bdo")
+    mergetodir(file_list, str(tmp_path))
+    path = partial.aggregate_path(str(tmp_path), "normalisation-3_aggregation-mean")
+    assert mergetodir([path], str(tmp_path)) == 0
+    assert partial.load(path)[0].file_counter == len(file_list)
+
+
+def _merge_in_process(args):
+    filename, outputdir = args
+    return mergetodir([filename], outputdir)
+
+
+def test_concurrent_merges(tmp_path: Path, averaging_files):
+    """Processes merging into the same target at once don't lose any of the contributions."""
+    file_list = averaging_files("normalisation-5_aggregation-mean_*.bdo")
+    with multiprocessing.get_context('spawn').Pool(4) as pool:
+        statuses = pool.map(_merge_in_process, [(filename, str(tmp_path)) for filename in file_list])
+    assert statuses == [0] * len(file_list)
+    merged = fromfilelist([partial.aggregate_path(str(tmp_path), "normalisation-5_aggregation-mean")])
+    expected = fromfilelist(file_list)
+    assert merged.file_counter == len(file_list)
+    assert merged.number_of_primaries == expected.number_of_primaries
+    # merged in the order of arrival
+    np.testing.assert_allclose(merged.pages[0].data_raw, expected.pages[0].data_raw, rtol=1e-12)
+    np.testing.assert_allclose(merged.pages[0].error_raw, expected.pages[0].error_raw, rtol=1e-9)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_convertmc_merge(tmp_path: Path, averaging_dir: Path):
+    """`convertmc merge` on the nodes, then centrally, and conversion of the result."""
+    from pymchelper.run import main
+    for node_no, pattern in enumerate(("*_000[1-3].bdo", "*_001?.bdo")):
+        assert main(['merge', str(averaging_dir / pattern), str(tmp_path / f"node_{node_no}")]) == 0
+    assert main(['merge', str(tmp_path / "node_*" / "*.agg.npz"), str(tmp_path / "final")]) == 0
+    assert len(list((tmp_path / "final").glob("*.agg.npz"))) == len(output_types)
+
+    assert main(['txt', '--many', str(tmp_path / "final" / "*.agg.npz"), str(tmp_path / "txt")]) == 0
+    assert main(['txt', '--many', str(averaging_dir / "*.bdo"), str(tmp_path / "txt_expected")]) == 0
+    for expected_path in (tmp_path / "txt_expected").iterdir():
+        path = tmp_path / "txt" / expected_path.name
+        assert path.exists()
+        np.testing.assert_allclose(np.loadtxt(path), np.loadtxt(expected_path), rtol=1e-5)
@@ -0,0 +1,89 @@
+"""Tests for reading large data blocks in parallel chunks."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile
+from pymchelper.readers import compressed
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Data blocks of the small test files are split into chunks of 16 bytes, list of chunked reads is returned."""
+    monkeypatch.setattr(compressed, "parallel_chunk_min_size", 16)
+    reads = []
+    pread_array = compressed.pread_array
+
+    def counting_pread_array(fd, dtype, count, offset, read_chunks):
+        reads.append((count, offset))
+        return pread_array(fd, dtype, count, offset, read_chunks)
+
+    monkeypatch.setattr(compressed, "pread_array", counting_pread_array)
+    return reads
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("read_chunks", [1, 2, 3, 7, 100])
+def test_pread_array(tmp_path: Path, small_chunks, read_chunks: int):
+    """Data read in chunks is the same as read at once, short reads end the array, file position is kept."""
+    values = np.arange(1001, dtype='<f8')
+    path = tmp_path / "values.dat"
+    path.write_bytes(values.tobytes())
+
+    with open(path, 'rb') as f:
+        np.testing.assert_array_equal(compressed.pread_array(f.fileno(), '<f8', 990, 8, read_chunks), values[1:991])
+        np.testing.assert_array_equal(compressed.pread_array(f.fileno(), '<f8', 2000, 16, read_chunks), values[2:])
+        assert f.tell() == 0
+
+        small_chunks.clear()
+        f.seek(80)
+        head = compressed.read_array(f, '<f8', 500, read_chunks=read_chunks)
+        assert f.tell() == 80 + head.nbytes
+        tail = compressed.read_array(f, '<f8', 1000, read_chunks=read_chunks)
+    np.testing.assert_array_equal(head, values[10:510])
+    np.testing.assert_array_equal(tail, values[510:])
+    assert head.flags.writeable
+
+    np.testing.assert_array_equal(compressed.read_array_at(str(path), '<f8', 100, 800, read_chunks=read_chunks),
+                                  values[100:200])
+    # streams are read in chunks only with more than one chunk requested
+    assert bool(small_chunks) == (read_chunks > 1)
+
+
+@pytest.mark.parametrize("path", [
+    shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo",
+    shieldhit_dir / "v1.0.0" / "ex_yzmsh.bdo",
+    shieldhit_dir / "single" / "ex_yzmsh.bdo",
+    shieldhit_dir / "single" / "ex_cyl.bdo",
+])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_shieldhit_files(small_chunks, path: Path, lazy: bool):
+    """BDO2019 and Bin2010 data blocks read in chunks are the same as read at once."""
+    regular = fromfile(str(path))
+    chunked = fromfile(str(path), lazy=lazy, read_chunks=4)
+    for page, regular_page in zip(chunked.pages, regular.pages):
+        np.testing.assert_array_equal(page.data_raw, regular_page.data_raw)
+    assert small_chunks
+
+
+def test_fluka_usrbin_file(small_chunks, fluka_usrbin_path: Path):
+    """USRBIN data records read in chunks are the same as read and unpacked by the Flair reader."""
+    regular = fromfile(str(fluka_usrbin_path))
+    for lazy in (False, True):
+        chunked = fromfile(str(fluka_usrbin_path), lazy=lazy, read_chunks=4)
+        for page, regular_page in zip(chunked.pages, regular.pages):
+            assert page.data_raw.dtype == regular_page.data_raw.dtype
+            np.testing.assert_array_equal(page.data_raw, regular_page.data_raw)
+    assert small_chunks
+
+
+def test_convertmc_read_chunks(small_chunks, tmp_path: Path):
+    """`convertmc --read-chunks` reads the data blocks in chunks."""
+    from pymchelper.run import main
+    path = shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo"
+    assert main(['txt', '--read-chunks', '4', str(path), str(tmp_path / "dose")]) == 0
+    assert small_chunks
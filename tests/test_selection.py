@@ -0,0 +1,80 @@
+"""Tests for read-time page and sub-mesh selection of SHIELD-HIT12A files."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers.shieldhit.selection import PageSelection
+from pymchelper.shieldhit.detector.detector_type import SHDetType
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+dose_fluence_path = shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo"
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("selection", [
+    PageSelection(dettyp={SHDetType.fluence}),
+    PageSelection(name={"FLUENCE"}),
+    PageSelection(index={1}),
+    PageSelection(predicate=lambda page: page.dettyp != SHDetType.dose),
+])
+def test_page_selection(selection: PageSelection):
+    """Only the second (fluence) page should be read, with the same data as when reading the whole file."""
+    regular = fromfile(str(dose_fluence_path))
+    selected = fromfile(str(dose_fluence_path), selection=selection)
+
+    assert len(selected.pages) == 1
+    assert selected.pages[0].dettyp == SHDetType.fluence
+    assert selected.pages[0].unit == regular.pages[1].unit
+    np.testing.assert_array_equal(selected.pages[0].data_raw, regular.pages[1].data_raw)
+
+
+@pytest.mark.smoke
+def test_page_selection_without_matching_pages():
+    """Estimator is read without pages, if none of them matches the selection."""
+    selected = fromfile(str(shieldhit_dir / "diff_scoring" / "fluence_2d_log.bdo"),
+                        lazy=True,
+                        selection=PageSelection(dettyp={SHDetType.dose}))
+    assert selected.pages == ()
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("path, box", [
+    (shieldhit_dir / "diff_scoring" / "fluence_2d_log.bdo", (slice(None), slice(None), slice(None), slice(2, 7))),
+    (shieldhit_dir / "diff_scoring" / "fluence_2d_lin.bdo",
+     (slice(None), slice(None), slice(None), slice(0, 3), slice(4, 5))),
+    (shieldhit_dir / "generated" / "many" / "cyl" / "aen_xyz_p0001.bdo", (slice(1, 4), slice(5, None), slice(0, 1))),
+])
+def test_box_selection(path: Path, box: tuple):
+    """Data and axes of a box selection should be the same as sliced from the full estimator."""
+    regular = fromfile(str(path))
+    selected = fromfile(str(path), selection=PageSelection(box=box))
+
+    full_box = box + (slice(None), ) * (5 - len(box))
+    for regular_page, selected_page in zip(regular.pages, selected.pages):
+        np.testing.assert_allclose(selected_page.data, regular_page.data[full_box])
+        for axis_id, axis_slice in enumerate(full_box):
+            np.testing.assert_allclose(selected_page.axis(axis_id).data, regular_page.axis(axis_id).data[axis_slice])
+
+
+def test_box_selection_with_aggregation():
+    """Aggregated box should be the same as the box of aggregated data."""
+    file_list = sorted(str(path) for path in (shieldhit_dir / "generated" / "many" / "cyl").glob("aen_xyz_p000?.bdo"))
+    box = (slice(2, 5), slice(None), slice(7, 8))
+
+    regular = fromfilelist(file_list)
+    selected = fromfilelist(file_list, selection=PageSelection(box=box))
+
+    np.testing.assert_allclose(selected.pages[0].data, regular.pages[0].data[box])
+    np.testing.assert_allclose(selected.pages[0].error, regular.pages[0].error[box])
+
+
+@pytest.mark.smoke
+def test_invalid_box_selection():
+    """Strided and empty boxes are rejected."""
+    with pytest.raises(ValueError):
+        PageSelection(box=(slice(0, 10, 2), ))
+    with pytest.raises(ValueError):
+        fromfile(str(dose_fluence_path), selection=PageSelection(box=(slice(1, None), )))
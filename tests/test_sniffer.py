@@ -0,0 +1,104 @@
+"""Tests for recognition of the input file type (see `pymchelper.readers.sniffer`)."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from pymchelper.input_output import fromfile, guess_reader
+from pymchelper.readers import compressed, sniffer
+from pymchelper.readers.fluka import FlukaReader, FlukaReaderFactory
+from pymchelper.readers.shieldhit import general
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.general import SHFileFormatId, file_has_sh_magic_number, read_token
+from pymchelper.readers.shieldhit.reader_bdo2016 import SHReaderBDO2016
+from pymchelper.readers.shieldhit.reader_bdo2019 import SHReaderBDO2019
+from pymchelper.readers.shieldhit.reader_bin2010 import SHReaderBin2010
+from pymchelper.readers.topas import TopasReader
+
+res_dir = Path("tests") / "res"
+bdo2019_path = res_dir / "shieldhit" / "averaging" / "normalisation-5_aggregation-mean_0001.bdo"
+
+
+def _legacy_reader(path):
+    """Reader class chosen by parsing FLUKA header with `Usrxxx` and scanning BDO tokens, as done before sniffing."""
+    if FlukaReaderFactory(str(path)).get_reader():
+        return FlukaReader
+    if file_has_sh_magic_number(str(path)):
+        file_format = read_token(str(path), SHBDOTagID.format)
+        return SHReaderBDO2019 if file_format == SHFileFormatId.bdo2019 else SHReaderBDO2016
+    return SHReaderBin2010
+
+
+@pytest.fixture
+def count_opens(monkeypatch):
+    """List of sources opened by `read_head` and `read_token`."""
+    opened = []
+    open_input = compressed.open_input
+
+    def counting_open_input(source):
+        opened.append(source)
+        return open_input(source)
+
+    monkeypatch.setattr(compressed, "open_input", counting_open_input)
+    monkeypatch.setattr("pymchelper.readers.shieldhit.reader_base.open_input", counting_open_input)
+    sniffer.clear_cache()
+    yield opened
+    sniffer.clear_cache()
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("path", [
+    bdo2019_path,
+    res_dir / "shieldhit" / "single" / "ex_yzmsh.bdo",
+    res_dir / "shieldhit" / "single" / "ex_cyl.bdo",
+    res_dir / "shieldhit" / "diff_scoring" / "fluence_2d_log.bdo",
+    res_dir / "shieldhit" / "averaging" / "beam.dat",
+])
+def test_sniffed_reader_equals_legacy(path: Path):
+    """Sniffing gives the same reader as the full parsing of the headers."""
+    sniffer.clear_cache()
+    assert sniffer.sniff_reader(str(path)) is _legacy_reader(path)
+
+
+def test_sniff_fluka_and_topas(fluka_usrbin_path: Path):
+    """FLUKA files are recognized by the USRxxx header, TOPAS files by the extension."""
+    assert sniffer.sniff_reader(str(fluka_usrbin_path)) is _legacy_reader(fluka_usrbin_path) is FlukaReader
+    topas_path = res_dir / "topas" / "minimal" / "fluence_bp_protons_xy.csv"
+    assert isinstance(guess_reader(str(topas_path)), TopasReader)
+    assert len(fromfile(str(topas_path)).pages) == 1
+
+
+@pytest.mark.smoke
+def test_single_open_and_cache(count_opens, tmp_path: Path):
+    """File is opened once to recognize its type, further calls are served from the cache until the file changes."""
+    path = tmp_path / bdo2019_path.name
+    path.write_bytes(bdo2019_path.read_bytes())
+
+    assert sniffer.sniff_reader(str(path)) is SHReaderBDO2019
+    assert count_opens == [str(path)]
+    assert sniffer.sniff_reader(str(path)) is SHReaderBDO2019
+    assert len(count_opens) == 1
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert sniffer.sniff_reader(str(path)) is SHReaderBDO2019
+    assert len(count_opens) == 2
+
+
+def test_format_token_after_head(count_opens, monkeypatch):
+    """If the format token is not found in the first bytes, the token stream is scanned."""
+    monkeypatch.setattr(general, "head_size", 64)
+    head = bdo2019_path.read_bytes()[:64]
+
+    assert general.reader_from_head(str(bdo2019_path), head) is SHReaderBDO2019
+    assert count_opens == [str(bdo2019_path)]
+
+
+def test_unsupported_format(monkeypatch, caplog):
+    """BDO file with an unknown format token is not recognized, a warning naming the file and format is logged."""
+    monkeypatch.setattr(general, "_format_token_in_head", lambda head: 7)
+    head = bdo2019_path.read_bytes()[:general.head_size]
+
+    assert general.reader_from_head(str(bdo2019_path), head) is None
+    assert "Unsupported format 7" in caplog.text and str(bdo2019_path) in caplog.text
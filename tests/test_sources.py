@@ -0,0 +1,112 @@
+"""Tests for reading from file-like objects and in-memory buffers."""
+
+import gzip
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers.shieldhit.reader_base import iter_bdo_tokens
+from pymchelper.readers.sources import input_source, open_source
+from tests.conftest import assert_same_estimators
+
+shieldhit_dir = Path("tests") / "res" / "shieldhit"
+
+
+class _Pipe(io.RawIOBase):
+    """Non-seekable binary stream, as stdin or a socket."""
+
+    def __init__(self, data: bytes) -> None:
+        super().__init__()
+        self._stream = io.BytesIO(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        return self._stream.readinto(b)
+
+
+_as_source = {
+    'bytes': lambda data: data,
+    'bytearray': bytearray,
+    'memoryview': memoryview,
+    'BytesIO': io.BytesIO,
+    'pipe': lambda data: io.BufferedReader(_Pipe(data)),
+    'gzip bytes': gzip.compress,
+}
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("source_type", list(_as_source))
+@pytest.mark.parametrize("path", [
+    shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo",
+    shieldhit_dir / "single" / "ex_yzmsh.bdo",
+])
+def test_read_shieldhit_source(path: Path, source_type: str):
+    """SHIELD-HIT12A data from buffers and file-like objects is the same as read from the file."""
+    regular = fromfile(str(path))
+    data = path.read_bytes()
+
+    assert_same_estimators(fromfile(_as_source[source_type](data)), regular)
+    assert_same_estimators(fromfile(_as_source[source_type](data), lazy=True, mmap=True, index_file=True), regular)
+
+
+@pytest.mark.parametrize("source_type", list(_as_source))
+def test_read_fluka_source(fluka_usrbin_path: Path, source_type: str):
+    """FLUKA data from buffers and file-like objects is the same as read from the file."""
+    regular = fromfile(str(fluka_usrbin_path))
+    assert_same_estimators(fromfile(_as_source[source_type](fluka_usrbin_path.read_bytes())), regular)
+
+
+def test_open_file_object():
+    """Already open file is read without reopening it, its position is not used by the readers."""
+    path = shieldhit_dir / "averaging" / "normalisation-4_aggregation-concat_0001.bdo"
+    with open(path, 'rb') as f:
+        f.seek(100)
+        estimator = fromfile(f, lazy=True)
+        assert estimator.file_corename == ''
+        assert_same_estimators(estimator, fromfile(str(path)))
+
+
+def test_aggregation_of_buffers():
+    """Buffers are aggregated as the files they were read from."""
+    file_list = sorted((shieldhit_dir / "averaging").glob("normalisation-3_aggregation-mean_000?.bdo"))
+    regular = fromfilelist([str(path) for path in file_list])
+    aggregated = fromfilelist([path.read_bytes() for path in file_list], workers=2)
+
+    for regular_page, page in zip(regular.pages, aggregated.pages):
+        np.testing.assert_allclose(page.data_raw, regular_page.data_raw)
+        np.testing.assert_allclose(page.error_raw, regular_page.error_raw)
+
+
+@pytest.mark.smoke
+def test_buffer_token_walk():
+    """Token walk over a buffer gives the same tokens as over the file."""
+    path = shieldhit_dir / "averaging" / "normalisation-5_aggregation-mean_0001.bdo"
+    regular = list(iter_bdo_tokens(str(path), decode=False))
+    tokens = list(iter_bdo_tokens(memoryview(path.read_bytes()), decode=False))
+
+    assert [token[:3] for token in tokens] == [token[:3] for token in regular]
+    for token, regular_token in zip(tokens, regular):
+        np.testing.assert_array_equal(token.payload, regular_token.payload)
+
+
+@pytest.mark.smoke
+def test_source_streams():
+    """Streams opened over the same source have independent positions, non-seekable sources are read once."""
+    source = io.BytesIO(b'0123456789')
+    with open_source(source) as first, open_source(source) as second:
+        assert first.read(4) == b'0123'
+        second.seek(-3, io.SEEK_END)
+        assert second.read() == b'789'
+        assert first.read(2) == b'45'
+    assert not source.closed
+
+    pipe = io.BufferedReader(_Pipe(b'0123456789'))
+    pipe.read(2)
+    assert input_source(pipe) == b'23456789'
+    with pytest.raises(io.UnsupportedOperation):
+        open_source(io.BufferedReader(_Pipe(b'')))
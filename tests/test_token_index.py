@@ -0,0 +1,103 @@
+"""Tests for the persistent token index (.idx sidecar) of BDO files."""
+
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pymchelper import run
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers.shieldhit.token_index import build_token_index, index_path, load_token_index, \
+    save_token_index, token_index
+
+
+@pytest.fixture
+def bdo_copy(tmp_path: Path, averaging_dir: Path) -> str:
+    """Copy of a multi-page BDO file in a temporary directory, so that the index sidecar can be written next to it."""
+    path = tmp_path / "normalisation-5_aggregation-mean_0001.bdo"
+    shutil.copy(averaging_dir / path.name, path)
+    return str(path)
+
+
+@pytest.mark.smoke
+@pytest.mark.parametrize("name", [
+    "normalisation-1_aggregation-none_0001.bdo",
+    "normalisation-4_aggregation-concat_0001.bdo",
+    "normalisation-5_aggregation-mean_0001.bdo",
+])
+def test_indexed_read_equals_regular_read(tmp_path: Path, averaging_dir: Path, name: str):
+    """Estimator read using the index (both when creating and when reusing it) should be the same as without it."""
+    path = str(tmp_path / name)
+    shutil.copy(averaging_dir / name, path)
+    regular = fromfile(path)
+
+    for _ in range(2):
+        indexed = fromfile(path, index_file=True)
+        assert os.path.exists(index_path(path))
+        assert indexed.number_of_primaries == regular.number_of_primaries
+        assert len(indexed.pages) == len(regular.pages)
+        for regular_page, indexed_page in zip(regular.pages, indexed.pages):
+            assert indexed_page.name == regular_page.name
+            assert indexed_page.unit == regular_page.unit
+            np.testing.assert_array_equal(indexed_page.data_raw, regular_page.data_raw)
+
+
+@pytest.mark.smoke
+def test_index_is_reused(bdo_copy: str, monkeypatch):
+    """Valid sidecar is loaded, token stream is not scanned again."""
+    index = token_index(bdo_copy)
+
+    def fail(filename):
+        raise AssertionError("token stream should not be scanned")
+
+    monkeypatch.setattr("pymchelper.readers.shieldhit.token_index.build_token_index", fail)
+    np.testing.assert_array_equal(token_index(bdo_copy), index)
+
+
+@pytest.mark.smoke
+def test_outdated_index_is_rebuilt(bdo_copy: str):
+    """Sidecar written for another version of the file (different size or mtime) is ignored and rebuilt."""
+    save_token_index(bdo_copy, build_token_index(bdo_copy)[:3])
+    stat = os.stat(bdo_copy)
+    os.utime(bdo_copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert load_token_index(bdo_copy) is None
+    assert token_index(bdo_copy).size == build_token_index(bdo_copy).size
+    assert load_token_index(bdo_copy) is not None
+
+
+@pytest.mark.smoke
+def test_invalid_index_is_ignored(bdo_copy: str):
+    """Garbage or truncated sidecars are not used."""
+    with open(index_path(bdo_copy), "wb") as f:
+        f.write(b"not an index")
+    assert load_token_index(bdo_copy) is None
+
+    save_token_index(bdo_copy, build_token_index(bdo_copy))
+    with open(index_path(bdo_copy), "r+b") as f:
+        f.truncate(os.path.getsize(index_path(bdo_copy)) - 1)
+    assert load_token_index(bdo_copy) is None
+
+
+def test_index_option_in_convertmc(tmp_path: Path, averaging_files):
+    """convertmc --index creates sidecars and gives the same output as without it."""
+    file_list = [Path(path) for path in averaging_files("normalisation-5_aggregation-mean_000?.bdo")]
+    for path in file_list:
+        shutil.copy(path, tmp_path / path.name)
+    pattern = str(tmp_path / "normalisation-5_aggregation-mean_000?.bdo")
+
+    run.main(['txt', '--many', '--index', pattern, str(tmp_path / "indexed")])
+    run.main(['txt', '--many', pattern, str(tmp_path / "regular")])
+
+    assert all(os.path.exists(index_path(str(tmp_path / path.name))) for path in file_list)
+    regular_files = sorted(path.name for path in (tmp_path / "regular").iterdir())
+    assert regular_files == sorted(path.name for path in (tmp_path / "indexed").iterdir())
+    for name in regular_files:
+        assert (tmp_path / "regular" / name).read_text() == (tmp_path / "indexed" / name).read_text()
+
+    regular = fromfilelist([str(tmp_path / path.name) for path in file_list])
+    indexed = fromfilelist([str(tmp_path / path.name) for path in file_list], index_file=True)
+    for regular_page, indexed_page in zip(regular.pages, indexed.pages):
+        np.testing.assert_allclose(indexed_page.data_raw, regular_page.data_raw)
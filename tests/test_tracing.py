@@ -0,0 +1,108 @@
+"""Tests for tracing hooks of the readers and counters collected with them."""
+
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+from pymchelper.input_output import fromfile, fromfilelist
+from pymchelper.readers import tracing
+from pymchelper.readers.shieldhit.binary_spec import SHBDOTagID
+from pymchelper.readers.shieldhit.reader_base import iter_bdo_tokens, log_token, payload_nbytes
+
+file_pattern = "normalisation-5_aggregation-mean_000?.bdo"
+
+
+@pytest.mark.smoke
+def test_counters(averaging_files):
+    """All tokens and payload bytes read are counted, per tag and per file."""
+    file_list = averaging_files(file_pattern)
+    with tracing.collect() as counters:
+        fromfilelist(file_list, workers=2)
+    assert not tracing.active
+
+    report = counters.report()
+    tokens = [token for path in file_list for token in iter_bdo_tokens(path, decode=False)]
+    assert report['tokens'] == len(tokens)
+    assert report['nbytes'] == sum(payload_nbytes(token.dtype, token.length) for token in tokens)
+    assert report['tags']['data_block']['tokens'] == sum(token.tag_id == SHBDOTagID.data_block for token in tokens)
+    assert sorted(report['files']) == file_list
+    for path in file_list:
+        file_report = report['files'][path]
+        assert file_report['tokens'] == sum(1 for _ in iter_bdo_tokens(path, decode=False))
+        assert file_report['seconds'] > 0
+    assert report['seconds'] == pytest.approx(sum(file['seconds'] for file in report['files'].values()))
+
+
+def test_not_read_payloads():
+    """Memory-mapped and skipped (lazy) data blocks are counted as tokens, but not as bytes read."""
+    path = str(Path("tests") / "res" / "shieldhit" / "v1.0.0" / "ex_yzmsh.bdo")
+    for options in ({'mmap': True}, {'lazy': True}):
+        with tracing.collect() as counters:
+            fromfile(path, **options)
+        data_blocks = counters.report()['tags']['data_block']
+        assert data_blocks['tokens'] > 0 and data_blocks['nbytes'] == 0
+
+
+def test_layout_reads(averaging_files):
+    """Files read using the layout of the first file are counted as files."""
+    file_list = averaging_files(file_pattern)
+    with tracing.collect() as counters:
+        fromfilelist(file_list, reuse_layout=True)
+    report = counters.report()
+    assert sorted(report['files']) == file_list
+    assert all(report['files'][path]['nbytes'] == Path(path).stat().st_size for path in file_list[1:])
+
+
+def test_hooks(averaging_files):
+    """Hooks get the events, nothing is reported after they are removed."""
+    path = averaging_files(file_pattern)[0]
+    events = []
+    tracing.add_hook(events.append)
+    try:
+        fromfile(path)
+    finally:
+        tracing.remove_hook(events.append)
+    assert {event.kind for event in events} == {'token', 'file'}
+    assert events[-1].kind == 'file'
+
+    count = len(events)
+    fromfile(path)
+    assert len(events) == count and not tracing.active
+
+
+def test_log_token(caplog: pytest.LogCaptureFixture):
+    """Payload is converted to string only when the message is emitted."""
+
+    class Payload:
+        converted = 0
+
+        def __str__(self):
+            Payload.converted += 1
+            return 'payload'
+
+    log = logging.getLogger('pymchelper.readers.shieldhit.test')
+    with caplog.at_level(logging.WARNING, logger=log.name):
+        log_token(log, SHBDOTagID.rt_nstat, b'<i8', 1, Payload())
+        log_token(log, 0x1234, b'<i8', 1, Payload())
+    assert Payload.converted == 0
+
+    with caplog.at_level(logging.DEBUG, logger=log.name):
+        log_token(log, SHBDOTagID.rt_nstat, b'<i8', 1, Payload())
+        log_token(log, 0x1234, b'<i8', 1, Payload())
+    assert Payload.converted > 0
+    assert "Read token rt_nstat (0xaa00) value payload type <i8 length 1" in caplog.text
+    assert "Found unknown token (0x1234)" in caplog.text
+
+
+def test_convertmc_trace(tmp_path: Path, averaging_dir: Path, averaging_files):
+    """`convertmc --trace` saves the counters as JSON."""
+    from pymchelper.run import main
+    trace_path = tmp_path / "trace.json"
+    pattern = str(averaging_dir / file_pattern)
+    assert main(['inspect', '--many', '--trace', str(trace_path), pattern]) == 0
+    report = json.loads(trace_path.read_text())
+    file_list = averaging_files(file_pattern)
+    assert sorted(report['files']) == file_list
+    assert report['tags']['rt_nstat']['tokens'] == len(file_list)
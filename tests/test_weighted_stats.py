@@ -1,7 +1,8 @@
 import pytest
 import numpy as np
 from numpy.typing import NDArray
-from pymchelper.averaging import WeightedStatsAggregator
+from pymchelper import averaging
+from pymchelper.averaging import ConcatenatingAggregator, NoAggregator, SumAggregator, WeightedStatsAggregator
 
 
 def test_initial_state() -> None:
@@ -133,3 +134,178 @@ def test_variance_with_1d_array() -> None:
 
     expected_variance_sample = compute_expected_variance(values, weights, total_weight, is_sample=True)
     assert pytest.approx(ws.variance_sample, 0.001) == expected_variance_sample
+
+
+def test_variance_with_array_values() -> None:
+    """Each bin of array-valued updates should get the same variance as an independent scalar aggregator."""
+    ws = WeightedStatsAggregator()
+    values = np.array([[10., 1.], [20., 2.], [30., 4.]])
+    weights = np.array([2, 3, 5])
+
+    for value, weight in zip(values, weights):
+        ws.update(value, weight)
+
+    for bin_no in range(values.shape[1]):
+        expected_variance = compute_expected_variance(values[:, bin_no], weights, weights.sum(), is_sample=True)
+        assert pytest.approx(ws.variance_sample[bin_no], 0.001) == expected_variance
+
+
+@pytest.mark.parametrize("split", [0, 1, 4, 7])
+def test_merge(split: int) -> None:
+    """Merged partial aggregations should give the same statistics as a single aggregation of all values."""
+    rng = np.random.default_rng(42)
+    values = rng.random((7, 3))
+    weights = rng.integers(1, 100, size=7).astype(float)
+
+    whole, first, second = WeightedStatsAggregator(), WeightedStatsAggregator(), WeightedStatsAggregator()
+    for index, (value, weight) in enumerate(zip(values, weights)):
+        whole.update(value, weight)
+        (first if index < split else second).update(value, weight)
+    merged = first.merge(second)
+
+    assert merged is first
+    assert merged.total_weight == whole.total_weight
+    np.testing.assert_allclose(merged.mean, whole.mean, rtol=1e-12)
+    np.testing.assert_allclose(merged.variance_sample, whole.variance_sample, rtol=1e-12)
+    np.testing.assert_allclose(merged.stderr, whole.stderr, rtol=1e-12)
+    if split in (0, 7):  # merge with not updated aggregator changes nothing
+        np.testing.assert_array_equal(merged.mean, whole.mean)
+
+
+def test_merge_other_aggregators() -> None:
+    """Sum is added, concatenated data is appended, data of the first updated aggregator is kept."""
+    first, second = SumAggregator(), SumAggregator()
+    first.update(np.array([1., 2.]))
+    second.update(np.array([3., 4.]))
+    np.testing.assert_array_equal(first.merge(second).data, [4., 6.])
+
+    first, second = ConcatenatingAggregator(), ConcatenatingAggregator()
+    first.update(np.array([1., 2.]))
+    second.update(np.array([3.]))
+    np.testing.assert_array_equal(first.merge(second).data, [1., 2., 3.])
+
+    first, second = NoAggregator(), NoAggregator()
+    second.update(np.array([5.]))
+    np.testing.assert_array_equal(first.merge(second).data, [5.])
+    third = NoAggregator()
+    third.update(np.array([6.]))
+    np.testing.assert_array_equal(first.merge(third).data, [5.])
+
+
+def _reference_update(aggregator: WeightedStatsAggregator, value, weight: float) -> None:
+    """Update with full-size temporaries (the plain formulas), to compare the in-place update against."""
+    if not aggregator.updated:
+        aggregator.data = np.asarray(value, dtype=np.float64) * 0
+        aggregator._accumulator_S = np.asarray(value, dtype=np.float64) * 0
+    aggregator.total_weight += weight
+    aggregator._total_weight_squared += weight**2
+    delta_old = value - aggregator.data
+    aggregator.data = aggregator.data + (weight / aggregator.total_weight) * delta_old
+    aggregator._accumulator_S = aggregator._accumulator_S + weight * (value - aggregator.data) * delta_old
+    aggregator._updated = True
+
+
+@pytest.mark.parametrize("shape, block_size", [((1000, ), 64), ((7, 11, 13), 100), ((5, 3), 1024), ((2, ), 1)])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_in_place_update_identical(monkeypatch, shape, block_size: int, dtype) -> None:
+    """In-place blocked update gives bit-identical results as the plain formulas, also for non-finite values."""
+    monkeypatch.setattr(averaging, "_block_size", block_size)
+    rng = np.random.default_rng(7)
+    in_place, reference = WeightedStatsAggregator(), WeightedStatsAggregator()
+    for weight in (1000, 3.5, 1e6, 0.25, 17):
+        value = (rng.standard_normal(shape) * 10.**rng.integers(-5, 5, size=shape)).astype(dtype)
+        value.reshape(-1)[:3] = (np.inf, np.nan, -0.0)[:value.size]
+        with np.errstate(invalid='ignore'):
+            in_place.update(value, weight)
+            _reference_update(reference, value, weight)
+            # non-contiguous (i.e. Fortran ordered) values are updated the same way
+            in_place.update(np.asfortranarray(value), weight)
+            _reference_update(reference, value, weight)
+
+    assert in_place.data.dtype == np.float64 and in_place.data.shape == shape
+    assert in_place.data.tobytes() == reference.data.tobytes()
+    assert in_place._accumulator_S.tobytes() == reference._accumulator_S.tobytes()
+    assert in_place.total_weight == reference.total_weight
+
+
+def test_concatenation_done_once(monkeypatch, tmp_path) -> None:
+    """Data is concatenated once on access, not on each update, spilled aggregators can be pickled."""
+    import pickle
+    calls = []
+    concatenate = np.concatenate
+    monkeypatch.setattr(np, "concatenate", lambda arrays: calls.append(len(arrays)) or concatenate(arrays))
+
+    aggregator = ConcatenatingAggregator()
+    for start in range(0, 100, 10):
+        aggregator.update(np.arange(start, start + 10.))
+    assert not calls
+    np.testing.assert_array_equal(aggregator.data, np.arange(100.))
+    np.testing.assert_array_equal(aggregator.data, np.arange(100.))
+    assert calls == [10]
+
+    spilled = ConcatenatingAggregator(spill_dir=str(tmp_path))
+    assert not spilled.updated
+    spilled.update(np.arange(5.))
+    unpickled = pickle.loads(pickle.dumps(spilled))
+    unpickled.update(np.arange(5., 8.))
+    spilled.merge(unpickled)
+    np.testing.assert_array_equal(spilled.data, np.concatenate([np.arange(5.), np.arange(8.)]))
+
+
+def _hard_sum_values(number_of_values: int, shape: tuple) -> list:
+    """Values of different magnitudes and signs, which plain summation adds with visible rounding errors."""
+    rng = np.random.default_rng(3)
+    return [rng.standard_normal(shape) * 10.**rng.integers(-8, 8, size=shape) for _ in range(number_of_values)]
+
+
+@pytest.mark.parametrize("block_size", [5, averaging._block_size])
+def test_compensated_sum(monkeypatch, block_size: int) -> None:
+    """Compensated sum is the correctly rounded sum, for arrays (updated in blocks) and for scalars."""
+    import math
+    monkeypatch.setattr(averaging, "_block_size", block_size)
+    values = _hard_sum_values(2000, (4, 6))
+    plain, compensated, scalar = SumAggregator(), SumAggregator(compensated=True), SumAggregator(compensated=True)
+    for value in values:
+        plain.update(value)
+        compensated.update(value)
+        scalar.update(float(value[0, 0]))
+
+    exact = np.array([math.fsum(bin_values) for bin_values in np.reshape(values, (len(values), -1)).T])
+    np.testing.assert_array_equal(compensated.data.reshape(-1), exact)
+    assert scalar.data == exact[0]
+    assert not np.array_equal(plain.data.reshape(-1), exact)
+
+    # integer sums are exact anyway
+    integers = SumAggregator(compensated=True)
+    for value in (np.arange(3), np.arange(3)):
+        integers.update(value)
+    np.testing.assert_array_equal(integers.data, [0, 2, 4])
+
+
+@pytest.mark.parametrize("split", [1, 1000, 1999])
+def test_compensated_merge(split: int) -> None:
+    """Merged compensated partial sums and total weights are as accurate as the sum of all values."""
+    import math
+    values = _hard_sum_values(2000, (3, ))
+    weights = [float(weight[0]) ** 2 for weight in _hard_sum_values(2000, (1, ))]
+    first, second = SumAggregator(compensated=True), SumAggregator(compensated=True)
+    first_stats, second_stats = WeightedStatsAggregator(compensated=True), WeightedStatsAggregator(compensated=True)
+    for index, (value, weight) in enumerate(zip(values, weights)):
+        (first if index < split else second).update(value)
+        (first_stats if index < split else second_stats).update(value, weight)
+    first.merge(second)
+    first_stats.merge(second_stats)
+
+    exact = [math.fsum(bin_values) for bin_values in np.transpose(values)]
+    np.testing.assert_array_equal(first.data, exact)
+    assert first_stats.total_weight == math.fsum(weights)
+    assert first_stats._total_weight_squared == math.fsum(weight**2 for weight in weights)
+
+
+def test_integer_weights_not_overflowing() -> None:
+    """Numpy integer weights (i.e. int32 number of primaries) are summed and squared as Python integers."""
+    aggregator = WeightedStatsAggregator()
+    for _ in range(3):
+        aggregator.update(np.ones(2), weight=np.int32(100000))
+    assert aggregator.total_weight == 300000
+    assert aggregator._total_weight_squared == 3 * 10**10